@@ -1,4 +1,5 @@
 import os
+import json
 from pathlib import Path
 from dotenv import load_dotenv
 import environ
@@ -163,19 +164,75 @@ Q_CLUSTER = {
     # 1. Configuração do ORM Broker (usa o banco de dados principal)
     'name': 'DjangORM',
     'workers': 4, # Número de processos worker
-    'timeout': 90, # Timeout para tarefas longas (segundos)
-    'retry': 120, # Tempo para retry (segundos)
+    'timeout': 600, # Timeout para tarefas longas (segundos) - process_email_batch faz várias extrações IA
+    'retry': 660, # Tempo para retry (segundos) - deve ser maior que o timeout
     'queue_limit': 50, # Limite de tarefas na fila
     'bulk': 10, # Número de tarefas puxadas de uma vez
     'log_level': 'INFO',
     'orm': 'default', # Usa a configuração 'default' do DATABASE
+    # Filas isoladas (Q_ISOLATED_QUEUES=True, ver tasks/queues.py): o cluster acima fica com a ingestão
+    # e cada etapa abaixo roda no seu processo: `Q_CLUSTER_NAME=extraction python manage.py qcluster`
+    # (o Django-Q lê Q_CLUSTER_NAME do ambiente ao importar; `--name` não funciona no Linux)
+    'ALT_CLUSTERS': {
+        'extraction': {
+            'workers': int(os.environ.get('Q_EXTRACTION_WORKERS', 4)), # Chamadas à IA (escalar aqui)
+            'timeout': 600,
+            'retry': 660,
+        },
+        'delivery': {
+            'workers': int(os.environ.get('Q_DELIVERY_WORKERS', 2)), # Telegram
+            'timeout': 60,
+            'retry': 120,
+            'max_attempts': 3,
+        },
+    },
 }
+# Separa ingestão, extração e entrega em clusters do Django-Q (exige um qcluster por fila)
+Q_ISOLATED_QUEUES = os.environ.get('Q_ISOLATED_QUEUES', 'False') == 'True'
+
+# Emails por task process_email_batch (1 linha no broker por bloco, não por email)
+PROCESS_EMAIL_BATCH_SIZE = int(os.environ.get('PROCESS_EMAIL_BATCH_SIZE', 10))
+# Claim worker (manage.py process_pending_emails): emails reservados por vez, validade da reserva
+# (deve cobrir o processamento de um bloco) e tentativas antes de marcar FAILED
+EMAIL_CLAIM_BATCH_SIZE = int(os.environ.get('EMAIL_CLAIM_BATCH_SIZE', 10))
+EMAIL_CLAIM_LEASE_SECONDS = int(os.environ.get('EMAIL_CLAIM_LEASE_SECONDS', 900))
+EMAIL_MAX_PROCESSING_ATTEMPTS = int(os.environ.get('EMAIL_MAX_PROCESSING_ATTEMPTS', 5))
+# Filas de prioridade (tasks.priority): marcadores de urgência no assunto/remetente (sem acentos,
+# separados por vírgula), schemas de perfil com prazo e fração de cada reserva que vai para os mais antigos
+EMAIL_URGENT_MARKERS = [m.strip() for m in os.environ.get('EMAIL_URGENT_MARKERS', 'urgente,intimacao,citacao,prazo fatal').split(',') if m.strip()]
+EMAIL_HIGH_PRIORITY_SCHEMAS = [s.strip() for s in os.environ.get('EMAIL_HIGH_PRIORITY_SCHEMAS', 'ProcessoJuridicoSchema').split(',') if s.strip()]
+EMAIL_LANE_FIFO_SHARE = float(os.environ.get('EMAIL_LANE_FIFO_SHARE', 0.2))
 
 # --- Configurações das Integrações (Juliano/Thales) ---
 
 # OPENAI (Juliano)
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
 OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-3.5-turbo')
+# Cache de extrações (extraction/cache.py): mesma entrada + schema + prompt + modelo não chama a OpenAI de novo
+EXTRACTION_CACHE_ENABLED = os.environ.get('EXTRACTION_CACHE_ENABLED', 'True') == 'True'
+EXTRACTION_CACHE_TTL_SECONDS = int(os.environ.get('EXTRACTION_CACHE_TTL_SECONDS', 30 * 24 * 3600))
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.environ.get('EXTRACTION_CACHE_MAX_ENTRIES', 50000))
+# Prompts compilados (template do perfil + schema) mantidos em memória por processo
+PROMPT_COMPILE_CACHE_SIZE = int(os.environ.get('PROMPT_COMPILE_CACHE_SIZE', 256))
+# Motor concorrente (tasks/async_extraction.py): chamadas à OpenAI de um bloco em paralelo, até N por processo
+EXTRACTION_ASYNC = os.environ.get('EXTRACTION_ASYNC', 'False') == 'True'
+EXTRACTION_ASYNC_CONCURRENCY = int(os.environ.get('EXTRACTION_ASYNC_CONCURRENCY', 16))
+# Modo lote (tasks/batch_worker.py, perfis com execution_mode=BATCH): máximo de emails por lote da Batch API
+# e quando enviar (ao juntar MIN emails ou quando o mais antigo esperar MAX_WAIT segundos)
+EXTRACTION_BATCH_MAX_REQUESTS = int(os.environ.get('EXTRACTION_BATCH_MAX_REQUESTS', 1000))
+EXTRACTION_BATCH_MIN_REQUESTS = int(os.environ.get('EXTRACTION_BATCH_MIN_REQUESTS', 100))
+EXTRACTION_BATCH_MAX_WAIT_SECONDS = int(os.environ.get('EXTRACTION_BATCH_MAX_WAIT_SECONDS', 3600))
+# Limite de taxa da OpenAI compartilhado pelo cluster (extraction/rate_limit.py): RPM/TPM padrão da conta,
+# limites por modelo (JSON, ex: {"gpt-4o": {"rpm": 500, "tpm": 30000}}), rajada (segundos de limite),
+# espera máxima por vaga antes de devolver o email à fila, atraso até reprocessá-lo e retentativas de 429/5xx
+OPENAI_RATE_LIMIT_ENABLED = os.environ.get('OPENAI_RATE_LIMIT_ENABLED', 'True') == 'True'
+OPENAI_RPM = int(os.environ.get('OPENAI_RPM', 500))
+OPENAI_TPM = int(os.environ.get('OPENAI_TPM', 200000))
+OPENAI_RATE_LIMITS = json.loads(os.environ.get('OPENAI_RATE_LIMITS', '{}'))
+OPENAI_RATE_LIMIT_BURST_SECONDS = int(os.environ.get('OPENAI_RATE_LIMIT_BURST_SECONDS', 10))
+RATE_LIMIT_MAX_WAIT_SECONDS = int(os.environ.get('RATE_LIMIT_MAX_WAIT_SECONDS', 300))
+RATE_LIMIT_DEFER_SECONDS = int(os.environ.get('RATE_LIMIT_DEFER_SECONDS', 60))
+OPENAI_MAX_TRANSIENT_RETRIES = int(os.environ.get('OPENAI_MAX_TRANSIENT_RETRIES', 5))
 
 # TRELLO (Thales)
 TRELLO_API_KEY = os.environ.get('TRELLO_API_KEY')
@@ -192,6 +249,46 @@ IMAP_HOST = os.environ.get('IMAP_HOST')
 IMAP_PORT = os.environ.get('IMAP_PORT', 993)
 IMAP_USERNAME = os.environ.get('IMAP_USERNAME')
 IMAP_PASSWORD = os.environ.get('IMAP_PASSWORD')
+# Primeira sincronização de uma pasta (ou após reset de UIDVALIDITY): N mais recentes
+IMAP_INITIAL_SYNC_LIMIT = int(os.environ.get('IMAP_INITIAL_SYNC_LIMIT', 50))
+# Fetch em duas fases: limite de bytes da parte de texto e cabeçalhos extras (separados por vírgula)
+IMAP_BODY_MAX_BYTES = int(os.environ.get('IMAP_BODY_MAX_BYTES', 256 * 1024))
+IMAP_EXTRA_HEADER_FIELDS = [h.strip() for h in os.environ.get('IMAP_EXTRA_HEADER_FIELDS', '').split(',') if h.strip()]
+# Lotes de FETCH limitados por quantidade e por bytes (memória de pico previsível por worker)
+IMAP_FETCH_BATCH_SIZE = int(os.environ.get('IMAP_FETCH_BATCH_SIZE', 200))
+IMAP_FETCH_BYTE_BUDGET = int(os.environ.get('IMAP_FETCH_BYTE_BUDGET', 8 * 1024 * 1024))
+# Email bruto: baixa a mensagem inteira (BODY.PEEK[]) e guarda no RawStore (emails.raw_store)
+IMAP_STORE_RAW = os.environ.get('IMAP_STORE_RAW', 'False') == 'True'
+RAW_STORE_BACKEND = os.environ.get('RAW_STORE_BACKEND', 'emails.raw_store.FileSystemRawStore')
+RAW_STORE_ROOT = os.environ.get('RAW_STORE_ROOT', str(BASE_DIR / 'var' / 'raw'))
+RAW_STORE_COMPRESSION = os.environ.get('RAW_STORE_COMPRESSION', 'zlib')  # zlib | zstd | none
+# Normalização do corpo (HTML -> texto): entradas no cache por hash do conteúdo, por processo
+BODY_NORMALIZE_CACHE_SIZE = int(os.environ.get('BODY_NORMALIZE_CACHE_SIZE', 1024))
+# Redução do corpo antes da IA (citações, assinaturas e rodapés aprendidos por domínio do remetente)
+BODY_REDUCTION_ENABLED = os.environ.get('BODY_REDUCTION_ENABLED', 'True') == 'True'
+BODY_FOOTER_SAMPLE_SIZE = int(os.environ.get('BODY_FOOTER_SAMPLE_SIZE', 20))
+BODY_FOOTER_MIN_EMAILS = int(os.environ.get('BODY_FOOTER_MIN_EMAILS', 3))
+# Matcher compilado das Regras de Automação: validade do cache em processos que não recebem os signals
+RULE_MATCHER_CACHE_SECONDS = int(os.environ.get('RULE_MATCHER_CACHE_SECONDS', 60))
+# Listener IDLE (manage.py listen_emails): renovação do IDLE e polling de fallback
+IMAP_IDLE_RENEW_SECONDS = int(os.environ.get('IMAP_IDLE_RENEW_SECONDS', 25 * 60))
+IMAP_IDLE_POLL_FALLBACK_SECONDS = int(os.environ.get('IMAP_IDLE_POLL_FALLBACK_SECONDS', 300))
+# Orquestrador (tasks.orchestrator.fetch_due_mailboxes): um Schedule para todas as caixas
+# em vez de um Schedule por MailBox. Limites global e por host IMAP (ex: "imap.gmail.com=2,outlook.office365.com=2").
+IMAP_FETCH_ORCHESTRATOR = os.environ.get('IMAP_FETCH_ORCHESTRATOR', 'False') == 'True'
+IMAP_FETCH_MAX_WORKERS = int(os.environ.get('IMAP_FETCH_MAX_WORKERS', 16))
+IMAP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get('IMAP_MAX_CONNECTIONS_PER_HOST', 4))
+IMAP_HOST_CONNECTION_LIMITS = {
+    host.strip().lower(): int(limit)
+    for host, _sep, limit in (
+        item.partition('=') for item in os.environ.get('IMAP_HOST_CONNECTION_LIMITS', '').split(',') if '=' in item
+    )
+}
+# Polling adaptativo (tasks.scheduling): limites do intervalo por caixa e teto do backoff após falhas
+IMAP_POLL_MIN_SECONDS = int(os.environ.get('IMAP_POLL_MIN_SECONDS', 60))
+IMAP_POLL_MAX_SECONDS = int(os.environ.get('IMAP_POLL_MAX_SECONDS', 3600))
+IMAP_POLL_DEFAULT_SECONDS = int(os.environ.get('IMAP_POLL_DEFAULT_SECONDS', 300))
+IMAP_ERROR_BACKOFF_MAX_SECONDS = int(os.environ.get('IMAP_ERROR_BACKOFF_MAX_SECONDS', 6 * 3600))
 
 
 
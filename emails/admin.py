@@ -1,18 +1,24 @@
 from django.contrib import admin
-from .models import MailBox, EmailMessage, AutomationRule
+from .models import MailBox, MailBoxSyncState, EmailMessage, AutomationRule
 
 @admin.register(MailBox)
 class MailBoxAdmin(admin.ModelAdmin):
-    list_display = ('name', 'user', 'imap_host', 'username', 'last_fetch_at', 'is_active')
-    list_filter = ('is_active', 'user')
+    list_display = ('name', 'user', 'imap_host', 'username', 'last_fetch_at', 'next_fetch_at', 'poll_interval_seconds', 'consecutive_failures', 'is_active')
+    list_filter = ('is_active', 'imap_prefilter', 'unmatched_policy', 'user')
     search_fields = ('name', 'username', 'imap_host')
 
+@admin.register(MailBoxSyncState)
+class MailBoxSyncStateAdmin(admin.ModelAdmin):
+    list_display = ('mailbox', 'folder', 'uid_validity', 'last_uid', 'highest_modseq', 'last_synced_at')
+    list_filter = ('mailbox',)
+    readonly_fields = ('last_synced_at',)
+
 @admin.register(EmailMessage)
 class EmailMessageAdmin(admin.ModelAdmin):
-    list_display = ('id', 'subject', 'sender', 'mailbox', 'status', 'received_at')
-    list_filter = ('status', 'mailbox', 'received_at')
+    list_display = ('id', 'subject', 'sender', 'mailbox', 'status', 'priority', 'matched_rule', 'received_at')
+    list_filter = ('status', 'priority', 'mailbox', 'received_at')
     search_fields = ('subject', 'sender', 'body_text', 'message_id')
-    readonly_fields = ('created_at', 'updated_at', 'received_at')
+    readonly_fields = ('created_at', 'updated_at', 'received_at', 'body_reduced', 'body_bytes_saved')
     date_hierarchy = 'received_at'
     
     # Mostra o JSON extraído de forma bonita no admin
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0005_automationrule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailBoxSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('folder', models.CharField(default='INBOX', max_length=255, verbose_name='Pasta IMAP')),
+                ('uid_validity', models.BigIntegerField(blank=True, null=True, verbose_name='UIDVALIDITY')),
+                ('last_uid', models.BigIntegerField(default=0, verbose_name='Último UID ingerido')),
+                ('highest_modseq', models.BigIntegerField(blank=True, null=True, verbose_name='HIGHESTMODSEQ')),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True, verbose_name='Última Sincronização')),
+                ('mailbox', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_states', to='emails.mailbox')),
+            ],
+            options={
+                'verbose_name': 'Estado de Sincronização IMAP',
+                'verbose_name_plural': 'Estados de Sincronização IMAP',
+                'unique_together': {('mailbox', 'folder')},
+            },
+        ),
+    ]
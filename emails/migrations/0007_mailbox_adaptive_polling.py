@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0006_mailboxsyncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailbox',
+            name='consecutive_failures',
+            field=models.IntegerField(default=0, verbose_name='Falhas Consecutivas'),
+        ),
+        migrations.AddField(
+            model_name='mailbox',
+            name='next_fetch_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Próxima Busca'),
+        ),
+        migrations.AddField(
+            model_name='mailbox',
+            name='poll_interval_seconds',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Intervalo de Polling (s)'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0007_mailbox_adaptive_polling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailbox',
+            name='imap_prefilter',
+            field=models.BooleanField(default=False, help_text='Busca apenas emails cujo assunto/remetente podem casar com as Regras de Automação ativas.', verbose_name='Pré-filtro no servidor'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0008_mailbox_imap_prefilter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmessage',
+            name='raw_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='emailmessage',
+            name='raw_size',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Tamanho do email bruto (bytes)'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0009_emailmessage_raw_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmessage',
+            name='body_bytes_saved',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Bytes economizados na redução'),
+        ),
+        migrations.AddField(
+            model_name='emailmessage',
+            name='body_reduced',
+            field=models.TextField(blank=True, null=True, verbose_name='Corpo reduzido (enviado à IA)'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0010_emailmessage_body_reduction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmessage',
+            name='matched_rule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='matched_emails', to='emails.automationrule', verbose_name='Regra correspondente'),
+        ),
+        migrations.AddField(
+            model_name='mailbox',
+            name='unmatched_policy',
+            field=models.CharField(choices=[('IGNORE', 'Registrar como Ignorado (sem corpo)'), ('KEEP_BODY', 'Registrar como Ignorado (com corpo)'), ('SKIP', 'Não registrar')], default='IGNORE', help_text='Ignorado sem corpo (não baixa o corpo), Ignorado com corpo (permite reprocessar depois) ou não registrar.', max_length=20, verbose_name='Emails sem regra'),
+        ),
+        migrations.AlterField(
+            model_name='emailmessage',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pendente de Processamento'), ('PROCESSING', 'Em Processamento'), ('EXTRACTED', 'Dados Extraídos com Sucesso'), ('REVIEW', 'Requer Revisão Humana (IA Falhou)'), ('INTEGRATED', 'Integrado (Trello/Telegram OK)'), ('FAILED', 'Falha Crítica'), ('IGNORED', 'Ignorado (nenhuma regra correspondente)')], default='PENDING', max_length=20),
+        ),
+    ]
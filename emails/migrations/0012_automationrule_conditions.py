@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0011_ingest_time_rule_matching'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='automationrule',
+            name='conditions',
+            field=models.JSONField(blank=True, default=list, help_text='Lista de condições, ex: [{"field": "body", "op": "any_of", "value": ["prazo", "intimação"]}].'),
+        ),
+        migrations.AddField(
+            model_name='automationrule',
+            name='conditions_match',
+            field=models.CharField(choices=[('ALL', 'Todas as condições'), ('ANY', 'Qualquer condição')], default='ALL', max_length=3, verbose_name='Combinação das condições'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0012_automationrule_conditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmessage',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Reserva do worker expira em'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0013_emailmessage_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmessage',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Urgente (prazo/intimação)'), (1, 'Alta'), (2, 'Normal'), (3, 'Baixa')], default=2, verbose_name='Fila de prioridade'),
+        ),
+        migrations.AddIndex(
+            model_name='emailmessage',
+            index=models.Index(fields=['status', 'priority', 'received_at'], name='emails_emai_status_629534_idx'),
+        ),
+    ]
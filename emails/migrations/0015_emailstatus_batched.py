@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0014_emailmessage_priority'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailmessage',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pendente de Processamento'), ('PROCESSING', 'Em Processamento'), ('EXTRACTED', 'Dados Extraídos com Sucesso'), ('REVIEW', 'Requer Revisão Humana (IA Falhou)'), ('INTEGRATED', 'Integrado (Trello/Telegram OK)'), ('FAILED', 'Falha Crítica'), ('IGNORED', 'Ignorado (nenhuma regra correspondente)'), ('BATCHED', 'Aguardando Lote da IA (Batch API)')], default='PENDING', max_length=20),
+        ),
+    ]
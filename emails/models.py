@@ -1,8 +1,12 @@
 # julliodutra/cadrius/cadrius-d2664e7d9d3cdaaeb4729d29c9fafb13438707c0/emails/models.py
 
 from django.db import models
+from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from django.utils.functional import cached_property
+
+from emails.rule_conditions import validate_conditions
 
 User = get_user_model()
 
@@ -14,6 +18,23 @@ class EmailStatus(models.TextChoices):
     REQUIRES_REVIEW = 'REVIEW', 'Requer Revisão Humana (IA Falhou)'
     INTEGRATED = 'INTEGRATED', 'Integrado (Trello/Telegram OK)'
     FAILED = 'FAILED', 'Falha Crítica'
+    IGNORED = 'IGNORED', 'Ignorado (nenhuma regra correspondente)'
+    BATCHED = 'BATCHED', 'Aguardando Lote da IA (Batch API)'
+
+
+# Fila de prioridade do email (menor = processado antes); ver tasks/priority.py
+class EmailPriority(models.IntegerChoices):
+    URGENT = 0, 'Urgente (prazo/intimação)'
+    HIGH = 1, 'Alta'
+    NORMAL = 2, 'Normal'
+    LOW = 3, 'Baixa'
+
+
+# O que a ingestão faz com emails que não casam com nenhuma Regra de Automação
+class UnmatchedPolicy(models.TextChoices):
+    IGNORE = 'IGNORE', 'Registrar como Ignorado (sem corpo)'
+    KEEP_BODY = 'KEEP_BODY', 'Registrar como Ignorado (com corpo)'
+    SKIP = 'SKIP', 'Não registrar'
 
 
 class MailBox(models.Model):
@@ -62,6 +83,26 @@ class MailBox(models.Model):
     
     last_fetch_at = models.DateTimeField(null=True, blank=True, verbose_name="Última Busca")
     is_active = models.BooleanField(default=True)
+    # Opt-in: só baixa as mensagens que podem casar com alguma regra ativa (IMAP SEARCH no servidor)
+    imap_prefilter = models.BooleanField(
+        default=False,
+        verbose_name="Pré-filtro no servidor",
+        help_text="Busca apenas emails cujo assunto/remetente podem casar com as Regras de Automação ativas.",
+    )
+    # Regras avaliadas na ingestão: só emails com regra vão para a fila de extração
+    unmatched_policy = models.CharField(
+        max_length=20,
+        choices=UnmatchedPolicy.choices,
+        default=UnmatchedPolicy.IGNORE,
+        verbose_name="Emails sem regra",
+        help_text="Ignorado sem corpo (não baixa o corpo), Ignorado com corpo (permite reprocessar depois) ou não registrar.",
+    )
+
+    # Polling adaptativo (tasks.scheduling): intervalo ajustado pela taxa de
+    # chegada e backoff exponencial após falhas consecutivas de IMAP
+    next_fetch_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="Próxima Busca")
+    poll_interval_seconds = models.IntegerField(null=True, blank=True, verbose_name="Intervalo de Polling (s)")
+    consecutive_failures = models.IntegerField(default=0, verbose_name="Falhas Consecutivas")
 
     class Meta:
         verbose_name = "Caixa de Email"
@@ -71,6 +112,35 @@ class MailBox(models.Model):
         return self.name
 
 
+class MailBoxSyncState(models.Model):
+    """
+    Checkpoint de sincronização IMAP por MailBox/pasta (Thales).
+    Guarda UIDVALIDITY, último UID ingerido e HIGHESTMODSEQ (CONDSTORE),
+    permitindo buscas estritamente incrementais (`UID n:*`).
+    """
+    mailbox = models.ForeignKey(MailBox, on_delete=models.CASCADE, related_name='sync_states')
+    folder = models.CharField(max_length=255, default='INBOX', verbose_name="Pasta IMAP")
+
+    uid_validity = models.BigIntegerField(null=True, blank=True, verbose_name="UIDVALIDITY")
+    last_uid = models.BigIntegerField(default=0, verbose_name="Último UID ingerido")
+    highest_modseq = models.BigIntegerField(null=True, blank=True, verbose_name="HIGHESTMODSEQ")
+    last_synced_at = models.DateTimeField(null=True, blank=True, verbose_name="Última Sincronização")
+
+    class Meta:
+        verbose_name = "Estado de Sincronização IMAP"
+        verbose_name_plural = "Estados de Sincronização IMAP"
+        unique_together = ('mailbox', 'folder')
+
+    def __str__(self):
+        return f'{self.mailbox.name}/{self.folder} (UID {self.last_uid})'
+
+    def reset(self, uid_validity=None):
+        """Descarta o checkpoint (ex: UIDVALIDITY mudou no servidor)."""
+        self.uid_validity = uid_validity
+        self.last_uid = 0
+        self.highest_modseq = None
+
+
 class EmailMessage(models.Model):
     """
     Armazena o email capturado e seu status de processamento.
@@ -84,6 +154,15 @@ class EmailMessage(models.Model):
     sender = models.EmailField()
     received_at = models.DateTimeField(verbose_name="Recebido em (Timestamp IMAP)")
     body_text = models.TextField(verbose_name="Corpo do Email (Texto Limpo)")
+
+    # Email bruto (RFC 822) no RawStore, endereçado por SHA-256 (ver emails/raw_store.py).
+    # Só preenchido com IMAP_STORE_RAW ligado.
+    raw_sha256 = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    raw_size = models.IntegerField(null=True, blank=True, verbose_name="Tamanho do email bruto (bytes)")
+
+    # Texto efetivamente enviado à IA (sem citações, assinatura e rodapé; ver tasks/reduce.py)
+    body_reduced = models.TextField(null=True, blank=True, verbose_name="Corpo reduzido (enviado à IA)")
+    body_bytes_saved = models.IntegerField(null=True, blank=True, verbose_name="Bytes economizados na redução")
     
     # Status e Logs
     status = models.CharField(
@@ -91,6 +170,19 @@ class EmailMessage(models.Model):
         choices=EmailStatus.choices,
         default=EmailStatus.PENDING
     )
+    priority = models.PositiveSmallIntegerField(
+        choices=EmailPriority.choices,
+        default=EmailPriority.NORMAL,
+        verbose_name="Fila de prioridade",
+    )
+    # Regra que casou na ingestão (o worker de extração usa direto, sem reavaliar)
+    matched_rule = models.ForeignKey(
+        'AutomationRule',
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='matched_emails',
+        verbose_name="Regra correspondente",
+    )
     
     # Dados Extraídos (Preenchido por Juliano após o Wrapper de IA)
     # JSONField é ideal para armazenar a saída do ChatGPT validada pelo Pydantic.
@@ -102,6 +194,8 @@ class EmailMessage(models.Model):
     # Controles de Processamento
     processing_attempts = models.IntegerField(default=0)
     last_processed_at = models.DateTimeField(null=True, blank=True)
+    # Reserva do worker que pegou o email (PROCESSING); vencida, outro worker o retoma (tasks/claim_worker.py)
+    lease_expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Reserva do worker expira em")
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -112,19 +206,91 @@ class EmailMessage(models.Model):
         # Jullio: Adicionar índice no campo 'status' para consultas rápidas
         indexes = [
             models.Index(fields=['status', 'received_at']),
+            models.Index(fields=['status', 'priority', 'received_at']),
         ]
 
     def __str__(self):
         return f'[{self.status}] {self.subject} - {self.sender}'
 
+    # ----------------- Transições de status -----------------
+    @classmethod
+    def transition(cls, pk, from_status, to_status, **fields) -> bool:
+        """
+        Move o email de `from_status` (um status ou uma lista deles) para
+        `to_status` num único UPDATE condicional, gravando só `status`,
+        `updated_at` e as colunas em `fields` (aceita F-expressions, ex:
+        `processing_attempts=F('processing_attempts') + 1`).
+
+        Retorna True se a transição venceu; False se o email não estava
+        mais em `from_status` (outro worker já o pegou ou o status mudou).
+        """
+        if isinstance(from_status, str):
+            from_status = [from_status]
+        fields.update(status=to_status, updated_at=timezone.now())
+        return cls.objects.filter(pk=pk, status__in=list(from_status)).update(**fields) == 1
+
     # Método que Thales pode chamar no pipeline para re-enfileirar
-    def re_enqueue_for_processing(self):
+    def re_enqueue_for_processing(self) -> bool:
         """
         Marca o email para ser re-processado, útil após falhas ou revisão.
+        Não mexe em emails em processamento; retorna se a transição venceu.
         """
-        self.status = EmailStatus.PENDING
-        self.processing_attempts += 1
-        self.save()
+        requeueable = [s for s in EmailStatus.values if s != EmailStatus.PROCESSING]
+        moved = EmailMessage.transition(
+            self.pk, requeueable, EmailStatus.PENDING,
+            processing_attempts=models.F('processing_attempts') + 1,
+        )
+        self.refresh_from_db(fields=['status', 'processing_attempts', 'updated_at'])
+        return moved
+
+    # ----------------- Email bruto (carregado sob demanda) -----------------
+    @cached_property
+    def raw_bytes(self):
+        """Bytes RFC 822 originais, lidos (e descomprimidos) do RawStore; None se não guardado."""
+        if not self.raw_sha256:
+            return None
+        from emails.raw_store import get_raw_store
+        return get_raw_store().get(self.raw_sha256)
+
+    @cached_property
+    def raw_message(self):
+        """Mensagem bruta parseada (email.message.EmailMessage); None se não guardada."""
+        if self.raw_bytes is None:
+            return None
+        from email import policy
+        from email.parser import BytesParser
+        return BytesParser(policy=policy.default).parsebytes(self.raw_bytes)
+
+    @property
+    def raw_headers(self) -> list:
+        """Cabeçalhos originais como lista de (nome, valor decodificado)."""
+        if self.raw_message is None:
+            return []
+        return [(name, str(value)) for name, value in self.raw_message.items()]
+
+    def iter_parts(self):
+        """Partes folha (não multipart) da mensagem bruta."""
+        if self.raw_message is None:
+            return
+        for part in self.raw_message.walk():
+            if not part.is_multipart():
+                yield part
+
+    @property
+    def attachments(self) -> list:
+        """Anexos da mensagem bruta: [{filename, content_type, size, part}]."""
+        found = []
+        for part in self.iter_parts():
+            if part.get_content_disposition() != "attachment" and not part.get_filename():
+                continue
+            payload = part.get_payload(decode=True) or b""
+            found.append({
+                "filename": part.get_filename(),
+                "content_type": part.get_content_type(),
+                "size": len(payload),
+                "part": part,
+            })
+        return found
         
         
         
@@ -166,6 +332,18 @@ class AutomationRule(models.Model):
         null=True, 
         help_text="Texto que o Remetente DEVE conter (deixe vazio para ignorar)."
     )
+    # Condições avançadas (regex, corpo, listas, domínio, cabeçalho); ver emails/rule_conditions.py
+    conditions = models.JSONField(
+        default=list,
+        blank=True,
+        help_text='Lista de condições, ex: [{"field": "body", "op": "any_of", "value": ["prazo", "intimação"]}].',
+    )
+    conditions_match = models.CharField(
+        max_length=3,
+        choices=[('ALL', 'Todas as condições'), ('ANY', 'Qualquer condição')],
+        default='ALL',
+        verbose_name="Combinação das condições",
+    )
     
     # AÇÃO: O que fazer se a condição for atendida (ENTÃO)
     # O perfil de extração define o Schema Pydantic e o Prompt
@@ -193,4 +371,10 @@ class AutomationRule(models.Model):
     def __str__(self):
         return f'{self.name} ({self.mailbox.name})'
 
+    def clean(self):
+        try:
+            self.conditions = validate_conditions(self.conditions)
+        except ValidationError as e:
+            raise ValidationError({'conditions': e.messages})
+
 # Create your models here.
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""
+Armazenamento do email bruto (RFC 822), endereçado por conteúdo.
+
+- Chave: SHA-256 do conteúdo bruto. Mensagens idênticas (ex: a mesma
+  intimação entregue em várias caixas) ocupam um único blob.
+- Compressão: zstd quando o pacote `zstandard` estiver instalado e
+  configurado, senão zlib (stdlib). O 1º byte do blob identifica o
+  algoritmo, então blobs antigos continuam legíveis ao trocar a config.
+- Backend plugável: `RAW_STORE_BACKEND` aponta para uma classe com a
+  interface de `RawStore` (padrão: sistema de arquivos em `RAW_STORE_ROOT`).
+"""
+import os
+import abc
+import zlib
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+try:  # dependência opcional
+    import zstandard
+except ImportError:  # pragma: no cover - depende do ambiente
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+_MAGIC_ZLIB = b"z"
+_MAGIC_ZSTD = b"s"
+_MAGIC_NONE = b"n"
+
+
+# ----------------- Compressão -----------------
+def compress(data: bytes, method: str = "zlib", level=None) -> bytes:
+    if method == "zstd" and zstandard is not None:
+        return _MAGIC_ZSTD + zstandard.ZstdCompressor(level=level or 10).compress(data)
+    if method == "none":
+        return _MAGIC_NONE + data
+    return _MAGIC_ZLIB + zlib.compress(data, level or 6)
+
+
+def decompress(blob: bytes) -> bytes:
+    magic, payload = blob[:1], blob[1:]
+    if magic == _MAGIC_ZLIB:
+        return zlib.decompress(payload)
+    if magic == _MAGIC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Blob comprimido com zstd, mas o pacote 'zstandard' não está instalado.")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if magic == _MAGIC_NONE:
+        return payload
+    raise ValueError("Formato de blob desconhecido.")
+
+
+def content_key(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+# ----------------- Backends -----------------
+class RawStore(abc.ABC):
+    """Interface dos backends: put/get/exists/delete/keys."""
+
+    @abc.abstractmethod
+    def put(self, raw: bytes) -> str:
+        """Grava o email bruto e retorna a chave (SHA-256 do conteúdo)."""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> bytes:
+        """Conteúdo bruto da chave (descomprimido)."""
+
+    @abc.abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    def keys(self):
+        """Itera todas as chaves guardadas."""
+
+
+class FileSystemRawStore(RawStore):
+    """
+    Blobs em `<root>/<ab>/<cd>/<sha256>`. Escrita atômica (arquivo temporário
+    + rename), então leitores nunca veem um blob pela metade e escritas
+    concorrentes do mesmo conteúdo são idempotentes.
+    """
+
+    def __init__(self, root=None, compression=None, level=None):
+        self.root = Path(root or getattr(settings, "RAW_STORE_ROOT", Path(settings.BASE_DIR) / "var" / "raw"))
+        self.compression = compression or getattr(settings, "RAW_STORE_COMPRESSION", "zlib")
+        self.level = level
+        if self.compression == "zstd" and zstandard is None:
+            logger.warning("RAW_STORE_COMPRESSION=zstd, mas 'zstandard' não está instalado; usando zlib.")
+            self.compression = "zlib"
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key[2:4] / key
+
+    def put(self, raw: bytes) -> str:
+        key = content_key(raw)
+        path = self._path(key)
+        if path.exists():
+            # deduplicado: mesmo conteúdo já armazenado. O mtime é renovado para o
+            # raw_store_gc não apagar o blob antes de a nova linha referenciá-lo
+            try:
+                os.utime(path)
+                return key
+            except FileNotFoundError:
+                pass  # removido agora pelo GC: grava de novo
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(compress(raw, self.compression, self.level))
+            os.replace(tmp, path)
+        except Exception:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        return key
+
+    def get(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as fh:
+            return decompress(fh.read())
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def delete(self, key: str) -> None:
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def keys(self):
+        if not self.root.exists():
+            return
+        for path in self.root.glob("??/??/*"):
+            if not path.name.startswith(".tmp-"):
+                yield path.name
+
+    def stored_size(self, key: str) -> int:
+        return self._path(key).stat().st_size
+
+    def modified_at(self, key: str) -> float:
+        return self._path(key).stat().st_mtime
+
+
+_store = None
+
+
+def get_raw_store() -> RawStore:
+    """Instância (única por processo) do backend configurado em RAW_STORE_BACKEND."""
+    global _store
+    if _store is None:
+        backend = getattr(settings, "RAW_STORE_BACKEND", "emails.raw_store.FileSystemRawStore")
+        _store = import_string(backend)()
+    return _store
+
+
+def _reset_store(setting, **kwargs):
+    global _store
+    if setting.startswith("RAW_STORE_"):
+        _store = None
+
+
+setting_changed.connect(_reset_store)
@@ -0,0 +1,101 @@
+"""
+Condições avançadas das Regras de Automação (`AutomationRule.conditions`).
+
+Cada condição é um dict:
+
+    {"field": "subject",       "op": "regex",    "value": "processo n[ºo] \\d+"}
+    {"field": "body",          "op": "any_of",   "value": ["prazo", "intimação"]}
+    {"field": "sender_domain", "op": "any_of",   "value": ["tjsp.jus.br", "trt2.jus.br"]}
+    {"field": "header",        "op": "present",  "header": "X-Tribunal"}
+
+Campos e operadores aceitos (texto sempre case-insensitive):
+- subject / sender / body: contains, regex, any_of, all_of
+- sender_domain: equals, any_of (o domínio ou um subdomínio dele)
+- header: present, contains, regex (sobre o valor do cabeçalho `header`)
+
+As condições são combinadas por `conditions_match` (ALL/ANY) e sempre em
+E com `subject_contains` / `sender_contains`. A validação fica aqui (usada
+pelo serializer e pelo model); a compilação em plano de avaliação fica em
+tasks/rule_matcher.py.
+"""
+import re
+
+from django.core.exceptions import ValidationError
+
+FIELD_OPS = {
+    "subject": ("contains", "regex", "any_of", "all_of"),
+    "sender": ("contains", "regex", "any_of", "all_of"),
+    "body": ("contains", "regex", "any_of", "all_of"),
+    "sender_domain": ("equals", "any_of"),
+    "header": ("present", "contains", "regex"),
+}
+LIST_OPS = ("any_of", "all_of")
+MAX_CONDITIONS = 20
+MAX_LIST_ITEMS = 100
+MAX_REGEX_LENGTH = 500
+_HEADER_NAME = re.compile(r"^[!-9;-~]+$")  # RFC 5322: ASCII imprimível sem ':'
+
+
+def compile_regex(pattern):
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _validate_value(field, op, value, index):
+    if op == "present":
+        return None
+    if op in LIST_OPS:
+        if not isinstance(value, list) or not value:
+            raise ValidationError(f"Condição {index}: '{op}' exige uma lista não vazia em 'value'.")
+        if len(value) > MAX_LIST_ITEMS:
+            raise ValidationError(f"Condição {index}: no máximo {MAX_LIST_ITEMS} itens em 'value'.")
+        items = [item.strip() for item in value if isinstance(item, str) and item.strip()]
+        if len(items) != len(value):
+            raise ValidationError(f"Condição {index}: todos os itens de 'value' devem ser textos não vazios.")
+        return [item.lower() for item in items] if field == "sender_domain" else items
+    if not isinstance(value, str) or not value.strip():
+        raise ValidationError(f"Condição {index}: 'value' deve ser um texto não vazio.")
+    if op == "regex":
+        if len(value) > MAX_REGEX_LENGTH:
+            raise ValidationError(f"Condição {index}: regex maior que {MAX_REGEX_LENGTH} caracteres.")
+        try:
+            compile_regex(value)
+        except re.error as e:
+            raise ValidationError(f"Condição {index}: regex inválida ({e}).")
+        return value
+    return value.strip().lower() if field == "sender_domain" else value.strip()
+
+
+def validate_conditions(conditions):
+    """
+    Valida e normaliza a lista de condições. Levanta ValidationError com
+    a primeira condição inválida; devolve a lista normalizada.
+    """
+    if conditions in (None, ""):
+        return []
+    if not isinstance(conditions, list):
+        raise ValidationError("As condições devem ser uma lista.")
+    if len(conditions) > MAX_CONDITIONS:
+        raise ValidationError(f"No máximo {MAX_CONDITIONS} condições por regra.")
+
+    normalized = []
+    for index, condition in enumerate(conditions, start=1):
+        if not isinstance(condition, dict):
+            raise ValidationError(f"Condição {index}: deve ser um objeto.")
+        field, op = condition.get("field"), condition.get("op")
+        if field not in FIELD_OPS:
+            raise ValidationError(f"Condição {index}: campo '{field}' inválido (use {', '.join(FIELD_OPS)}).")
+        if op not in FIELD_OPS[field]:
+            raise ValidationError(
+                f"Condição {index}: operador '{op}' inválido para '{field}' (use {', '.join(FIELD_OPS[field])})."
+            )
+        item = {"field": field, "op": op}
+        if field == "header":
+            header = (condition.get("header") or "").strip()
+            if not _HEADER_NAME.match(header):
+                raise ValidationError(f"Condição {index}: informe o nome do cabeçalho em 'header' (ex: X-Tribunal).")
+            item["header"] = header
+        value = _validate_value(field, op, condition.get("value"), index)
+        if value is not None:
+            item["value"] = value
+        normalized.append(item)
+    return normalized
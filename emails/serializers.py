@@ -3,6 +3,8 @@ from emails.models import MailBox, EmailMessage, EmailStatus, AutomationRule # N
 from integrations.models import IntegrationLog, IntegrationConfig # NOVO: IntegrationConfig
 from extraction.models import ExtractionProfile
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from emails.rule_conditions import validate_conditions
 
 # --- Serializers de MailBox (Jullio) ---
 
@@ -16,9 +18,11 @@ class MailBoxSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = MailBox
-        fields = ['id', 'name', 'imap_host', 'imap_port', 'username', 'is_active', 'last_fetch_at', 
+        fields = ['id', 'name', 'imap_host', 'imap_port', 'username', 'is_active', 'imap_prefilter', 'unmatched_policy', 'last_fetch_at', 
+                  'next_fetch_at', 'poll_interval_seconds', 'consecutive_failures',
                   'integration_config', 'extraction_profile', 'integration_config_name', 'extraction_profile_name', 'user']
-        read_only_fields = ['last_fetch_at', 'user', 'integration_config_name', 'extraction_profile_name']
+        read_only_fields = ['last_fetch_at', 'next_fetch_at', 'poll_interval_seconds', 'consecutive_failures',
+                            'user', 'integration_config_name', 'extraction_profile_name']
         extra_kwargs = {
             'password': {'write_only': True}
         }
@@ -47,7 +51,7 @@ class ExtractionProfileSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = ExtractionProfile
-        fields = ['id', 'name', 'system_prompt_template', 'pydantic_schema_name', 'user']
+        fields = ['id', 'name', 'system_prompt_template', 'pydantic_schema_name', 'execution_mode', 'user']
         read_only_fields = ['user']
 
 class AutomationRuleSerializer(serializers.ModelSerializer):
@@ -61,10 +65,18 @@ class AutomationRuleSerializer(serializers.ModelSerializer):
     class Meta:
         model = AutomationRule
         fields = ['id', 'name', 'mailbox', 'mailbox_name', 'priority', 'is_active', 
-                  'subject_contains', 'sender_contains', 'extraction_profile', 'extraction_profile_name', 
+                  'subject_contains', 'sender_contains', 'conditions', 'conditions_match',
+                  'extraction_profile', 'extraction_profile_name', 
                   'action_config', 'user']
         read_only_fields = ['user', 'mailbox_name', 'extraction_profile_name']
 
+    def validate_conditions(self, value):
+        # Regex compilada, operadores por campo e listas validados antes de salvar
+        try:
+            return validate_conditions(value)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+
 class IntegrationLogSerializer(serializers.ModelSerializer):
     """
     Retorna os logs de integração (Trello/Telegram).
@@ -84,6 +96,7 @@ class EmailMessageSerializer(serializers.ModelSerializer):
     """
     mailbox_name = serializers.CharField(source='mailbox.name', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
+    priority_display = serializers.CharField(source='get_priority_display', read_only=True)
     
     # Rastreamento: Inclui logs de integração aninhados
     integration_logs = IntegrationLogSerializer(many=True, read_only=True)
@@ -99,8 +112,9 @@ class EmailMessageSerializer(serializers.ModelSerializer):
             # Note que 'body_text' pode ser grande, restrinja em list views se necessário.
             fields = [
                 'id', 'mailbox_name', 'subject', 'sender', 'received_at', 
-                'status', 'status_display', 'processing_attempts', 'last_processed_at',
-                'body_text', 'extracted_data', 'integration_logs_ext' # <--- CAMPO ATUALIZADO
+                'status', 'status_display', 'priority', 'priority_display', 'matched_rule', 'processing_attempts', 'last_processed_at',
+                'body_text', 'extracted_data', 'integration_logs_ext', # <--- CAMPO ATUALIZADO
+                'raw_sha256', 'raw_size', 'body_reduced', 'body_bytes_saved',
             ]
             read_only_fields = fields
             
\ No newline at end of file
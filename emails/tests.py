@@ -1,3 +1,202 @@
-from django.test import TestCase
+import io
+import os
+import time
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from emails.models import MailBox, EmailMessage, EmailStatus
+from emails.serializers import AutomationRuleSerializer
+from emails.raw_store import FileSystemRawStore, compress, decompress, content_key, get_raw_store
+from tasks.bench.corpus import generate_corpus
+
+
+class RawStoreTests(TestCase):
+    """
+    Testes do armazenamento do email bruto (emails.raw_store).
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings_override = override_settings(RAW_STORE_ROOT=self.root, RAW_STORE_COMPRESSION='zlib')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_round_trip_and_dedup(self):
+        """Mesmo conteúdo gera a mesma chave e um único blob comprimido."""
+        store = FileSystemRawStore(root=self.root)
+        raw = b'Subject: teste\r\n\r\n' + b'intimacao ' * 1000
+
+        key = store.put(raw)
+
+        self.assertEqual(key, content_key(raw))
+        self.assertEqual(store.put(raw), key)
+        self.assertEqual(list(store.keys()), [key])
+        self.assertEqual(store.get(key), raw)
+        self.assertLess(store.stored_size(key), len(raw) / 10)
+
+    def test_blob_format_is_self_describing(self):
+        """O 1º byte identifica o algoritmo; blobs antigos continuam legíveis ao trocar a config."""
+        data = b'conteudo'
+        self.assertEqual(decompress(compress(data, 'none')), data)
+        self.assertEqual(decompress(compress(data, 'zlib')), data)
+        # zstd sem o pacote instalado cai para zlib
+        self.assertEqual(decompress(compress(data, 'zstd')), data)
+        with self.assertRaises(ValueError):
+            decompress(b'?lixo')
+
+    def test_email_accessors_parse_raw_lazily(self):
+        """raw_message/attachments vêm do RawStore sob demanda."""
+        _kind, raw = generate_corpus(1, mix={'attachment': 1}, attachment_bytes=4096)[0]
+        user = get_user_model().objects.create_user(username='raw', password='x')
+        mailbox = MailBox.objects.create(user=user, name='Raw', imap_host='imap.test', username='u', password='p')
+        email = EmailMessage.objects.create(
+            mailbox=mailbox, message_id='<raw@test>', subject='s', sender='a@b.com',
+            received_at=timezone.now(), body_text='', raw_sha256=get_raw_store().put(raw), raw_size=len(raw),
+        )
+
+        email = EmailMessage.objects.get(pk=email.pk)
+
+        self.assertEqual(email.raw_bytes, raw)
+        self.assertIn('Message-ID', dict(email.raw_headers))
+        [attachment] = email.attachments
+        self.assertEqual((attachment['content_type'], attachment['size']), ('application/pdf', 4096))
+        self.assertTrue(attachment['filename'].endswith('.pdf'))
+
+    def test_put_of_existing_blob_protects_it_from_gc(self):
+        """Blob antigo reaproveitado por uma mensagem nova ganha mtime novo e sobrevive ao GC."""
+        store = get_raw_store()
+        key = store.put(b'mesmo conteudo')
+        old = time.time() - 48 * 3600
+        os.utime(store._path(key), (old, old))
+
+        self.assertEqual(store.put(b'mesmo conteudo'), key)
+        call_command('raw_store_gc', stdout=io.StringIO())
+
+        self.assertTrue(store.exists(key))
+        self.assertGreater(store.modified_at(key), old)
+
+    def test_gc_removes_only_unreferenced_blobs(self):
+        store = get_raw_store()
+        orphan = store.put(b'orfao')
+        user = get_user_model().objects.create_user(username='gc', password='x')
+        mailbox = MailBox.objects.create(user=user, name='GC', imap_host='imap.test', username='u', password='p')
+        EmailMessage.objects.create(
+            mailbox=mailbox, message_id='<gc@test>', subject='s', sender='a@b.com',
+            received_at=timezone.now(), body_text='', raw_sha256=store.put(b'referenciado'),
+        )
+
+        call_command('raw_store_gc', min_age_hours=0, stdout=io.StringIO())
+
+        self.assertFalse(store.exists(orphan))
+        self.assertTrue(store.exists(content_key(b'referenciado')))
+
+
+class AutomationRuleConditionsTests(TestCase):
+    """
+    Validação das condições avançadas no AutomationRuleSerializer.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='regras', password='x')
+        self.mailbox = MailBox.objects.create(user=self.user, name='Regras', imap_host='imap.test', username='u', password='p')
+
+    def _serializer(self, conditions, **extra):
+        return AutomationRuleSerializer(data={
+            'name': 'Regra', 'mailbox': self.mailbox.id, 'conditions': conditions, **extra,
+        })
+
+    def test_valid_conditions_are_normalized(self):
+        serializer = self._serializer([
+            {'field': 'sender_domain', 'op': 'any_of', 'value': [' TJSP.jus.br ']},
+            {'field': 'header', 'op': 'present', 'header': 'X-Tribunal', 'value': 'ignorado'},
+            {'field': 'body', 'op': 'regex', 'value': r'prazo de \d+ dias'},
+        ], conditions_match='ANY')
+
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data['conditions'], [
+            {'field': 'sender_domain', 'op': 'any_of', 'value': ['tjsp.jus.br']},
+            {'field': 'header', 'op': 'present', 'header': 'X-Tribunal'},
+            {'field': 'body', 'op': 'regex', 'value': r'prazo de \d+ dias'},
+        ])
+
+    def test_invalid_conditions_are_rejected(self):
+        invalid = [
+            [{'field': 'subject', 'op': 'regex', 'value': '(aberto'}],
+            [{'field': 'sender_domain', 'op': 'regex', 'value': 'x'}],
+            [{'field': 'header', 'op': 'present'}],
+            [{'field': 'body', 'op': 'any_of', 'value': []}],
+            {'field': 'subject'},
+        ]
+        for conditions in invalid:
+            serializer = self._serializer(conditions)
+            self.assertFalse(serializer.is_valid(), conditions)
+            self.assertIn('conditions', serializer.errors)
+
+
+class EmailTransitionTests(TestCase):
+    """
+    Testes das transições atômicas de status (EmailMessage.transition).
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='transicoes', password='x')
+        self.mailbox = MailBox.objects.create(user=self.user, name='Transições', imap_host='imap.test', username='u', password='p')
+        self.email = EmailMessage.objects.create(
+            mailbox=self.mailbox, message_id='<t1@x>', subject='Intimação', sender='a@tjsp.jus.br',
+            received_at=timezone.now(), body_text='corpo grande ' * 1000,
+        )
+
+    def test_only_one_transition_wins(self):
+        """Dois workers tentando PENDING -> PROCESSING: só o primeiro vence."""
+        claim = dict(processing_attempts=F('processing_attempts') + 1)
+
+        self.assertTrue(EmailMessage.transition(self.email.id, EmailStatus.PENDING, EmailStatus.PROCESSING, **claim))
+        self.assertFalse(EmailMessage.transition(self.email.id, EmailStatus.PENDING, EmailStatus.PROCESSING, **claim))
+
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, EmailStatus.PROCESSING)
+        self.assertEqual(self.email.processing_attempts, 1)
+
+    def test_update_touches_only_changed_columns(self):
+        """Um UPDATE condicional, sem reescrever body_text/extracted_data."""
+        with CaptureQueriesContext(connection) as ctx:
+            EmailMessage.transition(
+                self.email.id, [EmailStatus.PENDING, EmailStatus.FAILED], EmailStatus.EXTRACTED,
+                extracted_data={'numero_processo': '1'},
+            )
+
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]['sql']
+        self.assertTrue(sql.startswith('UPDATE'))
+        self.assertIn('"status" IN', sql)
+        self.assertNotIn('body_text', sql)
+
+    @mock.patch('emails.views.async_task')
+    def test_reprocess_endpoint(self, async_task):
+        """Reprocessar volta para PENDING e enfileira a task certa; em processamento, 409."""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        EmailMessage.transition(self.email.id, EmailStatus.PENDING, EmailStatus.FAILED)
+
+        response = client.post(f'/api/v1/emails/{self.email.id}/reprocess/')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['new_status'], EmailStatus.PENDING.label)
+        async_task.assert_called_once_with('tasks.tasks.process_email', self.email.id, cluster=None)
+
+        EmailMessage.transition(self.email.id, EmailStatus.PENDING, EmailStatus.PROCESSING)
+        response = client.post(f'/api/v1/emails/{self.email.id}/reprocess/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(async_task.call_count, 1)
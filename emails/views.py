@@ -2,6 +2,7 @@ from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
 from django.db.models import Q
 from django_q.models import Schedule
 from django_q.tasks import async_task
@@ -9,6 +10,7 @@ from django_q.tasks import async_task
 from .models import MailBox, EmailMessage, AutomationRule
 from integrations.models import IntegrationConfig
 from extraction.models import ExtractionProfile
+from tasks.queues import EXTRACTION, cluster_for
 from .serializers import (
     MailBoxSerializer, EmailMessageSerializer,
     IntegrationConfigSerializer, ExtractionProfileSerializer, AutomationRuleSerializer
@@ -31,6 +33,9 @@ class MailBoxViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         mailbox = serializer.save(user=self.request.user)
+        if getattr(settings, 'IMAP_FETCH_ORCHESTRATOR', False):
+            # O orquestrador (tasks.orchestrator.fetch_due_mailboxes) já cobre a nova caixa
+            return
         Schedule.objects.create(
             func='tasks.tasks.fetch_emails',
             args=f'{mailbox.id}',
@@ -76,11 +81,15 @@ class EmailMessageViewSet(mixins.RetrieveModelMixin, mixins.ListModelMixin, view
         Marca um email para ser re-processado (enfileira novamente a tarefa).
         """
         email = self.get_object()
-        email.re_enqueue_for_processing()
-        async_task('tasks.process_email', email.id)
+        if not email.re_enqueue_for_processing():
+            return Response({
+                "detail": "Email já está em processamento.",
+                "status": email.status,
+            }, status=status.HTTP_409_CONFLICT)
+        async_task('tasks.tasks.process_email', email.id, cluster=cluster_for(EXTRACTION))
         return Response({
             "detail": "Email enfileirado para reprocessamento.",
-            "new_status": email.status_display
+            "new_status": email.get_status_display()
         }, status=status.HTTP_202_ACCEPTED)
 
 class IntegrationConfigViewSet(viewsets.ModelViewSet):
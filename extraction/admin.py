@@ -1,8 +1,30 @@
 from django.contrib import admin
-from .models import ExtractionProfile
+from .models import ExtractionProfile, ExtractionCacheEntry, ExtractionBatch, RateLimitBucket
 
 @admin.register(ExtractionProfile)
 class ExtractionProfileAdmin(admin.ModelAdmin):
-    list_display = ('name', 'user', 'pydantic_schema_name')
-    list_filter = ('user', 'pydantic_schema_name')
-    search_fields = ('name', 'system_prompt_template')
\ No newline at end of file
+    list_display = ('name', 'user', 'pydantic_schema_name', 'execution_mode')
+    list_filter = ('user', 'pydantic_schema_name', 'execution_mode')
+    search_fields = ('name', 'system_prompt_template')
+
+@admin.register(ExtractionCacheEntry)
+class ExtractionCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'schema_name', 'model', 'hits', 'created_at', 'last_hit_at', 'expires_at')
+    list_filter = ('schema_name', 'model')
+    search_fields = ('key',)
+    readonly_fields = ('key', 'schema_name', 'model', 'result', 'hits', 'created_at', 'last_hit_at', 'expires_at')
+
+@admin.register(ExtractionBatch)
+class ExtractionBatchAdmin(admin.ModelAdmin):
+    list_display = ('batch_id', 'status', 'model', 'request_count', 'succeeded', 'failed', 'created_at', 'completed_at')
+    list_filter = ('status', 'model')
+    search_fields = ('batch_id',)
+    readonly_fields = (
+        'batch_id', 'input_file_id', 'output_file_id', 'error_file_id', 'status', 'model',
+        'request_count', 'succeeded', 'failed', 'created_at', 'completed_at',
+    )
+
+@admin.register(RateLimitBucket)
+class RateLimitBucketAdmin(admin.ModelAdmin):
+    list_display = ('model', 'requests', 'tokens', 'updated_at', 'blocked_until')
+    readonly_fields = ('model', 'requests', 'tokens', 'updated_at')
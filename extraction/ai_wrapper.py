@@ -1,27 +1,146 @@
 import os
 import json
+import time
+import asyncio
 import logging
-from openai import OpenAI
+import weakref
+from asgiref.sync import sync_to_async
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, OpenAI, RateLimitError
 from pydantic import BaseModel, ValidationError
 
 # Importa os schemas definidos por Juliano
 from .schemas import ExtractedData, ServiceOrderSchema, SupportRequestSchema 
+from . import cache as extraction_cache
+from . import rate_limit
+from .prompts import compile_prompt
+from .rate_limit import RateLimited
 
 logger = logging.getLogger(__name__)
 
-# Configuração do cliente OpenAI (lê a chave do settings.py via os.environ)
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# Configuração do cliente OpenAI (lê a chave do settings.py via os.environ).
+# Criado no primeiro uso: importar o módulo não exige OPENAI_API_KEY (acertos
+# no cache, testes e management commands não precisam do cliente).
+client = None
+_async_clients = weakref.WeakKeyDictionary()
 AI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo")
 
 # Número máximo de tentativas de re-prompt antes de falhar
 MAX_RETRY_ATTEMPTS = 2
+# Erros passageiros (429, 5xx, rede): nova tentativa após espera, sem gastar re-prompt.
+# Os clientes são criados com max_retries=0: quem retenta é o rate_limit (coordenado no cluster).
+TRANSIENT_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+
+def get_client() -> OpenAI:
+    global client
+    if client is None:
+        client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0)
+    return client
+
+
+def get_async_client() -> AsyncOpenAI:
+    """
+    Cliente assíncrono do event loop corrente (motor concorrente,
+    tasks/async_extraction.py). Um por loop: as conexões do httpx ficam
+    presas ao loop em que foram abertas.
+    """
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        async_client = _async_clients[loop] = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0)
+    return async_client
+
+
+async def close_async_client() -> None:
+    """Fecha o cliente assíncrono do loop corrente (fim de um lote concorrente)."""
+    async_client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if async_client is not None:
+        await async_client.close()
+
+
+# ----------------- Etapas comuns (síncrono e assíncrono) -----------------
+def _prepare(text, schema, prompt_template, use_cache, today):
+    """Prompt compilado, mensagem do usuário e chave de cache (None sem cache)."""
+    # 1. Prompt de Sistema compilado (instruções + schema minimizado + template do perfil):
+    #    fixo entre chamadas, calculado uma vez por (schema, template) - extraction/prompts.py
+    compiled = compile_prompt(schema, prompt_template)
+
+    # 2. Mensagem do Usuário: só a parte volátil (data e texto), no fim
+    user_prompt = compiled.user_message(text, today)
+
+    # Cache: mesma entrada normalizada + schema + prompt + modelo = mesmo resultado;
+    # a data só entra na chave quando o template usa {data_atual}
+    prompt_key = f"{compiled.fingerprint}|{today or ''}" if compiled.uses_date else compiled.fingerprint
+    key = extraction_cache.cache_key(text, compiled.schema_json, prompt_key, AI_MODEL) if use_cache else None
+    return compiled, user_prompt, key
+
+
+def _request(system_prompt, user_prompt) -> dict:
+    return dict(
+        model=AI_MODEL,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            # Adicionar exemplos few-shot aqui, se houver
+            {"role": "user", "content": user_prompt}
+        ],
+        # Força a saída como JSON (necessita do modelo gpt-3.5-turbo ou superior)
+        response_format={"type": "json_object"} 
+    )
+
+
+def _validate(response, schema) -> dict:
+    raw_json_output = response.choices[0].message.content
+
+    # 3. VALIDAÇÃO PYDANTIC (CRÍTICO)
+    # Converte a string JSON para o modelo Pydantic, que valida tipos e restrições.
+    validated_model = schema.model_validate_json(raw_json_output)
+
+    # Retorna o modelo validado como um dicionário Python
+    return validated_model.model_dump(mode='json')
+
+
+def _correction(attempt, error) -> str:
+    """Instrução de correção anexada à mensagem do usuário na próxima tentativa."""
+    if isinstance(error, json.JSONDecodeError):
+        logger.error(f"Tentativa {attempt + 1}: Resposta da IA não é um JSON válido.")
+        return "\nA saída anterior não foi um JSON válido. Por favor, corrija e retorne APENAS o JSON."
+    logger.error(f"Tentativa {attempt + 1}: Falha na validação Pydantic. Erro: {error}")
+    # Se a validação falha, Juliano instrui a IA a tentar corrigir o JSON.
+    error_message = f"O JSON retornado falhou na validação. Erros:\n{error}"
+    return f"\nCorrija os erros de schema no seu JSON:\n{error_message}"
+
+
+def _transient_wait(error, retries) -> float:
+    """
+    Espera antes da retentativa `retries` após 429/5xx/erro de rede. Um 429
+    pausa o modelo para o cluster inteiro (a espera acontece no próximo
+    acquire). Esgotadas as retentativas, sobe RateLimited.
+    """
+    if retries > rate_limit.MAX_TRANSIENT_RETRIES:
+        raise RateLimited(f"OpenAI indisponível após {retries - 1} retentativa(s): {error}") from error
+    delay = rate_limit.backoff_delay(error, retries)
+    logger.warning(
+        f"OpenAI respondeu {error.__class__.__name__}; nova tentativa em {delay:.1f}s "
+        f"({retries}/{rate_limit.MAX_TRANSIENT_RETRIES})."
+    )
+    if isinstance(error, RateLimitError) and rate_limit.ENABLED:
+        rate_limit.penalize(AI_MODEL, delay)
+        return 0.0
+    return delay
+
+
+def _out_of_quota(error) -> bool:
+    # 429 por falta de crédito não passa esperando
+    return isinstance(error, RateLimitError) and getattr(error, "code", None) == "insufficient_quota"
 
 
 def extract_fields_from_text(
     text: str, 
     schema: type[BaseModel], 
     prompt_template: str, 
-    examples: list = None
+    examples: list = None,
+    use_cache: bool = True,
+    today: str = None,
 ) -> dict | None:
     """
     Extrai dados estruturados de um texto usando a API do OpenAI e valida com Pydantic.
@@ -29,59 +148,52 @@ def extract_fields_from_text(
     Args:
         text: O corpo do email a ser analisado.
         schema: O modelo Pydantic (ex: ServiceOrderSchema) para validação.
-        prompt_template: O template de instrução para a IA.
+        prompt_template: O template de instrução para a IA ({data_atual} é preenchido com `today`).
         examples: Exemplos few-shot para guiar a extração (opcional).
+        use_cache: Reaproveita o resultado de uma extração idêntica (extraction/cache.py).
+        today: Data atual (dd/mm/aaaa), enviada no fim da mensagem para não variar o prefixo.
 
     Returns:
         Um dicionário Python (JSON validado) ou None em caso de falha.
-    """
-    schema_json = schema.model_json_schema()
-    
-    # 1. Montagem do Prompt de Sistema (Instruções e Estrutura JSON)
-    system_prompt = (
-        "Você é um extrator de dados altamente eficiente. Sua única tarefa é analisar o texto "
-        "fornecido e retornar os dados estritamente no formato JSON, conforme o schema abaixo. "
-        f"Se não for possível preencher um campo, use `null` ou um valor padrão razoável.\n\n"
-        f"SCHEMA JSON: {json.dumps(schema_json)}"
-    )
 
-    # 2. Montagem da Mensagem do Usuário
-    user_prompt = f"{prompt_template}\n\nTEXTO DE ENTRADA:\n---\n{text}"
+    Raises:
+        RateLimited: sem capacidade na OpenAI agora (limite do cluster ou 429/5xx
+            persistentes); o email deve voltar para a fila, não para revisão.
+    """
+    compiled, user_prompt, key = _prepare(text, schema, prompt_template, use_cache, today)
+    if key:
+        cached = extraction_cache.get_cached(key)
+        if cached is not None:
+            logger.info(f"Extração reaproveitada do cache (schema {schema.__name__}); chamada à OpenAI evitada.")
+            return cached
     
     # Estratégia de Fallback com Retries
-    for attempt in range(MAX_RETRY_ATTEMPTS):
+    attempt, transient = 0, 0
+    while attempt < MAX_RETRY_ATTEMPTS:
         try:
+            request = _request(compiled.system, user_prompt)
+            # limite de taxa do cluster: espera a vez antes de chamar (extraction/rate_limit.py)
+            rate_limit.acquire(AI_MODEL, rate_limit.estimate_tokens(request["messages"]))
             logger.info(f"Tentativa {attempt + 1}: Chamando API OpenAI...")
-            
-            response = client.chat.completions.create(
-                model=AI_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    # Adicionar exemplos few-shot aqui, se houver
-                    {"role": "user", "content": user_prompt}
-                ],
-                # Força a saída como JSON (necessita do modelo gpt-3.5-turbo ou superior)
-                response_format={"type": "json_object"} 
-            )
-
-            raw_json_output = response.choices[0].message.content
-            
-            # 3. VALIDAÇÃO PYDANTIC (CRÍTICO)
-            # Converte a string JSON para o modelo Pydantic, que valida tipos e restrições.
-            validated_model = schema.model_validate_json(raw_json_output)
-            
-            # Retorna o modelo validado como um dicionário Python
-            return validated_model.model_dump(mode='json')
-
-        except json.JSONDecodeError:
-            logger.error(f"Tentativa {attempt + 1}: Resposta da IA não é um JSON válido.")
-            user_prompt += "\nA saída anterior não foi um JSON válido. Por favor, corrija e retorne APENAS o JSON."
-            
-        except ValidationError as e:
-            logger.error(f"Tentativa {attempt + 1}: Falha na validação Pydantic. Erro: {e}")
-            # Se a validação falha, Juliano instrui a IA a tentar corrigir o JSON.
-            error_message = f"O JSON retornado falhou na validação. Erros:\n{e}"
-            user_prompt += f"\nCorrija os erros de schema no seu JSON:\n{error_message}"
+            response = get_client().chat.completions.create(**request)
+            result = _validate(response, schema)
+            if key:
+                extraction_cache.store(key, result, schema.__name__, AI_MODEL)
+            return result
+
+        except (json.JSONDecodeError, ValidationError) as e:
+            user_prompt += _correction(attempt, e)
+            attempt += 1
+
+        except RateLimited:
+            raise
+
+        except TRANSIENT_ERRORS as e:
+            if _out_of_quota(e):
+                logger.critical(f"OpenAI sem crédito (insufficient_quota): {e}")
+                break
+            transient += 1
+            time.sleep(_transient_wait(e, transient))
 
         except Exception as e:
             logger.critical(f"Erro na comunicação com a API OpenAI: {e}")
@@ -91,6 +203,62 @@ def extract_fields_from_text(
     logger.error("Extração falhou após todas as tentativas. Retornando None.")
     return None
 
+
+async def aextract_fields_from_text(
+    text: str, 
+    schema: type[BaseModel], 
+    prompt_template: str, 
+    examples: list = None,
+    use_cache: bool = True,
+    today: str = None,
+) -> dict | None:
+    """
+    Versão assíncrona de `extract_fields_from_text` (mesmos argumentos,
+    mesmo retorno, mesma RateLimited): AsyncOpenAI, mesmas validações,
+    re-prompts, cache e limite de taxa.
+    O cache (ORM) roda via sync_to_async na thread de quem chamou o
+    async_to_sync, com a mesma conexão de banco.
+    """
+    compiled, user_prompt, key = _prepare(text, schema, prompt_template, use_cache, today)
+    if key:
+        cached = await sync_to_async(extraction_cache.get_cached)(key)
+        if cached is not None:
+            logger.info(f"Extração reaproveitada do cache (schema {schema.__name__}); chamada à OpenAI evitada.")
+            return cached
+
+    attempt, transient = 0, 0
+    while attempt < MAX_RETRY_ATTEMPTS:
+        try:
+            request = _request(compiled.system, user_prompt)
+            await rate_limit.aacquire(AI_MODEL, rate_limit.estimate_tokens(request["messages"]))
+            logger.info(f"Tentativa {attempt + 1}: Chamando API OpenAI (assíncrono)...")
+            response = await get_async_client().chat.completions.create(**request)
+            result = _validate(response, schema)
+            if key:
+                await sync_to_async(extraction_cache.store)(key, result, schema.__name__, AI_MODEL)
+            return result
+
+        except (json.JSONDecodeError, ValidationError) as e:
+            user_prompt += _correction(attempt, e)
+            attempt += 1
+
+        except RateLimited:
+            raise
+
+        except TRANSIENT_ERRORS as e:
+            if _out_of_quota(e):
+                logger.critical(f"OpenAI sem crédito (insufficient_quota): {e}")
+                break
+            transient += 1
+            await asyncio.sleep(await sync_to_async(_transient_wait)(e, transient))
+
+        except Exception as e:
+            logger.critical(f"Erro na comunicação com a API OpenAI: {e}")
+            break # Falha crítica, não tentar novamente.
+
+    logger.error("Extração falhou após todas as tentativas. Retornando None.")
+    return None
+
 # --------------------------------------------------------------------------------
 # MOCK DE TESTE (A ser usado por Juliano para testes unitários em CI)
 # --------------------------------------------------------------------------------
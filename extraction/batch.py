@@ -0,0 +1,110 @@
+"""
+Batch API da OpenAI: montagem do JSONL, envio, consulta e leitura do resultado.
+
+Perfis em modo lote (ExtractionProfile.execution_mode = BATCH) não chamam a
+OpenAI email a email: tasks/batch_worker.py acumula os emails, envia um
+arquivo JSONL (uma requisição de chat/completions por linha, com o mesmo
+prompt compilado do modo imediato) e, quando o lote termina, valida cada
+linha contra o schema Pydantic do perfil.
+
+Diferenças para extract_fields_from_text: sem re-prompt (uma linha inválida
+vai para revisão) e sem cache. O cliente vem de `get_batch_client()`; offline
+e nos testes, use extraction.fake_batch.FakeBatchClient.
+"""
+import json
+import logging
+
+from pydantic import ValidationError
+
+from . import ai_wrapper
+from .prompts import compile_prompt
+
+logger = logging.getLogger(__name__)
+
+ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+CUSTOM_ID_PREFIX = "email-"
+
+
+def get_batch_client():
+    """Cliente com os endpoints `files` e `batches` (o mesmo cliente síncrono da OpenAI)."""
+    return ai_wrapper.get_client()
+
+
+def custom_id_for(email_id) -> str:
+    return f"{CUSTOM_ID_PREFIX}{email_id}"
+
+
+def email_id_from(custom_id):
+    """Id do email de um custom_id ("email-123" -> 123); None se não for nosso."""
+    if not custom_id or not custom_id.startswith(CUSTOM_ID_PREFIX):
+        return None
+    try:
+        return int(custom_id[len(CUSTOM_ID_PREFIX):])
+    except ValueError:
+        return None
+
+
+# ----------------- Entrada (JSONL) -----------------
+def request_line(custom_id, text, schema, prompt_template, today=None) -> dict:
+    """Uma linha do JSONL: a mesma requisição que o modo imediato faria."""
+    compiled = compile_prompt(schema, prompt_template)
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": ENDPOINT,
+        "body": ai_wrapper._request(compiled.system, compiled.user_message(text, today)),
+    }
+
+
+def submit(lines, metadata=None):
+    """Envia o arquivo JSONL e cria o lote; retorna o objeto Batch da OpenAI."""
+    client = get_batch_client()
+    payload = "\n".join(json.dumps(line, ensure_ascii=False) for line in lines).encode("utf-8")
+    input_file = client.files.create(file=("extraction_batch.jsonl", payload), purpose="batch")
+    return client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=ENDPOINT,
+        completion_window=COMPLETION_WINDOW,
+        metadata=metadata or {},
+    )
+
+
+def retrieve(batch_id):
+    return get_batch_client().batches.retrieve(batch_id)
+
+
+# ----------------- Saída -----------------
+def read_results(file_id) -> dict:
+    """
+    Lê um arquivo de saída (ou de erros) do lote:
+    {custom_id: conteúdo da resposta (str) ou None se a requisição falhou}.
+    """
+    results = {}
+    for raw in get_batch_client().files.content(file_id).text.splitlines():
+        if not raw.strip():
+            continue
+        line = json.loads(raw)
+        custom_id = line.get("custom_id")
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            logger.error(f"Lote: requisição {custom_id} falhou: {line.get('error') or response.get('status_code')}")
+            results[custom_id] = None
+            continue
+        try:
+            results[custom_id] = response["body"]["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            logger.error(f"Lote: resposta de {custom_id} sem conteúdo.")
+            results[custom_id] = None
+    return results
+
+
+def validate(content, schema) -> dict | None:
+    """Valida o conteúdo de uma linha contra o schema; None se inválido."""
+    if content is None:
+        return None
+    try:
+        return schema.model_validate_json(content).model_dump(mode='json')
+    except ValidationError as e:
+        logger.error(f"Lote: resposta inválida para o schema {schema.__name__}. Erro: {e}")
+        return None
@@ -0,0 +1,135 @@
+"""
+Cache persistente de resultados de extração (tabela ExtractionCacheEntry).
+
+Reprocessamentos, o mesmo aviso entregue em várias caixas e o push do
+tribunal encaminhado duas vezes chamavam a OpenAI de novo para a mesma
+entrada. A chave é o SHA-256 de:
+- texto de entrada normalizado (espaços colapsados)
+- JSON Schema do schema Pydantic
+- prompt compilado (impressão digital do system, extraction/prompts.py)
+  e, se o template usa {data_atual}, a data atual: o mesmo email no dia
+  seguinte é outra entrada, prazos relativos mudam
+- modelo (AI_MODEL)
+
+Só resultados válidos são guardados. Entradas vencem em
+EXTRACTION_CACHE_TTL_SECONDS; acima de EXTRACTION_CACHE_MAX_ENTRIES as
+menos usadas recentemente são removidas (poda a cada
+EXTRACTION_CACHE_PRUNE_EVERY gravações do processo).
+"""
+import json
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = bool(getattr(settings, "EXTRACTION_CACHE_ENABLED", True))
+CACHE_TTL = timedelta(seconds=int(getattr(settings, "EXTRACTION_CACHE_TTL_SECONDS", 30 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(getattr(settings, "EXTRACTION_CACHE_MAX_ENTRIES", 50000))
+PRUNE_EVERY = int(getattr(settings, "EXTRACTION_CACHE_PRUNE_EVERY", 100))
+
+# Contadores do processo (acertos/erros/gravações), ver cache_stats(); vão
+# para o log ao fim de cada bloco (process_email_batch, claim worker)
+_stats = {"hits": 0, "misses": 0, "stores": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+        return _stats[name]
+
+
+def cache_stats() -> dict:
+    """Contadores do processo: {hits, misses, stores, hit_ratio}."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    return stats
+
+
+def describe_cache_stats() -> str:
+    """Resumo de cache_stats() para o log dos workers."""
+    stats = cache_stats()
+    return (
+        f"cache de extração: {stats['hits']} acerto(s), {stats['misses']} erro(s), "
+        f"{stats['stores']} gravação(ões), {stats['hit_ratio']:.0%} de acerto"
+    )
+
+
+def normalize_input(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+def cache_key(text: str, schema_json: dict, prompt: str, model: str) -> str:
+    payload = json.dumps(
+        [normalize_input(text), schema_json, prompt, model],
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_cached(key: str):
+    """Resultado guardado para a chave (e registra o acerto), ou None."""
+    from extraction.models import ExtractionCacheEntry  # evita import circular
+
+    if not CACHE_ENABLED:
+        return None
+    now = timezone.now()
+    try:
+        entry = ExtractionCacheEntry.objects.filter(key=key, expires_at__gt=now).values("id", "result").first()
+        if entry is not None:
+            ExtractionCacheEntry.objects.filter(pk=entry["id"]).update(hits=F("hits") + 1, last_hit_at=now)
+    except Exception as e:
+        logger.warning("Falha ao ler cache de extração (%s...): %s", key[:12], e)
+        entry = None
+    if entry is None:
+        _count("misses")
+        return None
+    _count("hits")
+    return entry["result"]
+
+
+def store(key: str, result: dict, schema_name: str, model: str) -> None:
+    from extraction.models import ExtractionCacheEntry  # evita import circular
+
+    if not CACHE_ENABLED:
+        return
+    now = timezone.now()
+    try:
+        ExtractionCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={"result": result, "schema_name": schema_name, "model": model, "expires_at": now + CACHE_TTL},
+        )
+    except Exception as e:
+        # cache é otimização: falha ao gravar não derruba a extração
+        logger.warning("Falha ao gravar cache de extração (%s...): %s", key[:12], e)
+        return
+    if _count("stores") % PRUNE_EVERY == 0:
+        prune(now)
+
+
+def prune(now=None) -> int:
+    """Remove entradas vencidas e, acima do limite, as menos usadas recentemente."""
+    from extraction.models import ExtractionCacheEntry  # evita import circular
+
+    now = now or timezone.now()
+    removed, _detail = ExtractionCacheEntry.objects.filter(expires_at__lte=now).delete()
+    excess = ExtractionCacheEntry.objects.count() - CACHE_MAX_ENTRIES
+    if excess > 0:
+        stale = list(
+            ExtractionCacheEntry.objects.annotate(used_at=Coalesce("last_hit_at", "created_at"))
+            .order_by("used_at", "id")
+            .values_list("id", flat=True)[:excess]
+        )
+        removed += ExtractionCacheEntry.objects.filter(pk__in=stale).delete()[0]
+    if removed:
+        logger.info("Cache de extração: %s entrada(s) removida(s).", removed)
+    return removed
@@ -0,0 +1,110 @@
+"""
+Stand-in local dos endpoints da Batch API usados em extraction/batch.py
+(`files.create`, `files.content`, `batches.create`, `batches.retrieve`).
+
+Guarda os arquivos em memória e responde cada linha do JSONL com
+`responder(body) -> str` (conteúdo da mensagem do assistente); uma exceção
+no responder vira linha no arquivo de erros. O lote fica `in_progress` nas
+primeiras `polls_until_complete` consultas e então completa.
+
+    client = FakeBatchClient(lambda body: json.dumps({...}))
+    with mock.patch("extraction.batch.get_batch_client", return_value=client):
+        ...
+"""
+import json
+import itertools
+from types import SimpleNamespace
+
+
+class _Files:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, file, purpose):
+        _name, payload = file
+        file_id = self._owner._new_id("file")
+        self._owner.stored[file_id] = payload.decode("utf-8") if isinstance(payload, bytes) else payload
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    def content(self, file_id):
+        return SimpleNamespace(text=self._owner.stored[file_id])
+
+
+class _Batches:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, input_file_id, endpoint, completion_window, metadata=None):
+        batch_id = self._owner._new_id("batch")
+        self._owner.batches_state[batch_id] = {
+            "input_file_id": input_file_id, "endpoint": endpoint, "polls": 0,
+            "status": "validating", "output_file_id": None, "error_file_id": None,
+        }
+        return self._view(batch_id)
+
+    def retrieve(self, batch_id):
+        state = self._owner.batches_state[batch_id]
+        state["polls"] += 1
+        if state["status"] not in ("completed", "failed", "expired", "cancelled"):
+            if state["polls"] > self._owner.polls_until_complete:
+                self._owner._complete(batch_id)
+            else:
+                state["status"] = "in_progress"
+        return self._view(batch_id)
+
+    def _view(self, batch_id):
+        state = self._owner.batches_state[batch_id]
+        return SimpleNamespace(
+            id=batch_id, status=state["status"], input_file_id=state["input_file_id"],
+            output_file_id=state["output_file_id"], error_file_id=state["error_file_id"],
+        )
+
+
+class FakeBatchClient:
+    """Cliente falso da Batch API (em memória), para testes e desenvolvimento offline."""
+
+    def __init__(self, responder, polls_until_complete=1, final_status="completed"):
+        self.responder = responder
+        self.polls_until_complete = polls_until_complete
+        self.final_status = final_status
+        self.stored = {}
+        self.batches_state = {}
+        self._ids = itertools.count(1)
+        self.files = _Files(self)
+        self.batches = _Batches(self)
+
+    def _new_id(self, prefix):
+        return f"{prefix}_fake{next(self._ids)}"
+
+    def requests(self, batch_id):
+        """Linhas (dict) do JSONL de entrada de um lote."""
+        text = self.stored[self.batches_state[batch_id]["input_file_id"]]
+        return [json.loads(raw) for raw in text.splitlines() if raw.strip()]
+
+    def _complete(self, batch_id):
+        state = self.batches_state[batch_id]
+        state["status"] = self.final_status
+        if self.final_status != "completed":
+            return
+        output, errors = [], []
+        for i, line in enumerate(self.requests(batch_id)):
+            try:
+                content = self.responder(line["body"])
+            except Exception as e:
+                errors.append({
+                    "id": f"batch_req_{i}", "custom_id": line["custom_id"], "response": None,
+                    "error": {"code": "server_error", "message": str(e)},
+                })
+                continue
+            output.append({
+                "id": f"batch_req_{i}", "custom_id": line["custom_id"], "error": None,
+                "response": {"status_code": 200, "body": {
+                    "object": "chat.completion", "model": line["body"].get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+                }},
+            })
+        for key, lines in (("output_file_id", output), ("error_file_id", errors)):
+            if lines:
+                state[key] = self.files.create(
+                    file=(f"{key}.jsonl", "\n".join(json.dumps(line) for line in lines)), purpose="batch_output",
+                ).id
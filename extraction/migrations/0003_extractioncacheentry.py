@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extraction', '0002_extractionprofile_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractionCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='Hash da entrada (SHA-256)')),
+                ('model', models.CharField(max_length=100, verbose_name='Modelo da IA')),
+                ('schema_name', models.CharField(max_length=100, verbose_name='Schema Pydantic')),
+                ('result', models.JSONField(verbose_name='Dados extraídos (JSON validado)')),
+                ('hits', models.IntegerField(default=0, verbose_name='Acertos no cache')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Cache de Extração',
+                'verbose_name_plural': 'Cache de Extrações',
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0015_emailstatus_batched'),
+        ('extraction', '0003_extractioncacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractionBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(blank=True, max_length=100, null=True, unique=True, verbose_name='ID do Batch (OpenAI)')),
+                ('input_file_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('output_file_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('error_file_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('status', models.CharField(db_index=True, default='submitting', max_length=20)),
+                ('model', models.CharField(max_length=100, verbose_name='Modelo da IA')),
+                ('request_count', models.IntegerField(default=0, verbose_name='Requisições')),
+                ('succeeded', models.IntegerField(default=0, verbose_name='Extraídos')),
+                ('failed', models.IntegerField(default=0, verbose_name='Falhas (revisão)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Lote de Extração (Batch API)',
+                'verbose_name_plural': 'Lotes de Extração (Batch API)',
+            },
+        ),
+        migrations.AddField(
+            model_name='extractionprofile',
+            name='execution_mode',
+            field=models.CharField(choices=[('SYNC', 'Imediato (chamada síncrona)'), ('BATCH', 'Lote (OpenAI Batch API, até 24h, custo menor)')], default='SYNC', help_text='Lote: os emails são acumulados e enviados à Batch API da OpenAI (resposta em até 24h). Emails urgentes continuam no modo imediato.', max_length=10, verbose_name='Modo de Execução'),
+        ),
+        migrations.CreateModel(
+            name='ExtractionBatchItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='extraction.extractionbatch')),
+                ('email', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='batch_item', to='emails.emailmessage')),
+            ],
+            options={
+                'verbose_name': 'Email no Lote',
+                'verbose_name_plural': 'Emails no Lote',
+            },
+        ),
+    ]
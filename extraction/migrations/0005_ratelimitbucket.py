@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 01:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extraction', '0004_extraction_batch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, unique=True, verbose_name='Modelo da IA')),
+                ('requests', models.FloatField(verbose_name='Requisições disponíveis')),
+                ('tokens', models.FloatField(verbose_name='Tokens disponíveis')),
+                ('updated_at', models.DateTimeField(verbose_name='Última recarga')),
+                ('blocked_until', models.DateTimeField(blank=True, null=True, verbose_name='Pausado até')),
+            ],
+            options={
+                'verbose_name': 'Limite de Taxa (OpenAI)',
+                'verbose_name_plural': 'Limites de Taxa (OpenAI)',
+            },
+        ),
+    ]
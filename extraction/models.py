@@ -6,6 +6,13 @@ from django.contrib.auth import get_user_model
 
 
 User = get_user_model()
+
+
+class ExecutionMode(models.TextChoices):
+    SYNC = 'SYNC', 'Imediato (chamada síncrona)'
+    BATCH = 'BATCH', 'Lote (OpenAI Batch API, até 24h, custo menor)'
+
+
 # NOVO MODELO: Para definir dinamicamente o prompt e a função da IA
 class ExtractionProfile(models.Model):
     """
@@ -36,6 +43,16 @@ class ExtractionProfile(models.Model):
         help_text="Nome da classe do schema em extraction.schemas (Ex: ProcessoJuridicoSchema)."
     )
 
+    # Perfis sem urgência (intake em massa, backfill) vão pela Batch API (tasks/batch_worker.py)
+    execution_mode = models.CharField(
+        max_length=10,
+        choices=ExecutionMode.choices,
+        default=ExecutionMode.SYNC,
+        verbose_name="Modo de Execução",
+        help_text="Lote: os emails são acumulados e enviados à Batch API da OpenAI (resposta em até 24h). "
+                  "Emails urgentes continuam no modo imediato.",
+    )
+
     class Meta:
         verbose_name = "Perfil de Extração (Prompt)"
         verbose_name_plural = "Perfis de Extração (Prompts)"
@@ -43,4 +60,87 @@ class ExtractionProfile(models.Model):
     def __str__(self):
         return self.name
 
+
+class ExtractionCacheEntry(models.Model):
+    """
+    Resultado de extração já validado, reaproveitado para a mesma entrada
+    (texto normalizado + schema + prompt renderizado + modelo).
+    Ver extraction/cache.py.
+    """
+    key = models.CharField(max_length=64, unique=True, verbose_name="Hash da entrada (SHA-256)")
+    model = models.CharField(max_length=100, verbose_name="Modelo da IA")
+    schema_name = models.CharField(max_length=100, verbose_name="Schema Pydantic")
+    result = models.JSONField(verbose_name="Dados extraídos (JSON validado)")
+    hits = models.IntegerField(default=0, verbose_name="Acertos no cache")
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Cache de Extração"
+        verbose_name_plural = "Cache de Extrações"
+
+    def __str__(self):
+        return f'{self.schema_name} ({self.model}) - {self.hits} acerto(s)'
+
+class ExtractionBatch(models.Model):
+    """
+    Lote enviado à Batch API da OpenAI: um arquivo JSONL com uma requisição
+    por email (custom_id "email-<id>"). Ver tasks/batch_worker.py.
+    """
+    # Status da OpenAI (validating, in_progress, finalizing, completed, failed, expired, cancelling,
+    # cancelled) e "submitting" enquanto o arquivo ainda não foi enviado
+    ACTIVE_STATUSES = ('submitting', 'validating', 'in_progress', 'finalizing', 'cancelling')
+
+    batch_id = models.CharField(max_length=100, null=True, blank=True, unique=True, verbose_name="ID do Batch (OpenAI)")
+    input_file_id = models.CharField(max_length=100, null=True, blank=True)
+    output_file_id = models.CharField(max_length=100, null=True, blank=True)
+    error_file_id = models.CharField(max_length=100, null=True, blank=True)
+    status = models.CharField(max_length=20, default='submitting', db_index=True)
+    model = models.CharField(max_length=100, verbose_name="Modelo da IA")
+    request_count = models.IntegerField(default=0, verbose_name="Requisições")
+    succeeded = models.IntegerField(default=0, verbose_name="Extraídos")
+    failed = models.IntegerField(default=0, verbose_name="Falhas (revisão)")
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Lote de Extração (Batch API)"
+        verbose_name_plural = "Lotes de Extração (Batch API)"
+
+    def __str__(self):
+        return f'{self.batch_id or "(não enviado)"} [{self.status}] - {self.request_count} email(s)'
+
+
+class ExtractionBatchItem(models.Model):
+    """
+    Email (BATCHED) enviado num lote. Um email está em no máximo um lote
+    ativo; os itens são apagados quando o resultado do lote é aplicado.
+    """
+    batch = models.ForeignKey(ExtractionBatch, on_delete=models.CASCADE, related_name='items')
+    email = models.OneToOneField('emails.EmailMessage', on_delete=models.CASCADE, related_name='batch_item')
+
+    class Meta:
+        verbose_name = "Email no Lote"
+        verbose_name_plural = "Emails no Lote"
+
+class RateLimitBucket(models.Model):
+    """
+    Baldes de tokens (requisições e tokens estimados) de um modelo da
+    OpenAI, compartilhados por todos os workers e nós. Ver extraction/rate_limit.py.
+    """
+    model = models.CharField(max_length=100, unique=True, verbose_name="Modelo da IA")
+    requests = models.FloatField(verbose_name="Requisições disponíveis")
+    tokens = models.FloatField(verbose_name="Tokens disponíveis")
+    updated_at = models.DateTimeField(verbose_name="Última recarga")
+    # 429 da OpenAI (Retry-After): ninguém chama o modelo antes disso
+    blocked_until = models.DateTimeField(null=True, blank=True, verbose_name="Pausado até")
+
+    class Meta:
+        verbose_name = "Limite de Taxa (OpenAI)"
+        verbose_name_plural = "Limites de Taxa (OpenAI)"
+
+    def __str__(self):
+        return f'{self.model}: {self.requests:.1f} req / {self.tokens:.0f} tokens'
+
 # Create your models here.
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""
+Prompts compilados por (template do perfil, schema).
+
+Antes, cada chamada refazia `schema.model_json_schema()` + `json.dumps` e o
+prompt do perfil ia formatado com a data na mensagem do usuário, antes do
+email: o prefixo mudava todo dia e não era compartilhado entre perfis.
+
+Agora o layout é estável e amigo do cache de prefixo do provedor:
+
+    system: instruções fixas + JSON Schema minimizado + template do perfil
+            (byte a byte igual entre chamadas; {data_atual} vira [DATA ATUAL])
+    user:   DATA ATUAL + texto do email (a parte volátil, sempre no fim)
+
+O JSON Schema minimizado (sem `title`, separadores compactos) é calculado
+uma vez por schema; o prompt compilado fica em cache (LRU) pela dupla
+(schema, template): editar o perfil gera um novo, sem invalidação manual.
+"""
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+PROMPT_CACHE_SIZE = int(getattr(settings, "PROMPT_COMPILE_CACHE_SIZE", 256))
+
+DATE_PLACEHOLDER = "{data_atual}"
+DATE_TOKEN = "[DATA ATUAL]"
+
+BASE_INSTRUCTIONS = (
+    "Você é um extrator de dados altamente eficiente. Sua única tarefa é analisar o texto "
+    "fornecido e retornar os dados estritamente no formato JSON, conforme o schema abaixo. "
+    "Se não for possível preencher um campo, use `null` ou um valor padrão razoável."
+)
+
+
+# ----------------- Schema minimizado -----------------
+def minimize_schema(node, field_names=False):
+    """
+    Remove `title` (redundante com o nome do campo/definição) em todos os
+    níveis. Em `properties`/`$defs` as chaves são nomes de campo/definição
+    e ficam (um campo pode se chamar "title").
+    """
+    if isinstance(node, list):
+        return [minimize_schema(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    minimized = {}
+    for key, value in node.items():
+        if field_names:
+            minimized[key] = minimize_schema(value)
+        elif key != "title":
+            minimized[key] = minimize_schema(value, field_names=key in ("properties", "$defs"))
+    return minimized
+
+
+_schema_cache = {}
+_schema_lock = threading.Lock()
+
+
+def compiled_schema(schema) -> str:
+    """JSON Schema minimizado e serializado (uma vez por classe de schema)."""
+    with _schema_lock:
+        cached = _schema_cache.get(schema)
+    if cached is None:
+        cached = json.dumps(minimize_schema(schema.model_json_schema()), ensure_ascii=False, separators=(",", ":"))
+        with _schema_lock:
+            _schema_cache[schema] = cached
+    return cached
+
+
+# ----------------- Prompt compilado -----------------
+class CompiledPrompt:
+    """Parte estática do prompt de um (schema, template) e montagem das mensagens."""
+
+    __slots__ = ("schema", "schema_json", "system", "fingerprint", "uses_date")
+
+    def __init__(self, schema, template):
+        self.schema = schema
+        self.schema_json = compiled_schema(schema)
+        # só templates com {data_atual} dependem do dia (e separam o cache por data)
+        self.uses_date = DATE_PLACEHOLDER in (template or "")
+        instructions = (template or "").replace(DATE_PLACEHOLDER, DATE_TOKEN).replace("{{", "{").replace("}}", "}")
+        self.system = f"{BASE_INSTRUCTIONS}\n\nSCHEMA JSON: {self.schema_json}\n\n{instructions}".rstrip()
+        self.fingerprint = hashlib.sha256(self.system.encode("utf-8")).hexdigest()
+
+    def user_message(self, text, today=None) -> str:
+        """Parte volátil: data (se houver) e o texto do email, sempre depois do prefixo fixo."""
+        header = f"{DATE_TOKEN}: {today}\n\n" if today else ""
+        return f"{header}TEXTO DE ENTRADA:\n---\n{text}"
+
+    def messages(self, text, today=None) -> list:
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user_message(text, today)},
+        ]
+
+
+_prompt_cache = OrderedDict()
+_prompt_lock = threading.Lock()
+
+
+def compile_prompt(schema, template) -> CompiledPrompt:
+    """Prompt compilado para o schema + template (cache LRU por conteúdo)."""
+    key = (schema, template or "")
+    with _prompt_lock:
+        if key in _prompt_cache:
+            _prompt_cache.move_to_end(key)
+            return _prompt_cache[key]
+    compiled = CompiledPrompt(schema, template)
+    with _prompt_lock:
+        _prompt_cache[key] = compiled
+        while len(_prompt_cache) > PROMPT_CACHE_SIZE:
+            _prompt_cache.popitem(last=False)
+    return compiled
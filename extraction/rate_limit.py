@@ -0,0 +1,203 @@
+"""
+Limite de taxa da OpenAI compartilhado entre workers e nós (tabela RateLimitBucket).
+
+Cada worker chamava a OpenAI por conta própria: numa rajada, 429 em série
+e emails indo direto para revisão. Agora, antes de cada chamada:
+
+- `acquire(model, tokens)` tira 1 requisição e os tokens estimados de dois
+  baldes por modelo (RPM e TPM, recarga contínua; rajada de até
+  OPENAI_RATE_LIMIT_BURST_SECONDS de limite). Sem saldo, espera o tempo
+  exato da recarga. O saldo fica no banco (SELECT ... FOR UPDATE), então
+  vale para o cluster inteiro.
+- Um 429 com `Retry-After` pausa o modelo para todos (`penalize`), não só
+  para quem recebeu. Retentativas de 429/5xx/conexão usam o Retry-After ou
+  backoff exponencial, sempre com jitter (`backoff_delay`).
+- Sem vaga em RATE_LIMIT_MAX_WAIT_SECONDS (ou 429/5xx persistente), sobe
+  `RateLimited`: o pipeline devolve o email para PENDING (claim worker) em
+  vez de marcá-lo para revisão.
+
+Limites: OPENAI_RPM / OPENAI_TPM, por modelo em OPENAI_RATE_LIMITS.
+"""
+import time
+import random
+import asyncio
+import logging
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ENABLED = bool(getattr(settings, "OPENAI_RATE_LIMIT_ENABLED", True))
+DEFAULT_RPM = float(getattr(settings, "OPENAI_RPM", 500))
+DEFAULT_TPM = float(getattr(settings, "OPENAI_TPM", 200000))
+MODEL_LIMITS = getattr(settings, "OPENAI_RATE_LIMITS", {}) or {}
+BURST_SECONDS = float(getattr(settings, "OPENAI_RATE_LIMIT_BURST_SECONDS", 10))
+MAX_WAIT = float(getattr(settings, "RATE_LIMIT_MAX_WAIT_SECONDS", 300))
+# Retentativas de 429/5xx/conexão (separadas das de re-prompt por JSON inválido)
+MAX_TRANSIENT_RETRIES = int(getattr(settings, "OPENAI_MAX_TRANSIENT_RETRIES", 5))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# Resposta do modelo reservada no balde de tokens (o prompt é estimado pelo tamanho)
+OUTPUT_TOKENS_ESTIMATE = int(getattr(settings, "OPENAI_OUTPUT_TOKENS_ESTIMATE", 800))
+
+_known_buckets = set()
+
+
+class RateLimited(Exception):
+    """A OpenAI não tem capacidade agora (limite do cluster, 429 ou 5xx persistentes)."""
+
+
+def limits_for(model) -> tuple:
+    """(rpm, tpm) do modelo."""
+    limits = MODEL_LIMITS.get(model, {})
+    return float(limits.get("rpm", DEFAULT_RPM)), float(limits.get("tpm", DEFAULT_TPM))
+
+
+def estimate_tokens(messages) -> int:
+    """Estimativa conservadora: ~4 caracteres por token no prompt + resposta reservada."""
+    chars = sum(len(m.get("content") or "") for m in messages)
+    return chars // 4 + OUTPUT_TOKENS_ESTIMATE
+
+
+# ----------------- Baldes -----------------
+def _capacity(per_minute):
+    return max(1.0, per_minute * BURST_SECONDS / 60)
+
+
+def _ensure_bucket(model, now):
+    if model in _known_buckets:
+        return
+    from extraction.models import RateLimitBucket  # evita import circular
+
+    rpm, tpm = limits_for(model)
+    try:
+        with transaction.atomic():
+            RateLimitBucket.objects.get_or_create(
+                model=model,
+                defaults={"requests": _capacity(rpm), "tokens": _capacity(tpm), "updated_at": now},
+            )
+    except IntegrityError:
+        pass  # outro worker criou ao mesmo tempo
+    _known_buckets.add(model)
+
+
+def try_acquire(model, tokens, now=None) -> float:
+    """
+    Tenta reservar 1 requisição + `tokens`. Retorna 0 se conseguiu; senão,
+    quantos segundos esperar antes de tentar de novo (nada é reservado).
+    """
+    from extraction.models import RateLimitBucket  # evita import circular
+
+    if not ENABLED:
+        return 0.0
+    now = now or timezone.now()
+    _ensure_bucket(model, now)
+    rpm, tpm = limits_for(model)
+    cap_requests, cap_tokens = _capacity(rpm), _capacity(tpm)
+    # pedido maior que o balde inteiro passaria nunca: limita ao balde cheio
+    tokens = min(float(tokens), cap_tokens)
+
+    with transaction.atomic():
+        bucket = RateLimitBucket.objects.select_for_update().filter(model=model).first()
+        if bucket is None:
+            # apagado pelo Admin (ou banco recriado): recria cheio
+            _known_buckets.discard(model)
+            _ensure_bucket(model, now)
+            bucket = RateLimitBucket.objects.select_for_update().get(model=model)
+        if bucket.blocked_until and bucket.blocked_until > now:
+            return (bucket.blocked_until - now).total_seconds()
+
+        elapsed = max(0.0, (now - bucket.updated_at).total_seconds())
+        requests = min(cap_requests, bucket.requests + elapsed * rpm / 60)
+        available = min(cap_tokens, bucket.tokens + elapsed * tpm / 60)
+        if requests >= 1 and available >= tokens:
+            requests, available, wait = requests - 1, available - tokens, 0.0
+        else:
+            wait = max(
+                (1 - requests) * 60 / rpm if requests < 1 else 0.0,
+                (tokens - available) * 60 / tpm if available < tokens else 0.0,
+            )
+        RateLimitBucket.objects.filter(pk=bucket.pk).update(requests=requests, tokens=available, updated_at=now)
+    return wait
+
+
+def _jitter(wait):
+    # espalha quem acordaria junto (vários workers esperando o mesmo balde)
+    return wait + random.uniform(0, min(1.0, wait * 0.1))
+
+
+def acquire(model, tokens, max_wait=None) -> float:
+    """Espera (bloqueando) até conseguir a reserva; retorna o tempo esperado. Sobe RateLimited."""
+    max_wait = MAX_WAIT if max_wait is None else max_wait
+    waited = 0.0
+    while True:
+        wait = try_acquire(model, tokens)
+        if not wait:
+            return waited
+        if waited + wait > max_wait:
+            raise RateLimited(f"Sem capacidade em {model} por {max_wait:.0f}s (limite de taxa do cluster).")
+        wait = _jitter(wait)
+        time.sleep(wait)
+        waited += wait
+
+
+async def aacquire(model, tokens, max_wait=None) -> float:
+    """Versão assíncrona de `acquire` (o banco roda via sync_to_async)."""
+    max_wait = MAX_WAIT if max_wait is None else max_wait
+    waited = 0.0
+    while True:
+        wait = await sync_to_async(try_acquire)(model, tokens)
+        if not wait:
+            return waited
+        if waited + wait > max_wait:
+            raise RateLimited(f"Sem capacidade em {model} por {max_wait:.0f}s (limite de taxa do cluster).")
+        wait = _jitter(wait)
+        await asyncio.sleep(wait)
+        waited += wait
+
+
+# ----------------- 429 / Retry-After -----------------
+def retry_after(error):
+    """Segundos pedidos pela OpenAI (`retry-after-ms` ou `retry-after`); None se ausente."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, (parsedate_to_datetime(value) - timezone.now()).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(error, attempt) -> float:
+    """Espera antes da retentativa `attempt` (1, 2, ...): Retry-After + jitter, ou exponencial com jitter."""
+    requested = retry_after(error)
+    if requested is not None:
+        return requested + random.uniform(0, max(0.5, requested * 0.1))
+    ceiling = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def penalize(model, seconds, now=None) -> None:
+    """Pausa o modelo para o cluster inteiro por `seconds` (429)."""
+    from extraction.models import RateLimitBucket  # evita import circular
+
+    if not ENABLED or seconds <= 0:
+        return
+    now = now or timezone.now()
+    until = now + timedelta(seconds=seconds)
+    _ensure_bucket(model, now)
+    RateLimitBucket.objects.filter(model=model).filter(
+        Q(blocked_until__isnull=True) | Q(blocked_until__lt=until),
+    ).update(blocked_until=until)
@@ -1,3 +1,189 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import openai
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from extraction import cache as extraction_cache
+from extraction import rate_limit
+from extraction.ai_wrapper import extract_fields_from_text
+from extraction.models import ExtractionCacheEntry, RateLimitBucket
+from extraction.prompts import compile_prompt, compiled_schema, minimize_schema
+from extraction.schemas import ProcessoJuridicoSchema, ServiceOrderSchema
+
+RESULT = {
+    'document_type': 'MOVIMENTACAO_PROCESSUAL', 'confidence_score': 90,
+    'numero_processo': '0000001-00.2025.8.26.0100', 'tipo_movimentacao': 'Intimação',
+    'resumo_movimentacao': 'Intimação para manifestação.', 'prazo_fatal': '2025-11-10',
+    'sugestao_proximo_passo': 'Dar ciência',
+}
+
+
+def _fake_client(content):
+    response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+    client = mock.Mock()
+    client.chat.completions.create.return_value = response
+    return client
+
+
+class ExtractionCacheTests(TestCase):
+    """
+    Testes do cache persistente de extrações (extraction.cache).
+    """
+
+    def _extract(self, text, prompt='Hoje é 01/10/2025.'):
+        return extract_fields_from_text(text=text, schema=ProcessoJuridicoSchema, prompt_template=prompt)
+
+    def test_identical_input_skips_the_model(self):
+        """Mesma entrada (a menos de espaços) vem do cache; prompt diferente chama a IA de novo."""
+        client = _fake_client(json.dumps(RESULT))
+        with mock.patch('extraction.ai_wrapper.get_client', return_value=client):
+            first = self._extract('Intimação no processo 0000001-00.2025.8.26.0100.')
+            second = self._extract('Intimação  no processo\n0000001-00.2025.8.26.0100. ')
+            self.assertEqual(client.chat.completions.create.call_count, 1)
+
+            self._extract('Intimação no processo 0000001-00.2025.8.26.0100.', prompt='Hoje é 02/10/2025.')
+            self.assertEqual(client.chat.completions.create.call_count, 2)
+
+        self.assertEqual(first, second)
+        self.assertEqual(ExtractionCacheEntry.objects.get(hits=1).result, first)
+
+    def test_date_only_splits_cache_when_template_uses_it(self):
+        """Reprocessar no dia seguinte acerta o cache se o template não usa {data_atual}."""
+        text = 'Intimação no processo 0000001-00.2025.8.26.0100.'
+        client = _fake_client(json.dumps(RESULT))
+        with mock.patch('extraction.ai_wrapper.get_client', return_value=client):
+            for today in ('01/10/2025', '02/10/2025'):
+                extract_fields_from_text(text=text, schema=ProcessoJuridicoSchema, prompt_template='Extraia.', today=today)
+            self.assertEqual(client.chat.completions.create.call_count, 1)
+
+            for today in ('01/10/2025', '02/10/2025'):
+                extract_fields_from_text(
+                    text=text, schema=ProcessoJuridicoSchema, prompt_template='Hoje é {data_atual}.', today=today,
+                )
+            self.assertEqual(client.chat.completions.create.call_count, 3)
+
+    def test_failed_extraction_is_not_cached(self):
+        client = _fake_client('{"document_type": "OUTRO"}')
+        with mock.patch('extraction.ai_wrapper.get_client', return_value=client):
+            self.assertIsNone(self._extract('texto qualquer'))
+
+        self.assertFalse(ExtractionCacheEntry.objects.exists())
+
+    def test_prune_removes_expired_and_least_recently_used(self):
+        now = timezone.now()
+        for i in range(4):
+            ExtractionCacheEntry.objects.create(
+                key=f'{i:064d}', model='m', schema_name='S', result={},
+                expires_at=now + timedelta(days=-1 if i == 0 else 1),
+                last_hit_at=now - timedelta(minutes=10 * i),
+            )
+
+        with mock.patch.object(extraction_cache, 'CACHE_MAX_ENTRIES', 2):
+            self.assertEqual(extraction_cache.prune(now), 2)
+
+        self.assertEqual(sorted(ExtractionCacheEntry.objects.values_list('key', flat=True)), [f'{1:064d}', f'{2:064d}'])
+
+
+class PromptCompilationTests(SimpleTestCase):
+    """
+    Testes do prompt compilado (extraction.prompts): prefixo fixo e schema minimizado.
+    """
+
+    def test_schema_is_minimized_once(self):
+        schema = minimize_schema({
+            'title': 'Modelo', 'type': 'object',
+            'properties': {'title': {'title': 'Title', 'type': 'string'}, 'n': {'title': 'N', 'type': 'integer'}},
+            '$defs': {'Sub': {'title': 'Sub', 'type': 'object'}},
+        })
+        self.assertEqual(schema, {
+            'type': 'object',
+            'properties': {'title': {'type': 'string'}, 'n': {'type': 'integer'}},
+            '$defs': {'Sub': {'type': 'object'}},
+        })
+
+        compiled = compiled_schema(ProcessoJuridicoSchema)
+        self.assertNotIn('"title"', compiled)
+        self.assertIn('"numero_processo"', compiled)
+        with mock.patch.object(ProcessoJuridicoSchema, 'model_json_schema') as model_json_schema:
+            compiled_schema(ProcessoJuridicoSchema)
+        model_json_schema.assert_not_called()
+
+    def test_static_prefix_and_volatile_tail(self):
+        """O system é idêntico entre dias; a data e o email vão só no fim da mensagem do usuário."""
+        template = 'Hoje é {data_atual}. Responda com {{"campo": ...}}.'
+        prompt = compile_prompt(ProcessoJuridicoSchema, template)
+
+        first = prompt.messages('corpo A', today='01/10/2025')
+        second = compile_prompt(ProcessoJuridicoSchema, template).messages('corpo B', today='02/10/2025')
+
+        self.assertIs(compile_prompt(ProcessoJuridicoSchema, template), prompt)
+        self.assertEqual(first[0], second[0])
+        self.assertTrue(first[0]['content'].endswith('Hoje é [DATA ATUAL]. Responda com {"campo": ...}.'))
+        self.assertNotIn('01/10/2025', first[0]['content'])
+        self.assertEqual(first[1]['content'], '[DATA ATUAL]: 01/10/2025\n\nTEXTO DE ENTRADA:\n---\ncorpo A')
+        # perfis diferentes com o mesmo schema compartilham o início do prefixo
+        other = compile_prompt(ProcessoJuridicoSchema, 'Outro perfil.')
+        self.assertTrue(other.system.startswith(prompt.system.split('Hoje é')[0]))
+        self.assertNotEqual(compile_prompt(ServiceOrderSchema, template).fingerprint, prompt.fingerprint)
+
+
+def _rate_limit_error(retry_after_ms='10', code=None):
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+    response = httpx.Response(429, headers={'retry-after-ms': retry_after_ms}, request=request)
+    return openai.RateLimitError('Rate limit reached', response=response, body={'code': code} if code else None)
+
+
+class RateLimitTests(TestCase):
+    """
+    Testes do limite de taxa compartilhado (extraction.rate_limit).
+    """
+
+    def test_bucket_refills_at_the_configured_rate(self):
+        """60 RPM com rajada de 2s: 2 chamadas passam, a 3ª espera ~1s; depois de 1s passa."""
+        now = timezone.now()
+        with mock.patch.object(rate_limit, 'DEFAULT_RPM', 60.0), mock.patch.object(rate_limit, 'BURST_SECONDS', 2.0):
+            self.assertEqual(rate_limit.try_acquire('m-rpm', 10, now), 0)
+            self.assertEqual(rate_limit.try_acquire('m-rpm', 10, now), 0)
+            self.assertAlmostEqual(rate_limit.try_acquire('m-rpm', 10, now), 1.0)
+            self.assertEqual(rate_limit.try_acquire('m-rpm', 10, now + timedelta(seconds=1)), 0)
+
+    def test_token_budget_and_cluster_pause(self):
+        now = timezone.now()
+        with mock.patch.object(rate_limit, 'DEFAULT_TPM', 6000.0):  # rajada de 10s = 1000 tokens
+            self.assertEqual(rate_limit.try_acquire('m-tpm', 800, now), 0)
+            self.assertAlmostEqual(rate_limit.try_acquire('m-tpm', 800, now), 6.0)
+
+        rate_limit.penalize('m-tpm', 30, now)
+        self.assertAlmostEqual(rate_limit.try_acquire('m-tpm', 1, now), 30.0)
+
+    @mock.patch('extraction.rate_limit.random.uniform', return_value=0)
+    def test_429_is_retried_after_retry_after(self, _uniform):
+        """429 com Retry-After: pausa o modelo para todos e tenta de novo, sem ir para revisão."""
+        client = _fake_client(json.dumps(RESULT))
+        client.chat.completions.create.side_effect = [_rate_limit_error(), client.chat.completions.create.return_value]
+        with mock.patch('extraction.ai_wrapper.get_client', return_value=client):
+            result = extract_fields_from_text(text='texto', schema=ProcessoJuridicoSchema, prompt_template='', use_cache=False)
+
+        self.assertEqual(result['numero_processo'], RESULT['numero_processo'])
+        self.assertEqual(client.chat.completions.create.call_count, 2)
+        self.assertIsNotNone(RateLimitBucket.objects.get().blocked_until)
+
+    @mock.patch('extraction.rate_limit.random.uniform', return_value=0)
+    def test_persistent_429_raises_rate_limited(self, _uniform):
+        client = _fake_client('{}')
+        client.chat.completions.create.side_effect = _rate_limit_error()
+        with mock.patch('extraction.ai_wrapper.get_client', return_value=client), \
+                mock.patch.object(rate_limit, 'MAX_TRANSIENT_RETRIES', 2):
+            with self.assertRaises(rate_limit.RateLimited):
+                extract_fields_from_text(text='texto', schema=ProcessoJuridicoSchema, prompt_template='', use_cache=False)
+        self.assertEqual(client.chat.completions.create.call_count, 3)
+
+        # sem crédito não adianta esperar: falha na hora (revisão)
+        client.chat.completions.create.side_effect = _rate_limit_error(code='insufficient_quota')
+        with mock.patch('extraction.ai_wrapper.get_client', return_value=client):
+            self.assertIsNone(extract_fields_from_text(text='x', schema=ProcessoJuridicoSchema, prompt_template='', use_cache=False))
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class TasksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tasks'
+
+    def ready(self):
+        # registra os signals que invalidam o cache do matcher de regras
+        from tasks import rule_matcher  # noqa: F401
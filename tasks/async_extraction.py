@@ -0,0 +1,81 @@
+"""
+Motor de extração concorrente (asyncio + AsyncOpenAI).
+
+Cada worker do Django-Q ficava bloqueado na chamada síncrona à OpenAI:
+com `workers: 4`, no máximo 4 emails em andamento, quase todo o tempo
+esperando a rede. Com EXTRACTION_ASYNC=True, um bloco (process_email_batch
+ou claim worker) faz as chamadas de todos os seus emails ao mesmo tempo,
+até EXTRACTION_ASYNC_CONCURRENCY em andamento por processo.
+
+- Preparação (claim, regra, perfil, redução do corpo) e gravação do
+  resultado são as mesmas do caminho síncrono (tasks.tasks).
+- A chamada é `aextract_fields_from_text`: mesmo contrato de
+  `extract_fields_from_text` (validação Pydantic, re-prompts, cache).
+- Todo acesso ao ORM roda via sync_to_async na thread do worker (mesma
+  conexão de banco); só a espera pela OpenAI é concorrente.
+
+O ganho depende do bloco: aumente PROCESS_EMAIL_BATCH_SIZE /
+EMAIL_CLAIM_BATCH_SIZE junto (e a reserva EMAIL_CLAIM_LEASE_SECONDS, que
+precisa cobrir o bloco inteiro).
+"""
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+
+from extraction.ai_wrapper import aextract_fields_from_text, close_async_client
+from extraction.rate_limit import RateLimited
+from tasks.tasks import _defer, _fail, _finish_extraction, _start_extraction
+
+logger = logging.getLogger(__name__)
+
+ENABLED = bool(getattr(settings, "EXTRACTION_ASYNC", False))
+# Chamadas à OpenAI em andamento ao mesmo tempo, por processo worker
+CONCURRENCY = max(1, int(getattr(settings, "EXTRACTION_ASYNC_CONCURRENCY", 16)))
+
+
+async def _extract_and_finish(job, semaphore):
+    email = job["email"]
+    try:
+        async with semaphore:
+            extracted_data = await aextract_fields_from_text(**job["extraction"])
+        return await sync_to_async(_finish_extraction)(job, extracted_data)
+    except RateLimited as e:
+        await sync_to_async(_defer)(email, e)
+        return email.status
+    except Exception as e:
+        await sync_to_async(_fail)(email, e)
+        return email.status
+
+
+async def _run_jobs(jobs, concurrency):
+    # semáforo criado dentro do loop que o usa
+    semaphore = asyncio.Semaphore(concurrency)
+    try:
+        return await asyncio.gather(*(_extract_and_finish(job, semaphore) for job in jobs))
+    finally:
+        await close_async_client()
+
+
+def process_emails_concurrently(emails, matchers, claimed=False, concurrency=None) -> dict:
+    """
+    Processa emails já carregados (na ordem dada: filas mais altas primeiro)
+    com as chamadas à IA em paralelo. Mesmo retorno do caminho síncrono:
+    {email_id: status_final}, None para emails já pegos por outro worker.
+    """
+    results, jobs = {}, []
+    for email in emails:
+        job, results[email.id] = _start_extraction(email, matchers[email.mailbox_id], claimed)
+        if job is not None:
+            jobs.append(job)
+
+    if jobs:
+        statuses = async_to_sync(_run_jobs)(jobs, concurrency or CONCURRENCY)
+        for job, status in zip(jobs, statuses):
+            results[job["email"].id] = status
+        logger.info(
+            "[async_extraction] %s extração(ões) com até %s chamada(s) simultânea(s).",
+            len(jobs), min(len(jobs), concurrency or CONCURRENCY),
+        )
+    return results
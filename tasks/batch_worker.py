@@ -0,0 +1,188 @@
+"""
+Modo lote: extrações pela Batch API da OpenAI (custo menor, resposta em até 24h).
+
+Perfis com `execution_mode = BATCH` (intake em massa, backfill) não ocupam
+workers esperando a OpenAI:
+
+1. O pipeline (tasks.tasks._start_extraction) casa a regra, reduz o corpo
+   e deixa o email em BATCHED. Urgentes continuam no modo imediato.
+2. `submit_waiting_emails` junta os BATCHED ainda sem lote num JSONL e
+   envia (quando há EXTRACTION_BATCH_MIN_REQUESTS emails ou o mais antigo
+   espera há EXTRACTION_BATCH_MAX_WAIT_SECONDS).
+3. `poll_batches` consulta os lotes ativos; terminado, valida cada linha
+   contra o schema do perfil e faz as transições de sempre
+   (BATCHED -> EXTRACTED -> INTEGRATED, ou REQUIRES_REVIEW).
+
+Lote expirado/cancelado: os emails sem resposta voltam para o próximo
+lote. Lote recusado (failed): os emails vão para revisão.
+`run_batch_cycle` faz 3 e depois 2; roda por Schedule do Django-Q
+(`manage.py process_extraction_batches --schedule N`).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from emails.models import EmailMessage, EmailStatus
+from extraction import batch as batch_api
+from extraction.ai_wrapper import AI_MODEL
+from extraction.models import ExtractionBatch, ExtractionBatchItem
+from tasks.tasks import SCHEMA_MAP, _fail, _finish_extraction, _move
+
+logger = logging.getLogger(__name__)
+
+MAX_REQUESTS = int(getattr(settings, "EXTRACTION_BATCH_MAX_REQUESTS", 1000))
+MIN_REQUESTS = int(getattr(settings, "EXTRACTION_BATCH_MIN_REQUESTS", 100))
+MAX_WAIT = timedelta(seconds=int(getattr(settings, "EXTRACTION_BATCH_MAX_WAIT_SECONDS", 3600)))
+# Lote criado mas não enviado (processo morreu no meio): libera os emails depois disso
+STALE_SUBMIT = timedelta(minutes=30)
+BATCH_FUNC = "tasks.batch_worker.run_batch_cycle"
+
+REQUEUE_STATUSES = ("expired", "cancelled")
+
+
+def _waiting():
+    return EmailMessage.objects.filter(status=EmailStatus.BATCHED, batch_item__isnull=True)
+
+
+def _profile_schema(email):
+    """(perfil, schema) da regra do email; schema None se o perfil não serve mais."""
+    profile = email.matched_rule.extraction_profile if email.matched_rule else None
+    return profile, SCHEMA_MAP.get(profile.pydantic_schema_name) if profile else None
+
+
+# ----------------- Envio -----------------
+def submit_waiting_emails(force=False, now=None):
+    """
+    Envia um lote com os emails BATCHED sem lote (filas mais altas primeiro).
+    Sem `force`, espera acumular MIN_REQUESTS ou o mais antigo passar de MAX_WAIT.
+    Retorna o ExtractionBatch criado ou None.
+    """
+    now = now or timezone.now()
+    waiting = _waiting()
+    oldest = waiting.order_by("updated_at").values_list("updated_at", flat=True).first()
+    if oldest is None:
+        return None
+    if not force and oldest > now - MAX_WAIT and waiting.count() < MIN_REQUESTS:
+        return None
+
+    ids = list(waiting.order_by("priority", "received_at", "id").values_list("id", flat=True)[:MAX_REQUESTS])
+    batch = ExtractionBatch.objects.create(model=AI_MODEL)
+    # cada email entra em um lote só (OneToOne): outro nó enviando ao mesmo tempo fica com o resto
+    ExtractionBatchItem.objects.bulk_create(
+        [ExtractionBatchItem(batch=batch, email_id=i) for i in ids], ignore_conflicts=True,
+    )
+
+    lines = []
+    today = now.strftime('%d/%m/%Y')
+    for email in EmailMessage.objects.filter(batch_item__batch=batch).select_related("matched_rule__extraction_profile"):
+        profile, schema_cls = _profile_schema(email)
+        if schema_cls is None:
+            # regra/perfil mudou desde que o email entrou na fila: volta para o fluxo normal
+            ExtractionBatchItem.objects.filter(email_id=email.id).delete()
+            _move(email, EmailStatus.PENDING, from_status=EmailStatus.BATCHED)
+            continue
+        lines.append(batch_api.request_line(
+            batch_api.custom_id_for(email.id), email.body_reduced or email.body_text,
+            schema_cls, profile.system_prompt_template, today,
+        ))
+    if not lines:
+        batch.delete()
+        return None
+
+    try:
+        remote = batch_api.submit(lines, metadata={"extraction_batch": str(batch.pk)})
+    except Exception as e:
+        # falha no envio: os emails ficam livres para o próximo ciclo
+        logger.error(f"Falha ao enviar lote de extração ({len(lines)} email(s)): {e}")
+        batch.delete()
+        return None
+
+    batch.batch_id = remote.id
+    batch.input_file_id = remote.input_file_id
+    batch.status = remote.status
+    batch.request_count = len(lines)
+    batch.save(update_fields=["batch_id", "input_file_id", "status", "request_count"])
+    logger.info(f"Lote de extração {remote.id} enviado com {len(lines)} email(s).")
+    return batch
+
+
+# ----------------- Consulta e resultado -----------------
+def _release_stale_submissions(now):
+    for batch in ExtractionBatch.objects.filter(status="submitting", batch_id=None, created_at__lt=now - STALE_SUBMIT):
+        logger.warning(f"Lote {batch.pk} nunca foi enviado; emails liberados para o próximo lote.")
+        batch.delete()
+
+
+def _apply_results(batch, remote) -> dict:
+    """Valida as linhas do lote terminado e move cada email; apaga os itens."""
+    results = {}
+    for file_id in (remote.error_file_id, remote.output_file_id):
+        if file_id:
+            results.update(batch_api.read_results(file_id))
+
+    counts = {"extracted": 0, "review": 0, "requeued": 0}
+    emails = EmailMessage.objects.filter(
+        batch_item__batch=batch, status=EmailStatus.BATCHED,
+    ).select_related("mailbox", "matched_rule__extraction_profile")
+    for email in emails:
+        custom_id = batch_api.custom_id_for(email.id)
+        if custom_id not in results and remote.status in REQUEUE_STATUSES:
+            # sem resposta num lote expirado/cancelado: entra no próximo lote
+            ExtractionBatchItem.objects.filter(email_id=email.id).delete()
+            counts["requeued"] += 1
+            continue
+        profile, schema_cls = _profile_schema(email)
+        extracted_data = batch_api.validate(results.get(custom_id), schema_cls) if schema_cls else None
+        job = {"email": email, "rule": email.matched_rule, "profile": profile, "reduction": {}}
+        try:
+            status = _finish_extraction(job, extracted_data, from_status=EmailStatus.BATCHED)
+        except Exception as e:
+            _fail(email, e)
+            status = email.status
+        counts["extracted" if status in (EmailStatus.EXTRACTED, EmailStatus.INTEGRATED) else "review"] += 1
+
+    batch.items.all().delete()
+    batch.succeeded, batch.failed = counts["extracted"], counts["review"]
+    batch.completed_at = timezone.now()
+    batch.save(update_fields=["status", "output_file_id", "error_file_id", "succeeded", "failed", "completed_at"])
+    logger.info(
+        f"Lote de extração {batch.batch_id} ({batch.status}): {counts['extracted']} extraído(s), "
+        f"{counts['review']} para revisão, {counts['requeued']} de volta à fila."
+    )
+    return counts
+
+
+def poll_batches(now=None) -> dict:
+    """Consulta os lotes ativos e aplica os que terminaram. Retorna um resumo."""
+    now = now or timezone.now()
+    _release_stale_submissions(now)
+    summary = {"active": 0, "finished": 0, "extracted": 0, "review": 0, "requeued": 0}
+    active = ExtractionBatch.objects.filter(status__in=ExtractionBatch.ACTIVE_STATUSES).exclude(batch_id=None)
+    for batch in active:
+        try:
+            remote = batch_api.retrieve(batch.batch_id)
+        except Exception as e:
+            logger.error(f"Falha ao consultar lote {batch.batch_id}: {e}")
+            summary["active"] += 1
+            continue
+        batch.status = remote.status
+        batch.output_file_id = remote.output_file_id
+        batch.error_file_id = remote.error_file_id
+        if remote.status in ExtractionBatch.ACTIVE_STATUSES:
+            batch.save(update_fields=["status"])
+            summary["active"] += 1
+            continue
+        summary["finished"] += 1
+        for name, value in _apply_results(batch, remote).items():
+            summary[name] += value
+    return summary
+
+
+def run_batch_cycle(force=False) -> dict:
+    """Task do Django-Q: aplica lotes terminados e envia o próximo, se houver."""
+    summary = poll_batches()
+    submitted = submit_waiting_emails(force=force)
+    summary["submitted"] = submitted.request_count if submitted else 0
+    return summary
@@ -0,0 +1,137 @@
+"""
+Gerador de corpus sintético para o benchmark de ingestão.
+
+Tipos de mensagem (determinísticos a partir da `seed`):
+- plain:      text/plain utf-8 (intimações curtas)
+- html:       só text/html (ERPs/newsletters)
+- attachment: multipart/mixed com alternative (plain+html) e PDF anexo grande
+- badcharset: charset declarado errado/desconhecido e encoded-words quebradas
+- large:      text/plain enorme (testa o corte de IMAP_BODY_MAX_BYTES)
+"""
+import random
+from email.message import EmailMessage as MimeMessage
+from email.mime.text import MIMEText
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
+from email import policy
+
+DEFAULT_MIX = {"plain": 40, "html": 20, "attachment": 20, "badcharset": 10, "large": 10}
+
+_SUBJECTS = [
+    "Intimação eletrônica - Processo {n}",
+    "Citação - Processo {n}",
+    "Newsletter semanal #{n}",
+    "Pedido de compra {n} aprovado",
+    "Chamado de suporte {n}: sistema fora do ar",
+]
+_SENDERS = [
+    ("TJSP", "push@tjsp.jus.br"),
+    ("TRT2", "naoresponda@trt2.jus.br"),
+    ("Loja Exemplo", "news@loja.example"),
+    ("ERP", "erp@empresa.example"),
+    ("Suporte Cliente", "cliente@empresa.example"),
+]
+_PARAGRAPH = (
+    "Fica Vossa Senhoria intimado(a) do despacho proferido nos autos do processo "
+    "em epígrafe, com prazo de 15 (quinze) dias úteis para manifestação. "
+)
+
+
+def _headers(msg, rng, n, kind):
+    name, addr = rng.choice(_SENDERS)
+    msg["Subject"] = rng.choice(_SUBJECTS).format(n=f"{rng.randint(1000000, 9999999)}-{n}")
+    msg["From"] = f"{name} <{addr}>"
+    msg["To"] = "advogado@escritorio.example"
+    msg["Message-ID"] = f"<bench-{kind}-{n}@corpus.example>"
+    date = datetime(2025, 1, 1, tzinfo=dt_timezone(timedelta(hours=-3))) + timedelta(minutes=n)
+    msg["Date"] = format_datetime(date)
+    return msg
+
+
+def _plain(rng, n):
+    msg = MimeMessage()
+    msg.set_content(_PARAGRAPH * rng.randint(1, 6))
+    return _headers(msg, rng, n, "plain").as_bytes(policy=policy.SMTP)
+
+
+def _html(rng, n):
+    msg = MimeMessage()
+    rows = "".join(f"<tr><td>Item {i}</td><td>R$ {rng.randint(10, 999)},00</td></tr>" for i in range(rng.randint(3, 30)))
+    msg.set_content(
+        f"<html><head><style>td{{color:red}}</style></head><body><p>{_PARAGRAPH}</p><table>{rows}</table></body></html>",
+        subtype="html",
+    )
+    return _headers(msg, rng, n, "html").as_bytes(policy=policy.SMTP)
+
+
+def _attachment(rng, n, attachment_bytes):
+    msg = MimeMessage()
+    msg.set_content(_PARAGRAPH * 2)
+    msg.add_alternative(f"<p>{_PARAGRAPH * 2}</p>", subtype="html")
+    msg.add_attachment(
+        rng.randbytes(attachment_bytes), maintype="application", subtype="pdf", filename=f"decisao-{n}.pdf",
+    )
+    # boundaries fixos: o mesmo seed gera exatamente os mesmos bytes
+    for i, part in enumerate(p for p in msg.walk() if p.is_multipart()):
+        part.set_boundary(f"=_bench_{n}_{i}")
+    return _headers(msg, rng, n, "attachment").as_bytes(policy=policy.SMTP)
+
+
+def _badcharset(rng, n):
+    # corpo latin-1 declarado com charset inexistente + assunto com encoded-word truncada
+    name, addr = rng.choice(_SENDERS)
+    date = datetime(2025, 1, 1, tzinfo=dt_timezone(timedelta(hours=-3))) + timedelta(minutes=n)
+    head = (
+        f"Subject: =?utf-8?q?Intima=C3=A7=C3?= quebrada {n}\r\n"
+        f"From: {name} <{addr}>\r\n"
+        f"To: advogado@escritorio.example\r\n"
+        f"Message-ID: <bench-badcharset-{n}@corpus.example>\r\n"
+        f"Date: {format_datetime(date)}\r\n"
+        "MIME-Version: 1.0\r\n"
+        'Content-Type: text/plain; charset="x-charset-inexistente"\r\n'
+        "Content-Transfer-Encoding: 8bit\r\n\r\n"
+    )
+    return head.encode("ascii") + (_PARAGRAPH * 2).encode("latin-1")
+
+
+def _large(rng, n, large_bytes):
+    text = (_PARAGRAPH * (large_bytes // len(_PARAGRAPH) + 1))[:large_bytes]
+    msg = MIMEText(text, "plain", "utf-8")
+    return _headers(msg, rng, n, "large").as_bytes()
+
+
+def generate_corpus(count, seed=0, mix=None, attachment_bytes=512 * 1024, large_bytes=1024 * 1024):
+    """
+    Gera `count` mensagens RFC 822 (bytes) com a proporção de `mix`
+    ({tipo: peso}). Retorna [(tipo, raw), ...].
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds = [k for k, w in mix.items() if w > 0]
+    weights = [mix[k] for k in kinds]
+    builders = {
+        "plain": lambda n: _plain(rng, n),
+        "html": lambda n: _html(rng, n),
+        "attachment": lambda n: _attachment(rng, n, attachment_bytes),
+        "badcharset": lambda n: _badcharset(rng, n),
+        "large": lambda n: _large(rng, n, large_bytes),
+    }
+    corpus = []
+    for n in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        corpus.append((kind, builders[kind](n)))
+    return corpus
+
+
+def parse_mix(spec):
+    """Converte "plain=40,html=20" em {"plain": 40, "html": 20}."""
+    if not spec:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in spec.split(","):
+        name, _sep, weight = item.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Tipo de mensagem desconhecido: {name} (use {', '.join(DEFAULT_MIX)})")
+        mix[name] = int(weight or 1)
+    return mix
@@ -0,0 +1,599 @@
+"""
+Servidor IMAP falso (em processo) para benchmarks e testes de ingestão.
+
+Implementa apenas o subconjunto do IMAP4rev1 usado pelo `fetch_emails` e pelo
+listener IDLE: LOGIN, CAPABILITY, ENABLE, SELECT/EXAMINE (UIDVALIDITY,
+UIDNEXT, HIGHESTMODSEQ), UID SEARCH (ALL, UID, UNSEEN, OR, NOT, SUBJECT,
+FROM, BODY, TEXT), UID FETCH (ENVELOPE, BODYSTRUCTURE, RFC822.SIZE, RFC822,
+BODY.PEEK[...] parcial, CHANGEDSINCE), IDLE, NOOP e LOGOUT.
+Não usa TLS: conecte com `ssl=False` (ou IMAP_USE_SSL=False no fetch_emails).
+
+Uso:
+    server = FakeIMAPServer()
+    server.start()
+    server.append('INBOX', raw_bytes)
+    ... IMAPClient('127.0.0.1', port=server.port, ssl=False) ...
+    server.stop()
+"""
+import re
+import select
+import socketserver
+import threading
+import time
+from email import message_from_bytes
+from email import policy as email_policy
+from email.header import decode_header, make_header
+from email.utils import getaddresses
+
+CAPABILITIES = "IMAP4rev1 IDLE CONDSTORE ENABLE UIDPLUS LITERAL+"
+
+
+def _decoded_header(value) -> str:
+    """Cabeçalho com encoded-words decodificadas (como servidores reais fazem no SEARCH)."""
+    if not value:
+        return ""
+    try:
+        return str(make_header(decode_header(str(value))))
+    except Exception:
+        return str(value)
+
+
+# ----------------- Armazenamento -----------------
+class FakeMessage:
+    def __init__(self, uid, raw, modseq, flags=()):
+        self.uid = uid
+        self.raw = raw
+        self.modseq = modseq
+        self.flags = set(flags)
+        self._parsed = None
+        self.cache = {}  # ENVELOPE/BODYSTRUCTURE/seções já serializados
+
+    def cached(self, key, build):
+        if key not in self.cache:
+            self.cache[key] = build()
+        return self.cache[key]
+
+    def warm(self):
+        """Pré-calcula ENVELOPE, BODYSTRUCTURE e as seções folha (tira o custo do servidor da medição)."""
+        self.cached("ENVELOPE", lambda: _envelope(self.parsed))
+        self.cached("BODYSTRUCTURE", lambda: _bodystructure(self.parsed))
+        for section in _leaf_sections(self.parsed):
+            self.cached(("SECTION", section), lambda: _section_bytes(self, section))
+
+    @property
+    def parsed(self):
+        if self._parsed is None:
+            self._parsed = message_from_bytes(self.raw, policy=email_policy.compat32)
+        return self._parsed
+
+
+class FakeFolder:
+    def __init__(self, name, uidvalidity):
+        self.name = name
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        self.highestmodseq = 1
+        self.messages = []
+
+    def append(self, raw, flags=(), warm=False):
+        self.highestmodseq += 1
+        msg = FakeMessage(self.uidnext, raw, self.highestmodseq, flags)
+        if warm:
+            msg.warm()
+        self.uidnext += 1
+        self.messages.append(msg)
+        return msg.uid
+
+    def reset_uidvalidity(self):
+        """Simula a reconstrução da pasta no servidor: novos UIDs e nova UIDVALIDITY."""
+        self.uidvalidity += 1
+        old = self.messages
+        self.messages = []
+        self.uidnext = 1
+        for msg in old:
+            self.append(msg.raw, msg.flags)
+
+
+# ----------------- Formatação de respostas -----------------
+def _quote(value):
+    if value is None:
+        return b"NIL"
+    if isinstance(value, str):
+        value = value.encode("utf-8", "surrogateescape")
+    if any(c > 126 or c in (13, 10) for c in value) or len(value) > 512:
+        return b"{%d}\r\n" % len(value) + value
+    return b'"' + value.replace(b"\\", b"\\\\").replace(b'"', b'\\"') + b'"'
+
+
+def _address_list(header_value):
+    if not header_value:
+        return b"NIL"
+    items = []
+    for name, addr in getaddresses([str(header_value)]):
+        if not addr:
+            continue
+        mailbox, _, host = addr.partition("@")
+        items.append(b"(" + b" ".join([_quote(name or None), b"NIL", _quote(mailbox), _quote(host or None)]) + b")")
+    return b"(" + b"".join(items) + b")" if items else b"NIL"
+
+
+def _header(msg, name):
+    value = msg.get(name)
+    return None if value is None else str(value)
+
+
+def _envelope(msg):
+    return b"(" + b" ".join([
+        _quote(_header(msg, "Date")),
+        _quote(_header(msg, "Subject")),
+        _address_list(msg.get("From")),
+        _address_list(msg.get("Sender") or msg.get("From")),
+        _address_list(msg.get("Reply-To") or msg.get("From")),
+        _address_list(msg.get("To")),
+        _address_list(msg.get("Cc")),
+        _address_list(msg.get("Bcc")),
+        _quote(_header(msg, "In-Reply-To")),
+        _quote(_header(msg, "Message-ID")),
+    ]) + b")"
+
+
+def _part_body(part) -> bytes:
+    """Corpo (ainda com Content-Transfer-Encoding) de uma parte folha, sem regerar a mensagem."""
+    if part.is_multipart():
+        return _split_part(part.as_bytes())[1]
+    payload = part.get_payload()
+    if isinstance(payload, str):
+        try:
+            return payload.encode("ascii", "surrogateescape")
+        except UnicodeEncodeError:
+            return _split_part(part.as_bytes())[1]
+    return payload or b""
+
+
+def _split_part(raw):
+    for sep in (b"\r\n\r\n", b"\n\n"):
+        idx = raw.find(sep)
+        if idx != -1:
+            return raw[:idx + len(sep)], raw[idx + len(sep):]
+    return raw, b""
+
+
+def _bodystructure(part):
+    if part.is_multipart():
+        children = b"".join(_bodystructure(p) for p in part.get_payload())
+        return b"(" + children + b" " + _quote(part.get_content_subtype().upper()) + b")"
+    maintype = part.get_content_maintype().upper()
+    subtype = part.get_content_subtype().upper()
+    params = [(k, v) for k, v in part.get_params(header="content-type")[1:]] if part.get_params() else []
+    if params:
+        params_b = b"(" + b" ".join(_quote(k.upper()) + b" " + _quote(str(v)) for k, v in params) + b")"
+    else:
+        params_b = b"NIL"
+    encoding = (part.get("Content-Transfer-Encoding") or "7BIT").upper()
+    body = _part_body(part)
+    fields = [
+        _quote(maintype), _quote(subtype), params_b,
+        _quote(part.get("Content-ID")), _quote(part.get("Content-Description")),
+        _quote(encoding), str(len(body)).encode(),
+    ]
+    if maintype == "TEXT":
+        fields.append(str(body.count(b"\n")).encode())
+    # extensão: MD5 e disposition (como servidores reais enviam)
+    disposition = part.get_content_disposition()
+    if disposition:
+        filename = part.get_filename()
+        disp_params = b"(" + _quote("FILENAME") + b" " + _quote(filename) + b")" if filename else b"NIL"
+        fields += [b"NIL", b"(" + _quote(disposition.upper()) + b" " + disp_params + b")"]
+    return b"(" + b" ".join(fields) + b")"
+
+
+def _find_part(msg, section):
+    """Resolve uma seção numérica ('1', '2.1') para a parte MIME correspondente."""
+    part = msg
+    for idx in section.split("."):
+        idx = int(idx)
+        if part.is_multipart():
+            part = part.get_payload()[idx - 1]
+        elif idx != 1:
+            return None
+    return part
+
+
+def _leaf_sections(part, prefix=""):
+    if part.is_multipart():
+        for idx, child in enumerate(part.get_payload(), 1):
+            yield from _leaf_sections(child, f"{prefix}.{idx}" if prefix else str(idx))
+    else:
+        yield prefix or "1"
+
+
+def _section_bytes(fmsg, section):
+    section = section.upper()
+    if section == "":
+        return fmsg.raw
+    header, body = _split_part(fmsg.raw)
+    if section == "HEADER":
+        return header
+    if section == "TEXT":
+        return body
+    m = re.match(r"HEADER\.FIELDS(\.NOT)?\s*\((.*)\)", section)
+    if m:
+        names = {n.lower() for n in m.group(2).split()}
+        keep = []
+        for name, value in fmsg.parsed.items():
+            if (name.lower() in names) != bool(m.group(1)):
+                keep.append(f"{name}: {value}\r\n".encode("utf-8", "surrogateescape"))
+        return b"".join(keep) + b"\r\n"
+    part = _find_part(fmsg.parsed, section)
+    if part is None:
+        return b""
+    return _part_body(part)
+
+
+# ----------------- Parsing de comandos -----------------
+def _tokenize(data):
+    """Divide os argumentos de um comando em tokens (átomos, strings, listas)."""
+    tokens = []
+    stack = [tokens]
+    i = 0
+    while i < len(data):
+        c = data[i:i + 1]
+        if c == b" ":
+            i += 1
+        elif c == b"(":
+            new = []
+            stack[-1].append(new)
+            stack.append(new)
+            i += 1
+        elif c == b")":
+            stack.pop()
+            i += 1
+        elif c == b'"':
+            j = i + 1
+            buf = bytearray()
+            while data[j:j + 1] != b'"':
+                if data[j:j + 1] == b"\\":
+                    j += 1
+                buf += data[j:j + 1]
+                j += 1
+            stack[-1].append(bytes(buf))
+            i = j + 1
+        else:
+            j = i
+            depth = 0
+            while j < len(data):
+                ch = data[j:j + 1]
+                if ch == b"[":
+                    depth += 1
+                elif ch == b"]":
+                    depth -= 1
+                elif depth == 0 and ch in (b" ", b"(", b")"):
+                    break
+                j += 1
+            stack[-1].append(bytes(data[i:j]))
+            i = j
+    return tokens
+
+
+def _parse_uid_set(spec, max_uid):
+    uids = set()
+    for chunk in spec.split(b","):
+        if b":" in chunk:
+            a, b = chunk.split(b":")
+            a = max_uid if a == b"*" else int(a)
+            b = max_uid if b == b"*" else int(b)
+            lo, hi = min(a, b), max(a, b)
+            uids.update(range(lo, hi + 1))
+        else:
+            uids.add(max_uid if chunk == b"*" else int(chunk))
+    return uids
+
+
+def _as_text(value):
+    return value.decode("utf-8", "replace") if isinstance(value, bytes) else str(value)
+
+
+# ----------------- Sessão -----------------
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.folder = None
+        self.server.fake.sessions_opened += 1
+
+    def send(self, data):
+        self.wfile.write(data)
+        self.wfile.flush()
+
+    def read_command(self):
+        """Lê uma linha de comando; literais viram strings entre aspas."""
+        line = self.rfile.readline()
+        if not line:
+            return None
+        buf = bytearray()
+        while True:
+            line = line.rstrip(b"\r\n")
+            m = re.search(rb"\{(\d+)(\+?)\}$", line)
+            if not m:
+                buf += line
+                return bytes(buf)
+            buf += line[:m.start()]
+            if not m.group(2):
+                self.send(b"+ Ready for literal\r\n")
+            literal = self.rfile.read(int(m.group(1)))
+            buf += b'"' + literal.replace(b"\\", b"\\\\").replace(b'"', b'\\"') + b'"'
+            line = self.rfile.readline()
+
+    def handle(self):
+        fake = self.server.fake
+        self.send(b"* OK [CAPABILITY " + CAPABILITIES.encode() + b"] FakeIMAP pronto\r\n")
+        while not fake.stopping:
+            line = self.read_command()
+            if line is None:
+                return
+            parts = line.split(b" ", 2)
+            if len(parts) < 2:
+                continue
+            tag, cmd = parts[0], parts[1].upper()
+            rest = parts[2] if len(parts) > 2 else b""
+            fake.commands.append(cmd.decode())
+            try:
+                if cmd == b"UID":
+                    sub, _, args = rest.partition(b" ")
+                    fake.commands.append("UID " + sub.upper().decode())
+                    getattr(self, "cmd_uid_" + sub.decode().lower())(tag, args)
+                else:
+                    handler = getattr(self, "cmd_" + cmd.decode().lower(), None)
+                    if handler is None:
+                        self.send(tag + b" BAD comando desconhecido\r\n")
+                    elif handler(tag, rest) is False:
+                        return
+            except Exception as e:  # pragma: no cover - diagnóstico
+                self.send(tag + b" BAD " + str(e).encode("ascii", "replace") + b"\r\n")
+
+    # --- comandos simples ---
+    def cmd_capability(self, tag, args):
+        self.send(b"* CAPABILITY " + CAPABILITIES.encode() + b"\r\n" + tag + b" OK CAPABILITY concluido\r\n")
+
+    def cmd_login(self, tag, args):
+        user, password = _tokenize(args)[:2]
+        if not self.server.fake.check_login(user, password):
+            self.send(tag + b" NO [AUTHENTICATIONFAILED] credenciais invalidas\r\n")
+            return
+        self.server.fake.logins += 1
+        self.send(tag + b" OK [CAPABILITY " + CAPABILITIES.encode() + b"] LOGIN concluido\r\n")
+
+    def cmd_enable(self, tag, args):
+        self.send(b"* ENABLED " + args + b"\r\n" + tag + b" OK ENABLE concluido\r\n")
+
+    def cmd_noop(self, tag, args):
+        self.send(tag + b" OK NOOP concluido\r\n")
+
+    def cmd_logout(self, tag, args):
+        self.send(b"* BYE saindo\r\n" + tag + b" OK LOGOUT concluido\r\n")
+        return False
+
+    def cmd_close(self, tag, args):
+        self.folder = None
+        self.send(tag + b" OK CLOSE concluido\r\n")
+
+    cmd_unselect = cmd_close
+
+    def cmd_select(self, tag, args):
+        name = _as_text(_tokenize(args)[0])
+        folder = self.server.fake.folder(name)
+        self.folder = folder
+        with self.server.fake.lock:
+            self.send(
+                b"* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)\r\n"
+                + b"* %d EXISTS\r\n* 0 RECENT\r\n" % len(folder.messages)
+                + b"* OK [UIDVALIDITY %d] UIDs validos\r\n" % folder.uidvalidity
+                + b"* OK [UIDNEXT %d] proximo UID\r\n" % folder.uidnext
+                + b"* OK [HIGHESTMODSEQ %d] modseq\r\n" % folder.highestmodseq
+                + tag + b" OK [READ-ONLY] SELECT concluido\r\n"
+            )
+
+    cmd_examine = cmd_select
+
+    def cmd_idle(self, tag, args):
+        self.server.fake.idle_sessions += 1
+        known = len(self.folder.messages) if self.folder else 0
+        self.send(b"+ idling\r\n")
+        sock = self.request
+        while not self.server.fake.stopping:
+            readable, _, _ = select.select([sock], [], [], 0.05)
+            if readable:
+                self.rfile.readline()  # DONE
+                break
+            current = len(self.folder.messages) if self.folder else 0
+            if current != known:
+                known = current
+                self.send(b"* %d EXISTS\r\n" % current)
+        self.send(tag + b" OK IDLE concluido\r\n")
+
+    # --- SEARCH ---
+    def _match(self, tokens, msg, seq, max_uid):
+        """Avalia os critérios consumindo tokens; retorna (bool, restantes)."""
+        key = tokens[0]
+        rest = tokens[1:]
+        if isinstance(key, list):
+            return self._match_all(key, msg, seq, max_uid), rest
+        word = key.upper()
+        if word == b"ALL":
+            return True, rest
+        if word == b"UID":
+            return msg.uid in _parse_uid_set(rest[0], max_uid), rest[1:]
+        if word == b"UNSEEN":
+            return "\\Seen" not in msg.flags, rest
+        if word == b"OR":
+            a, rest = self._match(rest, msg, seq, max_uid)
+            b, rest = self._match(rest, msg, seq, max_uid)
+            return a or b, rest
+        if word == b"NOT":
+            a, rest = self._match(rest, msg, seq, max_uid)
+            return not a, rest
+        if word in (b"SUBJECT", b"FROM", b"TO", b"BODY", b"TEXT"):
+            needle = _as_text(rest[0]).lower()
+            if word == b"BODY" or word == b"TEXT":
+                hay = msg.raw.decode("utf-8", "replace")
+            else:
+                hay = _decoded_header(msg.parsed.get(word.decode().capitalize()))
+            return needle in hay.lower(), rest[1:]
+        if word == b"CHARSET":
+            return True, rest[1:]
+        if re.match(rb"^[\d:*,]+$", word):
+            return seq in _parse_uid_set(word, len(self.folder.messages)), rest
+        raise ValueError("criterio nao suportado: %r" % word)
+
+    def _match_all(self, tokens, msg, seq, max_uid):
+        ok = True
+        while tokens:
+            res, tokens = self._match(tokens, msg, seq, max_uid)
+            ok = ok and res
+        return ok
+
+    def cmd_uid_search(self, tag, args):
+        tokens = _tokenize(args)
+        if tokens and isinstance(tokens[0], bytes) and tokens[0].upper() == b"CHARSET":
+            tokens = tokens[2:]
+        folder = self.folder
+        max_uid = folder.messages[-1].uid if folder.messages else 0
+        found = [
+            str(m.uid).encode() for seq, m in enumerate(list(folder.messages), 1)
+            if self._match_all(list(tokens), m, seq, max_uid)
+        ]
+        self.send(b"* SEARCH" + b"".join(b" " + u for u in found) + b"\r\n" + tag + b" OK SEARCH concluido\r\n")
+
+    # --- FETCH ---
+    def cmd_uid_fetch(self, tag, args):
+        tokens = _tokenize(args)
+        uid_set, items = tokens[0], tokens[1]
+        if not isinstance(items, list):
+            items = [items]
+        changedsince = None
+        if len(tokens) > 2 and isinstance(tokens[2], list) and tokens[2][0].upper() == b"CHANGEDSINCE":
+            changedsince = int(tokens[2][1])
+        folder = self.folder
+        max_uid = folder.messages[-1].uid if folder.messages else 0
+        wanted = _parse_uid_set(uid_set, max_uid)
+        for seq, msg in enumerate(list(folder.messages), 1):
+            if msg.uid not in wanted:
+                continue
+            if changedsince is not None and msg.modseq <= changedsince:
+                continue
+            out = [b"UID %d" % msg.uid]
+            for item in items:
+                out.append(self._fetch_item(item, msg))
+            payload = b" ".join(o for o in out if o)
+            self.server.fake.bytes_sent += len(payload)
+            self.send(b"* %d FETCH (" % seq + payload + b")\r\n")
+        self.send(tag + b" OK FETCH concluido\r\n")
+
+    def _fetch_item(self, item, msg):
+        word = item.upper()
+        if word == b"UID":
+            return b""
+        if word == b"FLAGS":
+            return b"FLAGS (" + " ".join(sorted(msg.flags)).encode() + b")"
+        if word == b"RFC822.SIZE":
+            return b"RFC822.SIZE %d" % len(msg.raw)
+        if word == b"MODSEQ":
+            return b"MODSEQ (%d)" % msg.modseq
+        if word == b"INTERNALDATE":
+            return b'INTERNALDATE "01-Jan-2025 00:00:00 +0000"'
+        if word == b"ENVELOPE":
+            return b"ENVELOPE " + msg.cached("ENVELOPE", lambda: _envelope(msg.parsed))
+        if word == b"BODYSTRUCTURE":
+            return b"BODYSTRUCTURE " + msg.cached("BODYSTRUCTURE", lambda: _bodystructure(msg.parsed))
+        if word == b"RFC822":
+            return b"RFC822 {%d}\r\n" % len(msg.raw) + msg.raw
+        m = re.match(rb"^BODY(?:\.PEEK)?\[(.*)\](?:<(\d+)\.(\d+)>)?$", item, re.I)
+        if m:
+            section = m.group(1).decode().upper()
+            data = msg.cached(("SECTION", section), lambda: _section_bytes(msg, section))
+            label = b"BODY[" + m.group(1) + b"]"
+            if m.group(2) is not None:
+                start, length = int(m.group(2)), int(m.group(3))
+                data = data[start:start + length]
+                label += b"<%d>" % start
+            return label + b" {%d}\r\n" % len(data) + data
+        raise ValueError("item de FETCH nao suportado: %r" % item)
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeIMAPServer:
+    """Servidor IMAP em memória rodando numa thread (127.0.0.1, porta efêmera)."""
+
+    def __init__(self, username=None, password=None, uidvalidity=1000):
+        self.username = username
+        self.password = password
+        self.uidvalidity = uidvalidity
+        self.lock = threading.Lock()
+        self.folders = {}
+        self.stopping = False
+        self.commands = []
+        self.logins = 0
+        self.sessions_opened = 0
+        self.idle_sessions = 0
+        self.bytes_sent = 0
+        self._server = None
+        self._thread = None
+
+    # --- ciclo de vida ---
+    def start(self):
+        self._server = _ThreadingServer(("127.0.0.1", 0), _Handler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.stopping = True
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def host(self):
+        return "127.0.0.1"
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    # --- dados ---
+    def check_login(self, user, password):
+        if self.username is None:
+            return True
+        return _as_text(user) == self.username and _as_text(password) == self.password
+
+    def folder(self, name="INBOX"):
+        with self.lock:
+            if name.upper() == "INBOX":
+                name = "INBOX"
+            if name not in self.folders:
+                self.folders[name] = FakeFolder(name, self.uidvalidity)
+            return self.folders[name]
+
+    def append(self, folder, raw, flags=(), warm=False):
+        """Adiciona uma mensagem; `warm=True` pré-serializa as respostas de FETCH dela."""
+        f = self.folder(folder)
+        with self.lock:
+            return f.append(raw, flags, warm=warm)
+
+    def wait_for(self, predicate, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if predicate():
+                return True
+            time.sleep(0.02)
+        return False
@@ -0,0 +1,134 @@
+"""
+Benchmark de ingestão (`fetch_emails`) contra o servidor IMAP falso.
+
+Mede, para cada cenário:
+- msgs/s e bytes/s (bytes enviados pelo servidor IMAP ao cliente)
+- queries de banco por mensagem (conexão da thread principal)
+- pico de memória Python (tracemalloc) e pico de RSS do processo
+
+Cenários:
+- cold:  primeira ingestão do corpus inteiro
+- noop:  novo fetch sem mensagens novas (deve custar ~0 FETCH/queries)
+- delta: fetch após chegarem mais `delta` mensagens
+
+Roda sobre o banco já configurado (o comando `bench_ingestion` cria um
+banco de teste descartável antes de chamar `run_benchmark`).
+"""
+import os
+import sys
+import time
+import resource
+import tracemalloc
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from emails.models import MailBox, MailBoxSyncState, EmailMessage, AutomationRule
+from tasks.bench.corpus import generate_corpus
+from tasks.bench.fake_imap import FakeIMAPServer
+from tasks.tasks import fetch_emails
+
+
+def peak_rss_bytes() -> int:
+    """Pico de RSS do processo (ru_maxrss vem em KB no Linux e em bytes no macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextmanager
+def _imap_env(server):
+    """Aponta o `fetch_emails` para o servidor falso (override via env, sem TLS)."""
+    overrides = {
+        "IMAP_HOST": server.host,
+        "IMAP_PORT": str(server.port),
+        "IMAP_USE_SSL": "False",
+        "IMAP_USERNAME": "bench",
+        "IMAP_PASSWORD": "bench",
+    }
+    previous = {key: os.environ.get(key) for key in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def _measure(name, server, mailbox):
+    created_before = EmailMessage.objects.filter(mailbox=mailbox).count()
+    bytes_before = server.bytes_sent
+    tracemalloc.start()
+    started = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        fetch_emails(mailbox.id, force=True)
+    seconds = time.perf_counter() - started
+    _current, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    created = EmailMessage.objects.filter(mailbox=mailbox).count() - created_before
+    sent = server.bytes_sent - bytes_before
+    return {
+        "scenario": name,
+        "messages": created,
+        "seconds": round(seconds, 4),
+        "msgs_per_sec": round(created / seconds, 1) if seconds else 0.0,
+        "imap_bytes": sent,
+        "bytes_per_sec": round(sent / seconds) if seconds else 0,
+        "queries": len(queries.captured_queries),
+        "queries_per_msg": round(len(queries.captured_queries) / created, 2) if created else None,
+        "py_peak_bytes": traced_peak,
+        "rss_peak_bytes": peak_rss_bytes(),
+    }
+
+
+def run_benchmark(messages=500, delta=50, seed=0, mix=None, attachment_bytes=512 * 1024, large_bytes=1024 * 1024):
+    """
+    Executa os cenários cold/noop/delta e devolve
+    {"corpus": {...}, "results": [relatório por cenário]}.
+    """
+    corpus = generate_corpus(messages + delta, seed=seed, mix=mix,
+                             attachment_bytes=attachment_bytes, large_bytes=large_bytes)
+    initial, extra = corpus[:messages], corpus[messages:]
+
+    user, _created = get_user_model().objects.get_or_create(username="bench-ingestion")
+    mailbox = MailBox.objects.create(
+        user=user, name=f"bench-{int(time.time() * 1000)}", imap_host="127.0.0.1",
+        username="bench", password="bench",
+    )
+    # regra "casa com tudo": o benchmark mede o caminho completo (corpo + fila);
+    # emails sem regra nem baixam o corpo (ver unmatched_policy)
+    AutomationRule.objects.create(user=user, mailbox=mailbox, name="bench-todos")
+
+    results = []
+    with FakeIMAPServer() as server, _imap_env(server):
+        # mensagem "semente": o checkpoint começa depois dela, então o cenário
+        # cold ingere o corpus inteiro (sem o limite da primeira sincronização)
+        server.append("INBOX", b"Subject: seed\r\nMessage-ID: <bench-seed@corpus.example>\r\n\r\nseed")
+        MailBoxSyncState.objects.create(
+            mailbox=mailbox, folder="INBOX", uid_validity=server.folder("INBOX").uidvalidity, last_uid=1,
+        )
+        for _kind, raw in initial:
+            server.append("INBOX", raw, warm=True)
+        results.append(_measure("cold", server, mailbox))
+        results.append(_measure("noop", server, mailbox))
+        for _kind, raw in extra:
+            server.append("INBOX", raw, warm=True)
+        results.append(_measure("delta", server, mailbox))
+
+    kinds = {}
+    for kind, _raw in corpus:
+        kinds[kind] = kinds.get(kind, 0) + 1
+    return {
+        "corpus": {
+            "messages": len(corpus),
+            "bytes": sum(len(raw) for _kind, raw in corpus),
+            "kinds": kinds,
+            "seed": seed,
+        },
+        "results": results,
+    }
@@ -0,0 +1,172 @@
+"""
+Claim worker: esvazia a fila de EmailMessage direto do banco.
+
+Complementa (não substitui) as tasks `process_email_batch` do Django-Q: se
+uma task se perde (timeout, worker morto, broker limpo), o email fica
+PENDING ou PROCESSING sem ninguém para retomá-lo. Aqui cada worker, em
+loop, reserva até N emails e os processa:
+
+- PENDING, ou PROCESSING com reserva (`lease_expires_at`) vencida, são
+  reivindicados com `SELECT ... FOR UPDATE SKIP LOCKED` (PostgreSQL/MySQL):
+  vários nós pegam blocos diferentes sem esperar uns pelos outros. Em
+  bancos sem SKIP LOCKED (SQLite), cada linha é reivindicada com um UPDATE
+  condicional (quem não vencer simplesmente pula a linha).
+- A reserva vale EMAIL_CLAIM_LEASE_SECONDS; vencida, o email volta a ser
+  reivindicável. Depois de EMAIL_MAX_PROCESSING_ATTEMPTS tentativas ele
+  vai para FAILED em vez de rodar de novo.
+
+Ordem: filas de prioridade (`priority`, ver tasks/priority.py) e, dentro
+da fila, `received_at` (índice (status, priority, received_at)). Para as
+filas baixas não ficarem paradas com um backlog urgente contínuo, uma
+fração de cada reserva (EMAIL_LANE_FIFO_SHARE) pega os mais antigos de
+qualquer fila (índice (status, received_at)).
+"""
+import math
+import time
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from emails.models import EmailMessage, EmailStatus
+from extraction.cache import cache_stats, describe_cache_stats
+from tasks import async_extraction
+from tasks.rule_matcher import get_rule_matchers
+from tasks.tasks import EMAIL_LEASE, _process_loaded_email, notify_telegram
+
+logger = logging.getLogger(__name__)
+
+CLAIM_BATCH_SIZE = int(getattr(settings, "EMAIL_CLAIM_BATCH_SIZE", 10))
+MAX_ATTEMPTS = int(getattr(settings, "EMAIL_MAX_PROCESSING_ATTEMPTS", 5))
+# Fração da reserva que ignora a prioridade (proteção contra inanição das filas baixas)
+LANE_FIFO_SHARE = float(getattr(settings, "EMAIL_LANE_FIFO_SHARE", 0.2))
+
+CLAIM_FUNC = "tasks.claim_worker.drain_pending_emails"
+
+
+def _claimable(now):
+    expired = Q(status=EmailStatus.PROCESSING, lease_expires_at__lt=now, processing_attempts__lt=MAX_ATTEMPTS)
+    return Q(status=EmailStatus.PENDING) | expired
+
+
+def _claim_fields(now):
+    return {
+        "status": EmailStatus.PROCESSING,
+        "lease_expires_at": now + EMAIL_LEASE,
+        "processing_attempts": F("processing_attempts") + 1,
+        "updated_at": now,
+    }
+
+
+# ----------------- Reserva -----------------
+def fail_exhausted_emails(now=None) -> list:
+    """
+    Emails com reserva vencida que já esgotaram as tentativas vão para
+    FAILED (um email que derruba o worker não roda para sempre).
+    """
+    now = now or timezone.now()
+    ids = list(
+        EmailMessage.objects.filter(
+            status=EmailStatus.PROCESSING, lease_expires_at__lt=now, processing_attempts__gte=MAX_ATTEMPTS,
+        ).values_list("id", flat=True)
+    )
+    failed = [pk for pk in ids if EmailMessage.objects.filter(
+        pk=pk, status=EmailStatus.PROCESSING, lease_expires_at__lt=now,
+    ).update(status=EmailStatus.FAILED, lease_expires_at=None, updated_at=now)]
+    if failed:
+        msg = f"⚠️ {len(failed)} email(s) esgotaram {MAX_ATTEMPTS} tentativas de processamento (ids: {failed})."
+        logger.error(msg)
+        notify_telegram(message=msg)
+    return failed
+
+
+def _candidate_ids(candidates, limit) -> list:
+    """
+    Até `limit` ids: a fatia FIFO (mais antigos de qualquer fila) e o resto
+    por fila de prioridade. Retorna na ordem de processamento (por fila).
+    """
+    fields = ("priority", "received_at", "id")
+    fifo_slots = min(limit, math.ceil(limit * LANE_FIFO_SHARE)) if limit > 1 else 0
+    oldest = list(candidates.order_by("received_at", "id").values_list(*fields)[:fifo_slots])
+    by_lane = list(
+        candidates.exclude(pk__in=[row[2] for row in oldest])
+        .order_by(*fields)
+        .values_list(*fields)[:limit - len(oldest)]
+    )
+    return [pk for _priority, _received, pk in sorted(by_lane + oldest)]
+
+
+def claim_emails(limit=None, now=None) -> list:
+    """
+    Reserva até `limit` emails (PENDING ou com reserva vencida) para este
+    worker e retorna seus ids, já em PROCESSING, filas mais altas primeiro.
+    """
+    now = now or timezone.now()
+    limit = max(1, int(limit or CLAIM_BATCH_SIZE))
+    candidates = EmailMessage.objects.filter(_claimable(now))
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = _candidate_ids(candidates.select_for_update(skip_locked=True), limit)
+            if ids:
+                EmailMessage.objects.filter(pk__in=ids).update(**_claim_fields(now))
+        return ids
+
+    # Sem SKIP LOCKED: UPDATE condicional por linha; a corrida perdida só pula o email
+    claimed = []
+    for pk in _candidate_ids(candidates, limit):
+        if EmailMessage.objects.filter(_claimable(now), pk=pk).update(**_claim_fields(now)):
+            claimed.append(pk)
+    return claimed
+
+
+# ----------------- Processamento -----------------
+def process_claimed_emails(ids) -> dict:
+    """Processa emails já reservados; retorna {email_id: status_final}."""
+    emails = EmailMessage.objects.select_related("mailbox").in_bulk(ids)
+    matchers = get_rule_matchers(e.mailbox_id for e in emails.values())
+    if async_extraction.ENABLED:
+        return async_extraction.process_emails_concurrently(
+            [emails[email_id] for email_id in ids if email_id in emails], matchers, claimed=True,
+        )
+    return {
+        email_id: _process_loaded_email(emails[email_id], matchers[emails[email_id].mailbox_id], claimed=True)
+        for email_id in ids if email_id in emails
+    }
+
+
+def drain_pending_emails(batch_size=None, max_seconds=None, max_batches=None) -> dict:
+    """
+    Reserva e processa blocos de emails até a fila esvaziar (ou até
+    `max_seconds`/`max_batches`). Pode rodar em vários nós ao mesmo tempo,
+    como task do Django-Q ou via `manage.py process_pending_emails`.
+    Retorna um resumo {claimed, batches, failed, exhausted, seconds, cache};
+    `cache` são os contadores do cache de extração do processo.
+    """
+    started = time.monotonic()
+    summary = {"claimed": 0, "failed": 0, "exhausted": len(fail_exhausted_emails()), "batches": 0}
+
+    while True:
+        if max_batches is not None and summary["batches"] >= max_batches:
+            break
+        if max_seconds is not None and time.monotonic() - started >= max_seconds:
+            break
+        ids = claim_emails(batch_size)
+        if not ids:
+            break
+        results = process_claimed_emails(ids)
+        summary["batches"] += 1
+        summary["claimed"] += len(ids)
+        summary["failed"] += sum(1 for status in results.values() if status == EmailStatus.FAILED)
+
+    summary["seconds"] = round(time.monotonic() - started, 3)
+    summary["cache"] = cache_stats()
+    if summary["claimed"] or summary["exhausted"]:
+        logger.info(
+            "[drain_pending_emails] %s email(s) em %s bloco(s), %s com falha, %s esgotado(s) em %.2fs; %s.",
+            summary["claimed"], summary["batches"], summary["failed"], summary["exhausted"], summary["seconds"],
+            describe_cache_stats(),
+        )
+    return summary
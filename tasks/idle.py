@@ -0,0 +1,165 @@
+import time
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from emails.models import MailBox
+from tasks.tasks import (
+    _imap_settings,
+    _connect_mailbox,
+    _load_sync_state,
+    _sync_mailbox,
+    fetch_emails,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Intervalos (segundos). RFC 2177: o servidor pode derrubar um IDLE após 30 min.
+IDLE_RENEW_SECONDS = int(getattr(settings, "IMAP_IDLE_RENEW_SECONDS", 25 * 60))
+IDLE_CHECK_SECONDS = 30  # granularidade para perceber o pedido de parada
+POLL_FALLBACK_SECONDS = int(getattr(settings, "IMAP_IDLE_POLL_FALLBACK_SECONDS", 300))
+RECONNECT_MAX_SECONDS = 300
+
+
+class MailBoxIdleWorker(threading.Thread):
+    """
+    Mantém UMA conexão IMAP aberta para a MailBox e fica em IDLE.
+    Ao receber EXISTS, busca apenas os UIDs acima do checkpoint
+    (MailBoxSyncState) e ingere.
+    Se o servidor não anunciar IDLE, cai para polling via `fetch_emails`.
+    """
+
+    def __init__(self, mailbox_id, stop_event):
+        super().__init__(name=f"idle-mailbox-{mailbox_id}", daemon=True)
+        self.mailbox_id = mailbox_id
+        self.stop_event = stop_event
+        self.server = None
+
+    # ----------------- ciclo principal -----------------
+    def run(self):
+        failures = 0
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    self._session()
+                    failures = 0
+                except Exception as e:
+                    failures += 1
+                    delay = min(RECONNECT_MAX_SECONDS, 2 ** failures)
+                    logger.warning(
+                        "[listen_emails] MailBox %s: conexão perdida (%s). Reconectando em %ss.",
+                        self.mailbox_id, e, delay,
+                    )
+                    self.stop_event.wait(delay)
+                finally:
+                    self._logout()
+                    close_old_connections()
+        finally:
+            connection.close()
+
+    def _session(self):
+        mailbox = MailBox.objects.get(id=self.mailbox_id)
+        if not mailbox.is_active:
+            self.stop_event.wait(POLL_FALLBACK_SECONDS)
+            return
+
+        conn = _imap_settings(mailbox)
+        self.server, select_info = _connect_mailbox(conn)
+
+        if not self.server.has_capability("IDLE"):
+            logger.info("[listen_emails] MailBox %s sem suporte a IDLE; usando polling.", self.mailbox_id)
+            self._logout()
+            self._poll_forever()
+            return
+
+        # Ao (re)conectar: valida UIDVALIDITY e ingere o que chegou enquanto
+        # estávamos fora, a partir do checkpoint persistido.
+        state = _load_sync_state(mailbox, conn["folder"])
+        _sync_mailbox(self.server, mailbox, conn, state, select_info)
+
+        logger.info("[listen_emails] MailBox %s em IDLE (último UID %s).", self.mailbox_id, state.last_uid)
+        while not self.stop_event.is_set():
+            if self._wait_for_exists():
+                # o polling de fallback pode ter avançado o checkpoint
+                state.refresh_from_db()
+                created = _sync_mailbox(self.server, mailbox, conn, state)
+                logger.info("[listen_emails] MailBox %s: %s novo(s) email(s).", self.mailbox_id, created)
+                close_old_connections()
+
+    # ----------------- IDLE -----------------
+    def _wait_for_exists(self) -> bool:
+        """Fica em IDLE até receber EXISTS, renovar o IDLE ou pedirem parada."""
+        self.server.idle()
+        started = time.monotonic()
+        got_exists = False
+        try:
+            while not self.stop_event.is_set():
+                responses = self.server.idle_check(timeout=IDLE_CHECK_SECONDS)
+                if any(len(r) > 1 and r[1] == b"EXISTS" for r in responses):
+                    got_exists = True
+                    break
+                if time.monotonic() - started >= IDLE_RENEW_SECONDS:
+                    break
+        finally:
+            _text, responses = self.server.idle_done()
+        if any(len(r) > 1 and r[1] == b"EXISTS" for r in responses):
+            got_exists = True
+        return got_exists
+
+    # ----------------- fallback -----------------
+    def _poll_forever(self):
+        while not self.stop_event.is_set():
+            fetch_emails(self.mailbox_id)
+            close_old_connections()
+            self.stop_event.wait(POLL_FALLBACK_SECONDS)
+
+    def _logout(self):
+        if self.server is None:
+            return
+        try:
+            self.server.logout()
+        except Exception:
+            pass
+        self.server = None
+
+
+def run_idle_listener(stop_event=None, refresh_seconds=60, mailbox_ids=None):
+    """
+    Sobe um MailBoxIdleWorker por MailBox ativa e mantém o conjunto
+    sincronizado com o banco (novas caixas ganham worker; removidas param).
+    """
+    stop_event = stop_event or threading.Event()
+    workers = {}
+    try:
+        while not stop_event.is_set():
+            qs = MailBox.objects.filter(is_active=True)
+            if mailbox_ids:
+                qs = qs.filter(id__in=mailbox_ids)
+            active = set(qs.values_list("id", flat=True))
+            close_old_connections()
+
+            for mailbox_id in active - set(workers):
+                worker_stop = threading.Event()
+                worker = MailBoxIdleWorker(mailbox_id, worker_stop)
+                workers[mailbox_id] = (worker, worker_stop)
+                worker.start()
+                logger.info("[listen_emails] Listener iniciado para MailBox %s.", mailbox_id)
+
+            for mailbox_id in set(workers) - active:
+                worker, worker_stop = workers.pop(mailbox_id)
+                worker_stop.set()
+                logger.info("[listen_emails] Listener encerrado para MailBox %s.", mailbox_id)
+
+            for mailbox_id, (worker, worker_stop) in list(workers.items()):
+                if not worker.is_alive():
+                    workers.pop(mailbox_id)
+
+            stop_event.wait(refresh_seconds)
+    finally:
+        for worker, worker_stop in workers.values():
+            worker_stop.set()
+        for worker, _worker_stop in workers.values():
+            worker.join(timeout=IDLE_CHECK_SECONDS + 5)
@@ -0,0 +1,306 @@
+"""
+Fetch IMAP em duas fases (Thales).
+
+1. Cabeçalhos: ENVELOPE + BODYSTRUCTURE + RFC822.SIZE (+ campos de cabeçalho
+   opcionais) — alguns centos de bytes por mensagem.
+2. Corpo: apenas a parte de texto escolhida, via `BODY.PEEK[seção]<0.N>`,
+   limitada a `IMAP_BODY_MAX_BYTES`. Anexos nunca são baixados.
+
+`iter_message_batches` junta as duas fases num generator: os corpos são
+baixados em lotes limitados por quantidade E por bytes (tamanhos vindos do
+BODYSTRUCTURE/RFC822.SIZE), e cada lote é liberado antes do próximo.
+
+Com `IMAP_STORE_RAW` ligado, a fase 2 baixa a mensagem bruta inteira
+(`BODY.PEEK[]`) para o RawStore (emails.raw_store) e o texto é extraído
+localmente dela.
+"""
+import codecs
+import base64
+import binascii
+import logging
+import quopri
+from email.parser import BytesHeaderParser, BytesParser
+from email import policy
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Limite de bytes baixados do corpo de texto de cada mensagem
+BODY_MAX_BYTES = int(getattr(settings, "IMAP_BODY_MAX_BYTES", 256 * 1024))
+# Campos de cabeçalho extras buscados na fase 1 (ex: ['List-Id', 'X-Tribunal'])
+EXTRA_HEADER_FIELDS = list(getattr(settings, "IMAP_EXTRA_HEADER_FIELDS", []))
+
+# Lotes de FETCH: no máximo N mensagens e no máximo N bytes de corpo por lote
+FETCH_BATCH_SIZE = int(getattr(settings, "IMAP_FETCH_BATCH_SIZE", 200))
+FETCH_BYTE_BUDGET = int(getattr(settings, "IMAP_FETCH_BYTE_BUDGET", 8 * 1024 * 1024))
+
+SUMMARY_ITEMS = ['UID', 'FLAGS', 'ENVELOPE', 'BODYSTRUCTURE', 'RFC822.SIZE']
+
+
+# ----------------- Helpers -----------------
+def _b2s(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+
+def _params_dict(params) -> dict:
+    """Converte a lista de parâmetros do BODYSTRUCTURE ((k, v, k, v)) em dict."""
+    if not params or not isinstance(params, (tuple, list)):
+        return {}
+    items = list(params)
+    return {_b2s(items[i]).lower(): _b2s(items[i + 1]) for i in range(0, len(items) - 1, 2)}
+
+
+def _header_fields_item(names) -> str:
+    return "BODY.PEEK[HEADER.FIELDS (%s)]" % " ".join(n.upper() for n in names)
+
+
+# ----------------- BODYSTRUCTURE -----------------
+def iter_body_parts(body, prefix=""):
+    """Percorre o BODYSTRUCTURE devolvendo (seção, parte) para cada parte folha."""
+    if body.is_multipart:
+        for idx, part in enumerate(body[0], 1):
+            section = f"{prefix}.{idx}" if prefix else str(idx)
+            yield from iter_body_parts(part, section)
+    else:
+        yield (prefix or "1"), body
+
+
+def pick_text_part(bodystructure):
+    """
+    Escolhe a parte de texto a baixar: prefere text/plain; senão, o primeiro
+    text/* (ex: text/html). Partes marcadas como anexo são ignoradas.
+    Retorna dict(section, subtype, charset, encoding, size) ou None.
+    """
+    if not bodystructure:
+        return None
+    fallback = None
+    for section, part in iter_body_parts(bodystructure):
+        if _b2s(part[0]).lower() != "text":
+            continue
+        disposition = part[9] if len(part) > 9 else None
+        if isinstance(disposition, tuple) and disposition and _b2s(disposition[0]).lower() == "attachment":
+            continue
+        params = _params_dict(part[2])
+        info = {
+            "section": section,
+            "subtype": _b2s(part[1]).lower(),
+            "charset": params.get("charset") or "utf-8",
+            "encoding": _b2s(part[5]).lower() or "7bit",
+            "size": part[6] if isinstance(part[6], int) else 0,
+        }
+        if info["subtype"] == "plain":
+            return info
+        if fallback is None:
+            fallback = info
+    return fallback
+
+
+def decode_part(raw: bytes, encoding: str, charset: str) -> str:
+    """Decodifica o conteúdo (possivelmente truncado) de uma parte de texto."""
+    if not raw:
+        return ""
+    encoding = (encoding or "").lower()
+    try:
+        if encoding == "base64":
+            data = b"".join(raw.split())
+            data = data[: len(data) - (len(data) % 4)]  # corte do limite de bytes
+            raw = base64.b64decode(data)
+        elif encoding == "quoted-printable":
+            raw = quopri.decodestring(raw)
+    except (binascii.Error, ValueError) as e:
+        logger.debug("Falha ao decodificar parte (%s): %s", encoding, e)
+    try:
+        codecs.lookup(charset)
+    except (LookupError, TypeError):
+        charset = "utf-8"
+    return raw.decode(charset, errors="replace")
+
+
+# ----------------- ENVELOPE -----------------
+def _envelope_address(addresses) -> str:
+    if not addresses:
+        return ""
+    from tasks.tasks import _decode_str  # evita import circular
+    addr = addresses[0]
+    email_addr = "@".join(p for p in (_b2s(addr.mailbox), _b2s(addr.host)) if p)
+    name = _decode_str(_b2s(addr.name)) if addr.name else ""
+    return f"{name} <{email_addr}>" if name else email_addr
+
+
+def envelope_fields(envelope) -> dict:
+    """Extrai message_id/subject/sender/date do ENVELOPE (sem baixar o corpo)."""
+    from tasks.tasks import _decode_str  # evita import circular
+    if envelope is None:
+        return {"message_id": None, "subject": "", "sender": "", "to": "", "date": None}
+    return {
+        "message_id": _b2s(envelope.message_id).strip() or None,
+        "subject": _decode_str(_b2s(envelope.subject)),
+        "sender": _envelope_address(envelope.from_),
+        "to": _envelope_address(envelope.to),
+        "date": envelope.date,
+    }
+
+
+def parse_header_fields(raw: bytes) -> dict:
+    if not raw:
+        return {}
+    msg = BytesHeaderParser(policy=policy.default).parsebytes(raw)
+    return {name.lower(): str(value) for name, value in msg.items()}
+
+
+# ----------------- Fetch em duas fases -----------------
+def fetch_summaries(server, uids, extra_headers=None) -> dict:
+    """Fase 1: ENVELOPE/BODYSTRUCTURE/tamanho (+ cabeçalhos extras) por UID."""
+    header_names = list(dict.fromkeys((EXTRA_HEADER_FIELDS or []) + list(extra_headers or [])))
+    items = list(SUMMARY_ITEMS)
+    if header_names:
+        items.append(_header_fields_item(header_names))
+    fetched = server.fetch(uids, items)
+
+    summaries = {}
+    for uid in uids:
+        data = fetched.get(uid)
+        if not data:
+            continue
+        headers = {}
+        if header_names:
+            for key, value in data.items():
+                if isinstance(key, bytes) and key.startswith(b"BODY[HEADER.FIELDS"):
+                    headers = parse_header_fields(value)
+                    break
+        summaries[uid] = {
+            **envelope_fields(data.get(b"ENVELOPE")),
+            "uid": uid,
+            "size": data.get(b"RFC822.SIZE") or 0,
+            "flags": data.get(b"FLAGS") or (),
+            "text_part": pick_text_part(data.get(b"BODYSTRUCTURE")),
+            "headers": headers,
+        }
+    return summaries
+
+
+def fetch_text_parts(server, summaries, max_bytes=None) -> dict:
+    """
+    Fase 2: baixa só a parte de texto de cada mensagem (com limite de bytes).
+    Agrupa UIDs pela mesma seção para usar um único FETCH por grupo.
+    Retorna {uid: texto}.
+    """
+    max_bytes = max_bytes or BODY_MAX_BYTES
+    by_section = {}
+    for uid, summary in summaries.items():
+        part = summary.get("text_part")
+        if part:
+            by_section.setdefault(part["section"], []).append(uid)
+
+    bodies = {}
+    for section, uids in by_section.items():
+        prefix = f"BODY[{section}]".encode()
+        fetched = server.fetch(uids, [f"BODY.PEEK[{section}]<0.{max_bytes}>"])
+        for uid in uids:
+            data = fetched.get(uid) or {}
+            raw = b""
+            for key, value in data.items():
+                if isinstance(key, bytes) and key.startswith(prefix):
+                    raw = value or b""
+                    break
+            part = summaries[uid]["text_part"]
+            if part["size"] and part["size"] > max_bytes:
+                logger.debug("UID %s: parte %s truncada em %s bytes (tamanho %s).", uid, section, max_bytes, part["size"])
+            bodies[uid] = decode_part(raw, part["encoding"], part["charset"]).strip()
+    return bodies
+
+
+# ----------------- Generator com orçamento de bytes -----------------
+def split_by_budget(items, size_of, max_count, max_bytes):
+    """
+    Agrupa `items` em lotes de no máximo `max_count` itens e `max_bytes`
+    bytes (somando `size_of(item)`). Um item maior que o orçamento vai
+    sozinho no seu lote.
+    """
+    batch, batch_bytes = [], 0
+    for item in items:
+        size = max(0, int(size_of(item) or 0))
+        if batch and (len(batch) >= max_count or batch_bytes + size > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(item)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def fetch_raw_messages(server, uids) -> dict:
+    """Fase 2 no modo bruto: a mensagem RFC 822 inteira por UID ({uid: bytes})."""
+    fetched = server.fetch(uids, ["BODY.PEEK[]"])
+    raws = {}
+    for uid in uids:
+        data = fetched.get(uid) or {}
+        raws[uid] = data.get(b"BODY[]") or b""
+    return raws
+
+
+def text_from_raw(raw: bytes) -> str:
+    """Texto (text/plain preferido) extraído localmente da mensagem bruta."""
+    from tasks.tasks import _extract_body  # evita import circular
+    if not raw:
+        return ""
+    return _extract_body(BytesParser(policy=policy.default).parsebytes(raw))
+
+
+def download_size(summary: dict, max_bytes: int, raw=False) -> int:
+    """Bytes que a fase 2 vai baixar para a mensagem (parte de texto com o corte, ou a mensagem inteira)."""
+    if raw:
+        return summary.get("size") or 0
+    part = summary.get("text_part")
+    if not part:
+        return 0
+    return min(part["size"] or summary.get("size") or 0, max_bytes)
+
+
+def iter_message_batches(server, uids, batch_size=None, byte_budget=None, max_body_bytes=None, raw=False,
+                         wants_body=None, extra_headers=None, on_missing=None):
+    """
+    Generator das duas fases: para cada lote devolve [(summary, texto, bruto), ...]
+    (`bruto` é None fora do modo `raw`).
+    Os cabeçalhos de `uids` são buscados de uma vez; os corpos em lotes
+    limitados por `batch_size` mensagens e `byte_budget` bytes, de modo que
+    a memória de pico depende do orçamento e não do conteúdo da caixa.
+    `wants_body(summary)` decide, só pelos cabeçalhos, se o corpo precisa
+    ser baixado (False -> texto "" e nenhum FETCH da fase 2);
+    `extra_headers` entram na fase 1 (ex: cabeçalhos usados pelas regras).
+    `on_missing(uids)` recebe os UIDs para os quais o servidor não devolveu
+    nada na fase 1 (apagados entre o SEARCH e o FETCH).
+    """
+    batch_size = max(1, int(batch_size or FETCH_BATCH_SIZE))
+    byte_budget = max(1, int(byte_budget or FETCH_BYTE_BUDGET))
+    max_body_bytes = max_body_bytes or BODY_MAX_BYTES
+
+    summaries = fetch_summaries(server, uids, extra_headers=extra_headers)
+    ordered = [summaries[uid] for uid in uids if uid in summaries]
+    missing = [uid for uid in uids if uid not in summaries]
+    del summaries
+    if missing and on_missing is not None:
+        on_missing(missing)
+    body_uids = {s["uid"] for s in ordered if wants_body is None or wants_body(s)}
+
+    def size_of(summary):
+        if summary["uid"] not in body_uids:
+            return 0
+        return download_size(summary, max_body_bytes, raw=raw)
+
+    for chunk in split_by_budget(ordered, size_of, batch_size, byte_budget):
+        wanted = [s for s in chunk if s["uid"] in body_uids]
+        if raw:
+            raws = fetch_raw_messages(server, [s["uid"] for s in wanted]) if wanted else {}
+            yield [
+                (summary, text_from_raw(raws.get(summary["uid"])), raws.get(summary["uid"]))
+                for summary in chunk
+            ]
+        else:
+            bodies = fetch_text_parts(server, {s["uid"]: s for s in wanted}, max_body_bytes) if wanted else {}
+            yield [(summary, bodies.get(summary["uid"], ""), None) for summary in chunk]
@@ -0,0 +1,141 @@
+"""
+Pré-filtro IMAP SEARCH compilado a partir das AutomationRules (opt-in por
+MailBox via `imap_prefilter`).
+
+As condições `subject_contains` / `sender_contains` das regras ativas viram
+uma expressão SEARCH em notação prefixa (OR/NOT, sem parênteses):
+
+    regra A (assunto)            -> SUBJECT "a"
+    regra B (assunto E remetente) -> NOT OR NOT SUBJECT "b" NOT FROM "c"
+    A ou B                        -> OR <A> <B>
+
+O filtro precisa ser um SUPERCONJUNTO do que o `process_email` aceita: a
+comparação em Python é case-insensitive com acentos, e servidores IMAP só
+garantem isso para ASCII. Por isso cada condição vira o maior trecho ASCII
+do texto (ex: "Intimação" -> "Intima"). Se alguma regra não puder ser
+filtrada com segurança (sem condição, ou trecho ASCII curto demais), o
+filtro é desligado e tudo é buscado, como antes.
+
+Condições avançadas (`AutomationRule.conditions`):
+- em modo ALL, as de assunto/remetente/domínio viram chaves a mais no E;
+  regex, corpo e cabeçalho são simplesmente omitidas (omitir um termo do E
+  só amplia o resultado, então continua superconjunto);
+- em modo ANY, cada condição vira uma alternativa; se alguma não puder ir
+  para o servidor (regex, corpo, cabeçalho), vale só o que as condições
+  legadas filtram ou, sem elas, o filtro é desligado.
+"""
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+MIN_TOKEN_LENGTH = 3
+MAX_ALTERNATIVES = 50  # evita linhas de comando gigantes (alguns servidores limitam ~8 KB)
+
+_ASCII_RUN = re.compile(r"[\x21-\x7e]+(?: +[\x21-\x7e]+)*")
+
+
+def search_token(value):
+    """Maior trecho ASCII imprimível de `value` (None se curto demais)."""
+    if not value or not value.strip():
+        return None
+    runs = _ASCII_RUN.findall(value.strip())
+    token = max(runs, key=len) if runs else ""
+    return token if len(token) >= MIN_TOKEN_LENGTH else None
+
+
+def _all_of(keys):
+    """AND de chaves SEARCH sem parênteses: a E b == NOT (NOT a OR NOT b)."""
+    expr = keys[0]
+    for key in keys[1:]:
+        expr = ["NOT", "OR", "NOT", *expr, "NOT", *key]
+    return expr
+
+
+def _any_of(alternatives):
+    """OR encadeado em notação prefixa: OR a OR b c."""
+    expr = alternatives[-1]
+    for alt in reversed(alternatives[:-1]):
+        expr = ["OR", *alt, *expr]
+    return expr
+
+
+_IMAP_KEYS = {"subject": "SUBJECT", "sender": "FROM", "sender_domain": "FROM"}
+
+
+def _condition_alternatives(condition):
+    """
+    Alternativas (cada uma uma lista de chaves em E) que formam um
+    superconjunto da condição, ou None se ela não pode ir para o servidor.
+    """
+    imap_key = _IMAP_KEYS.get(condition["field"])
+    if imap_key is None or condition["op"] == "regex":
+        return None
+    value = condition.get("value")
+    tokens = [search_token(v) for v in (value if isinstance(value, list) else [value])]
+    if condition["op"] == "all_of":
+        keys = [[imap_key, token] for token in tokens if token]
+        return [keys] if keys else None
+    if None in tokens:
+        return None
+    return [[[imap_key, token]] for token in tokens]
+
+
+def _rule_alternatives(rule):
+    """Alternativas SEARCH de uma regra (None se a regra não é filtrável)."""
+    keys = []
+    for imap_key, value in (("SUBJECT", rule.subject_contains), ("FROM", rule.sender_contains)):
+        if value and value.strip():
+            token = search_token(value)
+            if token:
+                keys.append([imap_key, token])
+
+    conditions = getattr(rule, "conditions", None) or []
+    if not conditions:
+        return [keys] if keys else None
+    per_condition = [_condition_alternatives(c) for c in conditions]
+    if getattr(rule, "conditions_match", "ALL") == "ANY":
+        if any(alts is None for alts in per_condition):
+            return [keys] if keys else None
+        return [keys + alt for alts in per_condition for alt in alts]
+    for alts in per_condition:
+        if alts is not None and len(alts) == 1:
+            keys = keys + alts[0]
+    return [keys] if keys else None
+
+
+def compile_rule_search(rules):
+    """
+    Compila as regras ativas numa lista de critérios para `server.search`.
+    Retorna None quando não é seguro filtrar (o chamador busca tudo).
+    """
+    alternatives = []
+    for rule in rules:
+        rule_alternatives = _rule_alternatives(rule)
+        if not rule_alternatives:
+            logger.debug("Regra '%s' não é filtrável no servidor; pré-filtro desligado.", rule.name)
+            return None
+        for keys in rule_alternatives:
+            expr = _all_of(keys)
+            if expr not in alternatives:
+                alternatives.append(expr)
+
+    if not alternatives or len(alternatives) > MAX_ALTERNATIVES:
+        return None
+    return _any_of(alternatives)
+
+
+def prefilter_uids(server, uids, criteria):
+    """
+    Restringe `uids` (ordenados) aos que casam com `criteria` no servidor.
+    Em caso de erro no SEARCH, devolve `uids` sem filtrar.
+    """
+    if not uids or not criteria:
+        return list(uids)
+    try:
+        found = server.search(["UID", f"{uids[0]}:{uids[-1]}", *criteria])
+    except Exception as e:
+        logger.warning("Pré-filtro SEARCH falhou (%s); buscando sem filtro.", e)
+        return list(uids)
+    wanted = set(uids)
+    return sorted(u for u in found if u in wanted)
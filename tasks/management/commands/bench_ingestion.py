@@ -0,0 +1,99 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from tasks.bench.corpus import parse_mix
+from tasks.bench.runner import run_benchmark
+
+
+def _mb(value) -> str:
+    return f"{value / (1024 * 1024):.1f} MB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark offline do fetch_emails: sobe um servidor IMAP falso com um "
+        "corpus sintético e mede msgs/s, bytes/s, queries por mensagem e pico de memória. "
+        "Usa um banco de teste descartável. Os limites --min-*/--max-* transformam o "
+        "benchmark em gate de regressão (sai com erro se forem violados)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=500, help="Mensagens no cenário cold.")
+        parser.add_argument("--delta", type=int, default=50, help="Mensagens novas no cenário delta.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--mix", default="",
+            help="Proporção dos tipos, ex: plain=40,html=20,attachment=20,badcharset=10,large=10",
+        )
+        parser.add_argument("--attachment-kb", type=int, default=512, help="Tamanho dos anexos (KB).")
+        parser.add_argument("--large-kb", type=int, default=1024, help="Tamanho das mensagens 'large' (KB).")
+        parser.add_argument("--keepdb", action="store_true", help="Reaproveita o banco de teste.")
+        parser.add_argument("--json", action="store_true", help="Imprime o resultado em JSON.")
+        parser.add_argument("--min-msgs-per-sec", type=float, help="Gate: msgs/s mínimo no cenário cold.")
+        parser.add_argument("--max-queries-per-msg", type=float, help="Gate: queries/mensagem máximo no cenário cold.")
+        parser.add_argument("--max-noop-queries", type=int, help="Gate: queries máximas no cenário noop.")
+        parser.add_argument("--max-rss-mb", type=float, help="Gate: pico de RSS máximo (MB).")
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options["mix"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            report = run_benchmark(
+                messages=options["messages"],
+                delta=options["delta"],
+                seed=options["seed"],
+                mix=mix,
+                attachment_bytes=options["attachment_kb"] * 1024,
+                large_bytes=options["large_kb"] * 1024,
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+            teardown_test_environment()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print_table(report)
+
+        failures = self._check_gates(report, options)
+        if failures:
+            raise CommandError("Gate de regressão violado:\n- " + "\n- ".join(failures))
+
+    def _print_table(self, report):
+        corpus = report["corpus"]
+        kinds = ", ".join(f"{k}={v}" for k, v in sorted(corpus["kinds"].items()))
+        self.stdout.write(f"Corpus: {corpus['messages']} mensagens, {_mb(corpus['bytes'])} ({kinds}), seed={corpus['seed']}")
+        header = f"{'cenário':<8}{'msgs':>7}{'tempo(s)':>10}{'msgs/s':>10}{'IMAP':>11}{'bytes/s':>12}{'queries':>9}{'q/msg':>7}{'py pico':>11}{'RSS pico':>11}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for r in report["results"]:
+            qpm = "-" if r["queries_per_msg"] is None else f"{r['queries_per_msg']:.2f}"
+            self.stdout.write(
+                f"{r['scenario']:<8}{r['messages']:>7}{r['seconds']:>10.3f}{r['msgs_per_sec']:>10.1f}"
+                f"{_mb(r['imap_bytes']):>11}{_mb(r['bytes_per_sec']) + '/s':>12}{r['queries']:>9}{qpm:>7}"
+                f"{_mb(r['py_peak_bytes']):>11}{_mb(r['rss_peak_bytes']):>11}"
+            )
+
+    def _check_gates(self, report, options) -> list:
+        results = {r["scenario"]: r for r in report["results"]}
+        cold, noop = results["cold"], results["noop"]
+        failures = []
+        if options["min_msgs_per_sec"] is not None and cold["msgs_per_sec"] < options["min_msgs_per_sec"]:
+            failures.append(f"cold: {cold['msgs_per_sec']} msgs/s < {options['min_msgs_per_sec']}")
+        if options["max_queries_per_msg"] is not None and (cold["queries_per_msg"] or 0) > options["max_queries_per_msg"]:
+            failures.append(f"cold: {cold['queries_per_msg']} queries/msg > {options['max_queries_per_msg']}")
+        if options["max_noop_queries"] is not None and noop["queries"] > options["max_noop_queries"]:
+            failures.append(f"noop: {noop['queries']} queries > {options['max_noop_queries']}")
+        peak_rss = max(r["rss_peak_bytes"] for r in report["results"])
+        if options["max_rss_mb"] is not None and peak_rss > options["max_rss_mb"] * 1024 * 1024:
+            failures.append(f"RSS pico {_mb(peak_rss)} > {options['max_rss_mb']} MB")
+        return failures
@@ -0,0 +1,40 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from tasks.idle import run_idle_listener
+
+
+class Command(BaseCommand):
+    help = (
+        "Listener IMAP IDLE: mantém uma conexão por MailBox ativa e ingere "
+        "emails assim que o servidor notifica (EXISTS)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--mailbox", type=int, action="append", dest="mailbox_ids",
+            help="Restringe o listener a estas MailBoxes (pode repetir).",
+        )
+        parser.add_argument(
+            "--refresh", type=int, default=60,
+            help="Intervalo (s) para recarregar a lista de MailBoxes ativas.",
+        )
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def _stop(signum, frame):
+            self.stdout.write("Encerrando listeners IMAP...")
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, _stop)
+        signal.signal(signal.SIGTERM, _stop)
+
+        self.stdout.write(self.style.SUCCESS("Listener IMAP IDLE iniciado."))
+        run_idle_listener(
+            stop_event=stop_event,
+            refresh_seconds=options["refresh"],
+            mailbox_ids=options["mailbox_ids"],
+        )
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django_q.models import Schedule
+
+from tasks.batch_worker import BATCH_FUNC, run_batch_cycle
+from tasks.queues import EXTRACTION, cluster_for
+
+
+class Command(BaseCommand):
+    help = (
+        "Modo lote (Batch API da OpenAI): aplica os lotes terminados e envia os "
+        "emails BATCHED acumulados num novo lote."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Envia os emails acumulados agora, sem esperar EXTRACTION_BATCH_MIN_REQUESTS / MAX_WAIT.",
+        )
+        parser.add_argument(
+            "--schedule", type=int, metavar="MINUTES", default=None,
+            help="Em vez de processar, cria/atualiza um Schedule do Django-Q que roda o ciclo a cada N min.",
+        )
+
+    def handle(self, *args, **options):
+        if options["schedule"]:
+            schedule, created = Schedule.objects.update_or_create(
+                func=BATCH_FUNC,
+                defaults={
+                    "name": "Processamento - Lotes da IA (Batch API)",
+                    "schedule_type": Schedule.MINUTES,
+                    "minutes": options["schedule"],
+                    "cluster": cluster_for(EXTRACTION),
+                },
+            )
+            verb = "criado" if created else "atualizado"
+            self.stdout.write(self.style.SUCCESS(f"Schedule dos lotes {verb} (a cada {schedule.minutes} min)."))
+            return
+
+        summary = run_batch_cycle(force=options["force"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Lotes: {summary['finished']} terminado(s), {summary['active']} em andamento; "
+            f"{summary['extracted']} extraído(s), {summary['review']} para revisão, "
+            f"{summary['requeued']} de volta à fila; {summary['submitted']} email(s) enviados."
+        ))
@@ -0,0 +1,67 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django_q.models import Schedule
+
+from tasks.claim_worker import CLAIM_FUNC, drain_pending_emails
+from tasks.queues import EXTRACTION, cluster_for
+
+
+class Command(BaseCommand):
+    help = (
+        "Claim worker: reserva e processa emails PENDING (ou com reserva vencida) "
+        "direto do banco. Pode rodar em vários nós ao mesmo tempo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=None,
+            help="Emails reservados por vez (padrão EMAIL_CLAIM_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Não sai quando a fila esvazia: espera --idle-sleep segundos e tenta de novo.",
+        )
+        parser.add_argument(
+            "--idle-sleep", type=int, default=10,
+            help="Espera (s) entre varreduras com a fila vazia (com --loop).",
+        )
+        parser.add_argument(
+            "--schedule", type=int, metavar="MINUTES", default=None,
+            help="Em vez de processar, cria/atualiza um Schedule do Django-Q que roda o claim worker a cada N min.",
+        )
+
+    def handle(self, *args, **options):
+        if options["schedule"]:
+            schedule, created = Schedule.objects.update_or_create(
+                func=CLAIM_FUNC,
+                defaults={
+                    "name": "Processamento - Claim worker",
+                    "schedule_type": Schedule.MINUTES,
+                    "minutes": options["schedule"],
+                    "kwargs": f"max_seconds={50 * options['schedule']}",
+                    "cluster": cluster_for(EXTRACTION),
+                },
+            )
+            verb = "criado" if created else "atualizado"
+            self.stdout.write(self.style.SUCCESS(f"Schedule do claim worker {verb} (a cada {schedule.minutes} min)."))
+            return
+
+        stop_event = threading.Event()
+
+        def _stop(signum, frame):
+            self.stdout.write("Encerrando claim worker após o bloco atual...")
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, _stop)
+        signal.signal(signal.SIGTERM, _stop)
+
+        while not stop_event.is_set():
+            summary = drain_pending_emails(batch_size=options["batch_size"], max_batches=1)
+            if summary["claimed"]:
+                continue
+            if not options["loop"]:
+                break
+            stop_event.wait(options["idle_sleep"])
+        self.stdout.write(self.style.SUCCESS("Claim worker encerrado."))
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from emails.models import EmailMessage
+from emails.raw_store import get_raw_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove do RawStore os blobs que nenhum EmailMessage referencia "
+        "(ex: mensagens duplicadas descartadas na ingestão ou emails apagados)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age-hours", type=float, default=24,
+            help="Só remove blobs mais antigos que isso (protege ingestões em andamento).",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Apenas lista o que seria removido.")
+
+    def handle(self, *args, **options):
+        store = get_raw_store()
+        referenced = set(
+            EmailMessage.objects.exclude(raw_sha256__isnull=True).values_list("raw_sha256", flat=True)
+        )
+        cutoff = time.time() - options["min_age_hours"] * 3600
+        modified_at = getattr(store, "modified_at", None)
+
+        removed = kept = 0
+        for key in list(store.keys()):
+            if key in referenced:
+                kept += 1
+                continue
+            if modified_at is not None and modified_at(key) > cutoff:
+                kept += 1
+                continue
+            # referências gravadas depois do levantamento acima (ingestão em andamento)
+            if EmailMessage.objects.filter(raw_sha256=key).exists():
+                kept += 1
+                continue
+            if not options["dry_run"]:
+                store.delete(key)
+            removed += 1
+
+        verb = "seriam removidos" if options["dry_run"] else "removidos"
+        self.stdout.write(f"RawStore: {removed} blobs {verb}, {kept} mantidos.")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django_q.models import Schedule
+
+from tasks.orchestrator import ORCHESTRATOR_FUNC
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria (ou atualiza) o Schedule único do orquestrador de fetch "
+        "(tasks.orchestrator.fetch_due_mailboxes). Use junto com IMAP_FETCH_ORCHESTRATOR=True."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--minutes", type=int, default=1,
+            help="Intervalo (min) entre execuções do orquestrador.",
+        )
+        parser.add_argument(
+            "--remove-per-mailbox", action="store_true",
+            help="Remove os Schedules antigos de fetch_emails (um por MailBox).",
+        )
+
+    def handle(self, *args, **options):
+        schedule, created = Schedule.objects.update_or_create(
+            func=ORCHESTRATOR_FUNC,
+            defaults={
+                "name": "Fetch - Orquestrador de MailBoxes",
+                "schedule_type": Schedule.MINUTES,
+                "minutes": options["minutes"],
+            },
+        )
+        verb = "criado" if created else "atualizado"
+        self.stdout.write(self.style.SUCCESS(f"Schedule do orquestrador {verb} (a cada {schedule.minutes} min)."))
+
+        if options["remove_per_mailbox"]:
+            removed, _detail = Schedule.objects.filter(func="tasks.tasks.fetch_emails").delete()
+            self.stdout.write(f"{removed} Schedule(s) por MailBox removido(s).")
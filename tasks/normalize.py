@@ -0,0 +1,261 @@
+"""
+Normalização do corpo antes de gravar o `body_text` (e de mandar ao LLM).
+
+Emails só com HTML (tribunais, ERPs) chegavam com tags, CSS inline e
+markup de rastreamento no prompt. `normalize_body` converte HTML em texto:
+- remove script/style/head e elementos ocultos (display:none, hidden, ...)
+- tabelas de dados viram texto alinhado em colunas; tabelas de layout
+  (uma coluna ou células com vários parágrafos) viram parágrafos
+- entidades decodificadas e espaços colapsados
+
+O resultado é cacheado por hash do conteúdo (a mesma newsletter/aviso
+chega em várias caixas e em vários reprocessamentos).
+"""
+import re
+import html as html_lib
+import hashlib
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+
+from django.conf import settings
+
+NORMALIZE_CACHE_SIZE = int(getattr(settings, "BODY_NORMALIZE_CACHE_SIZE", 1024))
+# Células maiores que isso desistem do alinhamento (a tabela é de layout)
+TABLE_CELL_MAX_WIDTH = 60
+
+_SKIP_TAGS = {"script", "style", "head", "title", "noscript", "template", "svg", "object", "iframe", "math"}
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+_BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "center", "dd", "div", "dl", "dt", "fieldset",
+    "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main",
+    "nav", "ol", "p", "pre", "section", "ul",
+}
+# Tags que fecham implicitamente um elemento aberto sem fechamento (regras do HTML):
+# um <p style="display:none"> sem </p> termina no próximo bloco
+_IMPLIED_END = {
+    "p": _BLOCK_TAGS | {"table"},
+    "li": {"li"},
+    "dt": {"dt", "dd"},
+    "dd": {"dt", "dd"},
+    "td": {"td", "th", "tr"},
+    "th": {"td", "th", "tr"},
+    "tr": {"tr"},
+    "option": {"option"},
+}
+_HIDDEN_STYLE = re.compile(r"display\s*:\s*none|visibility\s*:\s*hidden|mso-hide\s*:\s*all", re.I)
+_HTML_HINT = re.compile(r"<\s*(html|body|div|p|table|br|span|font|td)\b", re.I)
+# text/plain só vira HTML se começar como markup ou tiver várias tags diferentes
+_HTML_START = re.compile(r"\s*<\s*(!doctype|html|body|div|p|table|font|span)\b", re.I)
+_HTML_MIN_TAGS = 3
+_TAG = re.compile(r"<[^>]*>")
+_SCRIPT_STYLE = re.compile(r"<(script|style)\b.*?</\1\s*>", re.I | re.S)
+_SPACES = re.compile(r"[ \t\r\f\v\u00a0]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+# Preenchimento das colunas: sobrevive ao colapso de espaços e vira espaço no final
+_PAD = "\x00"
+
+
+def _is_hidden(tag, attrs) -> bool:
+    values = dict(attrs)
+    if "hidden" in values or (values.get("aria-hidden") or "").lower() == "true":
+        return True
+    if tag == "input" and (values.get("type") or "").lower() == "hidden":
+        return True
+    return bool(_HIDDEN_STYLE.search(values.get("style") or ""))
+
+
+def _clean(text: str) -> str:
+    lines = (_SPACES.sub(" ", line).strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+def _render_table(rows) -> str:
+    """Tabela de dados -> colunas alinhadas; tabela de layout -> um bloco por célula."""
+    rows = [[_clean(cell) for cell in row] for row in rows]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return ""
+    columns = max(len(row) for row in rows)
+    tabular = columns > 1 and all(
+        "\n" not in cell and len(cell) <= TABLE_CELL_MAX_WIDTH for row in rows for cell in row
+    )
+    if not tabular:
+        return "\n\n".join(cell for row in rows for cell in row if cell)
+
+    widths = [0] * columns
+    for row in rows:
+        for i, cell in enumerate(row):
+            widths[i] = max(widths[i], len(cell))
+    lines = []
+    for row in rows:
+        cells = row + [""] * (columns - len(row))
+        lines.append((_PAD * 2).join(cell.ljust(widths[i], _PAD) for i, cell in enumerate(cells)).rstrip(_PAD))
+    return "\n".join(lines)
+
+
+class _HTMLToText(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []          # saída fora de tabelas
+        self.tables = []       # pilha de {"rows": [...], "row": [...] | None, "cell": [...] | None}
+        self.skip_tag = None   # tag que abriu o trecho ignorado
+        self.skip_depth = 0
+        self.pre_depth = 0
+
+    # destino do texto: célula aberta da tabela mais interna, senão a saída
+    def _sink(self):
+        if self.tables and self.tables[-1]["cell"] is not None:
+            return self.tables[-1]["cell"]
+        return self.out
+
+    def _break(self, blank=False):
+        self._sink().append("\n\n" if blank else "\n")
+
+    def _close_cell(self, table):
+        if table["cell"] is not None:
+            if table["row"] is None:
+                table["row"] = []
+            table["row"].append("".join(table["cell"]))
+            table["cell"] = None
+
+    def _close_row(self, table):
+        self._close_cell(table)
+        if table["row"] is not None:
+            table["rows"].append(table["row"])
+            table["row"] = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.skip_tag:
+            if self.skip_depth == 1 and tag in _IMPLIED_END.get(self.skip_tag, ()):
+                self.skip_tag, self.skip_depth = None, 0  # oculto sem fechamento; esta tag segue normal
+            else:
+                if tag == self.skip_tag:
+                    self.skip_depth += 1
+                elif self.skip_tag == "head" and tag == "body":  # <head> sem fechamento
+                    self.skip_tag, self.skip_depth = None, 0
+                return
+        if tag in _SKIP_TAGS or _is_hidden(tag, attrs):
+            if tag not in _VOID_TAGS:
+                self.skip_tag, self.skip_depth = tag, 1
+            return
+
+        if tag == "table":
+            self.tables.append({"rows": [], "row": None, "cell": None})
+        elif tag == "tr" and self.tables:
+            self._close_row(self.tables[-1])
+            self.tables[-1]["row"] = []
+        elif tag in ("td", "th") and self.tables:
+            self._close_cell(self.tables[-1])
+            self.tables[-1]["cell"] = []
+        elif tag == "br":
+            self._break()
+        elif tag == "li":
+            self._break()
+            self._sink().append("- ")
+        elif tag in _BLOCK_TAGS:
+            self._break(blank=tag in ("p", "h1", "h2", "h3", "blockquote"))
+            if tag == "pre":
+                self.pre_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in _VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.skip_tag:
+            if tag == self.skip_tag:
+                self.skip_depth -= 1
+                if self.skip_depth <= 0:
+                    self.skip_tag = None
+            return
+
+        if tag == "table" and self.tables:
+            table = self.tables.pop()
+            self._close_row(table)
+            sink = self._sink()
+            sink.append("\n")
+            sink.append(_render_table(table["rows"]))
+            sink.append("\n")
+        elif tag == "tr" and self.tables:
+            self._close_row(self.tables[-1])
+        elif tag in ("td", "th") and self.tables:
+            self._close_cell(self.tables[-1])
+        elif tag in _BLOCK_TAGS and tag != "li":
+            if tag == "pre":
+                self.pre_depth = max(0, self.pre_depth - 1)
+            self._break(blank=tag in ("p", "h1", "h2", "h3", "blockquote"))
+
+    def handle_data(self, data):
+        if self.skip_tag or not data:
+            return
+        if not self.pre_depth:
+            data = re.sub(r"\s+", " ", data)
+        self._sink().append(data)
+
+    def text(self) -> str:
+        while self.tables:  # tabelas não fechadas
+            self.handle_endtag("table")
+        return _clean("".join(self.out)).replace(_PAD, " ")
+
+
+def html_to_text(html: str) -> str:
+    """Converte HTML em texto legível (sem markup, tabelas alinhadas)."""
+    parser = _HTMLToText()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        # HTML muito quebrado: melhor um texto parcial do que o markup inteiro
+        pass
+    text = parser.text()
+    if not text and html.strip():
+        # nada sobrou (ex: trecho oculto engoliu o documento): só tira as tags
+        text = _clean(html_lib.unescape(_TAG.sub(" ", _SCRIPT_STYLE.sub(" ", html))))
+    return text
+
+
+def looks_like_html(text: str) -> bool:
+    """
+    Heurística para text/plain que na verdade é HTML (comum em ERPs): o texto
+    começa com markup ou cita ao menos _HTML_MIN_TAGS tags diferentes. Texto
+    que só menciona um `<p` ou `<div` segue como texto (e mantém as quebras).
+    """
+    if not text:
+        return False
+    head = text[:2048]
+    if _HTML_START.match(head):
+        return True
+    return len({tag.lower() for tag in _HTML_HINT.findall(head)}) >= _HTML_MIN_TAGS
+
+
+# ----------------- Cache por hash do conteúdo -----------------
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cached_html_to_text(html: str) -> str:
+    key = hashlib.sha256(html.encode("utf-8", "surrogatepass")).digest()
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    text = html_to_text(html)
+    with _cache_lock:
+        _cache[key] = text
+        while len(_cache) > NORMALIZE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return text
+
+
+def normalize_body(text: str, subtype: str = None) -> str:
+    """
+    Etapa de normalização do corpo: HTML (declarado como text/html ou
+    detectado) vira texto; texto puro passa direto.
+    """
+    if not text:
+        return ""
+    if subtype == "html" or looks_like_html(text):
+        return _cached_html_to_text(text)
+    return text
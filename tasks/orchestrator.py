@@ -0,0 +1,139 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from emails.models import MailBox
+from tasks.tasks import _imap_settings, fetch_mailbox_report
+
+logger = logging.getLogger(__name__)
+
+
+# Limites de concorrência do orquestrador
+MAX_WORKERS = int(getattr(settings, "IMAP_FETCH_MAX_WORKERS", 16))
+MAX_CONNECTIONS_PER_HOST = int(getattr(settings, "IMAP_MAX_CONNECTIONS_PER_HOST", 4))
+HOST_CONNECTION_LIMITS = dict(getattr(settings, "IMAP_HOST_CONNECTION_LIMITS", {}))
+# Reserva da caixa enquanto o fetch roda (se o worker morrer, ela volta a vencer depois disso)
+CLAIM_LEASE = timedelta(minutes=10)
+
+ORCHESTRATOR_FUNC = "tasks.orchestrator.fetch_due_mailboxes"
+
+
+class HostLimiter:
+    """
+    Um semáforo por host IMAP (Gmail/Outlook limitam logins paralelos).
+    O limite padrão vale para todo host sem entrada em `limits`.
+    """
+
+    def __init__(self, default_limit=None, limits=None):
+        self.default_limit = max(1, int(default_limit or MAX_CONNECTIONS_PER_HOST))
+        self.limits = {str(h).lower(): max(1, int(n)) for h, n in (limits or HOST_CONNECTION_LIMITS).items()}
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def for_host(self, host) -> threading.Semaphore:
+        key = (host or "").lower()
+        with self._lock:
+            if key not in self._semaphores:
+                self._semaphores[key] = threading.Semaphore(self.limits.get(key, self.default_limit))
+            return self._semaphores[key]
+
+
+# ----------------- Seleção das caixas -----------------
+def _claim_due_mailboxes(now=None) -> list:
+    """
+    MailBoxes ativas cuja próxima busca (`next_fetch_at`, polling adaptativo
+    de tasks.scheduling) já venceu.
+    Cada caixa é "reivindicada" com um UPDATE condicional em `next_fetch_at`,
+    para que duas execuções sobrepostas do orquestrador não busquem a mesma
+    caixa em paralelo. Retorna [(mailbox_id, host), ...].
+    """
+    now = now or timezone.now()
+    due = MailBox.objects.filter(is_active=True).filter(
+        Q(next_fetch_at__isnull=True) | Q(next_fetch_at__lte=now)
+    ).order_by("next_fetch_at", "id")
+
+    claimed = []
+    for mailbox in due:
+        updated = MailBox.objects.filter(pk=mailbox.pk, next_fetch_at=mailbox.next_fetch_at).update(
+            next_fetch_at=now + CLAIM_LEASE,
+        )
+        if updated:
+            claimed.append((mailbox.id, _imap_settings(mailbox)["host"]))
+    return claimed
+
+
+# ----------------- Execução concorrente -----------------
+def _run_one(mailbox_id, host, limiter, fetch_func):
+    """Executa o fetch de uma caixa respeitando o limite do host (roda numa thread)."""
+    waited = time.monotonic()
+    try:
+        with limiter.for_host(host):
+            queued_seconds = round(time.monotonic() - waited, 3)
+            report = fetch_func(mailbox_id)
+        report = dict(report)
+        report["queued_seconds"] = queued_seconds
+        report.setdefault("host", host)
+        return report
+    except Exception as e:
+        logger.exception("[fetch_due_mailboxes] Falha inesperada na MailBox %s: %s", mailbox_id, e)
+        return {"mailbox_id": mailbox_id, "host": host, "created": 0, "seconds": 0.0, "error": str(e)}
+    finally:
+        # cada thread abre a própria conexão com o banco; fecha ao terminar
+        connection.close()
+
+
+def fetch_mailboxes_concurrently(targets, max_workers=None, limiter=None, fetch_func=None) -> list:
+    """
+    Busca as caixas `targets` ([(mailbox_id, host), ...]) em paralelo, com
+    limite global (`max_workers`) e por host (`limiter`).
+    Retorna a lista de relatórios, na ordem de `targets`.
+    """
+    if not targets:
+        return []
+    max_workers = max(1, int(max_workers or MAX_WORKERS))
+    limiter = limiter or HostLimiter()
+    fetch_func = fetch_func or fetch_mailbox_report
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(targets)), thread_name_prefix="fetch-mailbox") as pool:
+        futures = [pool.submit(_run_one, mailbox_id, host, limiter, fetch_func) for mailbox_id, host in targets]
+        return [f.result() for f in futures]
+
+
+# ----------------- TASK DO ORQUESTRADOR -----------------
+def fetch_due_mailboxes(max_workers=None) -> dict:
+    """
+    Task única (Schedule a cada minuto) que substitui um Schedule por MailBox:
+    encontra as caixas vencidas (intervalo adaptativo por caixa) e busca
+    todas em paralelo.
+    Retorna um resumo com o relatório por caixa (duração, emails criados, erro).
+    """
+    started = time.monotonic()
+    targets = _claim_due_mailboxes()
+    reports = fetch_mailboxes_concurrently(targets, max_workers=max_workers)
+
+    summary = {
+        "mailboxes": len(reports),
+        "created": sum(r["created"] for r in reports),
+        "failed": sum(1 for r in reports if r.get("error")),
+        "seconds": round(time.monotonic() - started, 3),
+        "reports": reports,
+    }
+    for r in reports:
+        logger.info(
+            "[fetch_due_mailboxes] MailBox %s (%s): %s novo(s) em %.2fs (fila %.2fs)%s",
+            r["mailbox_id"], r.get("host"), r["created"], r["seconds"], r.get("queued_seconds", 0.0),
+            f" - ERRO: {r['error']}" if r.get("error") else "",
+        )
+    if reports:
+        logger.info(
+            "[fetch_due_mailboxes] %s caixa(s), %s email(s) novo(s), %s falha(s) em %.2fs.",
+            summary["mailboxes"], summary["created"], summary["failed"], summary["seconds"],
+        )
+    return summary
@@ -0,0 +1,62 @@
+"""
+Fila de prioridade dos emails (`EmailMessage.priority`).
+
+A fila do Django-Q é FIFO: uma intimação com prazo esperava atrás de
+centenas de newsletters e ordens de serviço. Na ingestão cada email com
+regra recebe uma fila (emails.models.EmailPriority), a mais alta entre:
+
+- URGENT: assunto ou remetente com um marcador de urgência
+  (EMAIL_URGENT_MARKERS, sem diferenciar acentos: "URGENTE", "Intimação", ...)
+- HIGH: perfil da regra com schema de prazo (EMAIL_HIGH_PRIORITY_SCHEMAS,
+  ex: ProcessoJuridicoSchema) ou `AutomationRule.priority` abaixo do padrão
+- LOW: `AutomationRule.priority` >= RULE_PRIORITY_LOW_MIN
+- NORMAL: o resto
+
+Os workers esvaziam as filas mais altas primeiro (tasks.claim_worker) e as
+tasks do Django-Q são enfileiradas por fila (urgentes primeiro, sozinhas).
+Proteção contra inanição: uma fração de cada reserva (EMAIL_LANE_FIFO_SHARE)
+vai sempre para os emails mais antigos, de qualquer fila.
+"""
+import unicodedata
+
+from django.conf import settings
+
+from emails.models import EmailPriority
+
+URGENT_MARKERS = [
+    m for m in getattr(settings, "EMAIL_URGENT_MARKERS", ["urgente", "intimacao", "citacao", "prazo fatal"]) if m
+]
+HIGH_PRIORITY_SCHEMAS = set(getattr(settings, "EMAIL_HIGH_PRIORITY_SCHEMAS", ["ProcessoJuridicoSchema"]))
+# AutomationRule.priority (menor = antes): padrão 10
+RULE_PRIORITY_HIGH_MAX = 9
+RULE_PRIORITY_LOW_MIN = 50
+
+
+def fold(text: str) -> str:
+    """Minúsculas e sem acentos ("Intimação" -> "intimacao")."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+_FOLDED_MARKERS = [fold(m) for m in URGENT_MARKERS]
+
+
+def has_urgent_marker(subject: str, sender: str = "") -> bool:
+    text = fold(f"{subject or ''}\n{sender or ''}")
+    return any(marker in text for marker in _FOLDED_MARKERS)
+
+
+def email_priority(subject: str, sender: str, rule=None) -> int:
+    """Fila do email a partir dos marcadores, do perfil e da prioridade da regra."""
+    if has_urgent_marker(subject, sender):
+        return EmailPriority.URGENT
+    if rule is None:
+        return EmailPriority.LOW
+    profile = rule.extraction_profile
+    if profile is not None and profile.pydantic_schema_name in HIGH_PRIORITY_SCHEMAS:
+        return EmailPriority.HIGH
+    if rule.priority <= RULE_PRIORITY_HIGH_MAX:
+        return EmailPriority.HIGH
+    if rule.priority >= RULE_PRIORITY_LOW_MIN:
+        return EmailPriority.LOW
+    return EmailPriority.NORMAL
@@ -0,0 +1,33 @@
+"""
+Filas isoladas por tipo de carga (clusters do Django-Q).
+
+Com um cluster só, fetch IMAP, chamadas à IA (segundos cada) e posts no
+Telegram disputavam os mesmos workers: uma fase lenta da OpenAI parava a
+ingestão e um IMAP travado parava a extração. Com Q_ISOLATED_QUEUES=True
+cada etapa vai para o seu cluster (Q_CLUSTER['ALT_CLUSTERS']), com
+workers, timeout e retry próprios:
+
+- ingestão (fetch_emails, orquestrador): cluster padrão do Q_CLUSTER
+- extração (process_email_batch, process_email, claim worker): "extraction"
+- entrega (deliver_email: notificação Telegram): "delivery"
+
+Cada cluster roda num processo `Q_CLUSTER_NAME=<fila> python manage.py qcluster`
+(o padrão sem a variável). O Django-Q lê Q_CLUSTER_NAME do ambiente ao
+importar sua configuração: `qcluster --name` chega tarde demais no Linux.
+Desligado, tudo vai para o cluster padrão e a entrega roda na mesma task
+da extração (comportamento anterior).
+"""
+from django.conf import settings
+
+INGESTION = "ingestion"
+EXTRACTION = "extraction"
+DELIVERY = "delivery"
+
+ISOLATED = bool(getattr(settings, "Q_ISOLATED_QUEUES", False))
+
+
+def cluster_for(stage):
+    """Nome do cluster do Django-Q para a etapa (None = cluster padrão)."""
+    if not ISOLATED or stage == INGESTION:
+        return None
+    return stage
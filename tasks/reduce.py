@@ -0,0 +1,193 @@
+"""
+Redução do corpo antes da extração por IA.
+
+Remove o que não ajuda o modelo e só custa tokens:
+- histórico citado de respostas (linhas com `>`, "Em ... escreveu:",
+  "On ... wrote:", "-----Mensagem original-----", blocos De:/Enviado:)
+- assinaturas (delimitador "-- " e "Enviado do meu ...")
+- rodapés fixos por domínio do remetente (avisos legais, rodapés que o
+  tribunal anexa a toda intimação), aprendidos dos últimos emails do
+  mesmo domínio: linhas finais que se repetem na maioria deles.
+
+Mensagens encaminhadas NÃO são cortadas (o conteúdo útil costuma estar
+no encaminhamento): marcador "Mensagem encaminhada"/"Forwarded message" ou
+bloco De:/Enviado: com "Assunto: ENC:/FW:/Fwd:". Se a redução esvaziar o texto, o corpo original é usado.
+"""
+import re
+import time
+import logging
+import threading
+from email.utils import parseaddr
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+REDUCTION_ENABLED = bool(getattr(settings, "BODY_REDUCTION_ENABLED", True))
+FOOTER_SAMPLE_SIZE = int(getattr(settings, "BODY_FOOTER_SAMPLE_SIZE", 20))
+FOOTER_MIN_EMAILS = int(getattr(settings, "BODY_FOOTER_MIN_EMAILS", 3))
+FOOTER_MIN_RATIO = float(getattr(settings, "BODY_FOOTER_MIN_RATIO", 0.6))
+FOOTER_CACHE_SECONDS = int(getattr(settings, "BODY_FOOTER_CACHE_SECONDS", 3600))
+
+# Início do histórico citado: tudo a partir daqui é descartado
+_QUOTE_HEADERS = [
+    re.compile(r"^\s*(Em|On)\s.{0,200}(escreveu|wrote)\s*:\s*$", re.I),
+    re.compile(r"^\s*-{2,}\s*(Mensagem original|Original Message)\s*-{2,}\s*$", re.I),
+]
+# Bloco de cabeçalho do Outlook ("De: ...\nEnviado em: ...\nAssunto: ...") sem separador
+_OUTLOOK_FROM = re.compile(r"^\s*\*?(De|From)\s*:\*?\s", re.I)
+_OUTLOOK_SENT = re.compile(r"^\s*\*?(Enviad[ao]( em)?|Sent)\s*:\*?\s", re.I)
+_OUTLOOK_SUBJECT = re.compile(r"^\s*\*?(Assunto|Subject)\s*:\*?", re.I)
+_UNDERSCORES = re.compile(r"^\s*_{10,}\s*$")  # separador do Outlook antes do bloco De:
+# Encaminhamento: daqui para baixo é o conteúdo útil, nada é cortado
+_FORWARD_MARKER = re.compile(
+    r"^\s*(-{2,}\s*(Mensagem encaminhada|Forwarded message)\s*-{2,}"
+    r"|(In[ií]cio da mensagem encaminhada|Begin forwarded message)\s*:)\s*$", re.I,
+)
+_FORWARD_SUBJECT = re.compile(r"^\s*\*?(Assunto|Subject)\s*:\*?\s*(ENC|FWD?|TR)\s*:", re.I)
+_SIGNATURE_DELIMITER = re.compile(r"^--\s?$")
+_MOBILE_SIGNATURE = re.compile(r"^\s*(Enviado do meu|Enviado de meu|Sent from my)\s", re.I)
+
+
+def _is_forward(lines, i):
+    """Linha `i` abre um encaminhamento (marcador, ou bloco De: do Outlook com Assunto: ENC:/FW:)."""
+    if _FORWARD_MARKER.match(lines[i]):
+        return True
+    return bool(_OUTLOOK_FROM.match(lines[i])) and any(_FORWARD_SUBJECT.match(n) for n in lines[i + 1:i + 6])
+
+
+def _block_start(lines, i):
+    # inclui o separador do Outlook (e linhas vazias) logo acima do bloco
+    while i > 0 and (not lines[i - 1].strip() or _UNDERSCORES.match(lines[i - 1])):
+        i -= 1
+    return i
+
+
+def _forward_start(lines):
+    """Início do primeiro encaminhamento (com o separador acima), ou None."""
+    for i in range(len(lines)):
+        if _is_forward(lines, i):
+            return _block_start(lines, i)
+    return None
+
+
+def _cut_quoted_history(lines):
+    for i, line in enumerate(lines):
+        if _is_forward(lines, i):
+            return lines
+        if any(p.match(line) for p in _QUOTE_HEADERS):
+            return lines[:i]
+        if _OUTLOOK_FROM.match(line):
+            block = lines[i + 1:i + 6]
+            if any(_OUTLOOK_SENT.match(n) for n in block) and any(_OUTLOOK_SUBJECT.match(n) for n in block):
+                return lines[:_block_start(lines, i)]
+    return lines
+
+
+def _cut_signature(lines):
+    # a assinatura de quem encaminhou sai, o conteúdo encaminhado abaixo dela fica
+    forward = _forward_start(lines)
+    head, forwarded = (lines, []) if forward is None else (lines[:forward], lines[forward:])
+    for i, line in enumerate(head):
+        if _SIGNATURE_DELIMITER.match(line) or _MOBILE_SIGNATURE.match(line):
+            return head[:i] + forwarded
+    return lines
+
+
+def _cut_footer(lines, footer_lines):
+    """Remove do fim o bloco de linhas (ignorando vazias) que é rodapé conhecido do domínio."""
+    if not footer_lines:
+        return lines
+    end = len(lines)
+    while end > 0 and (not lines[end - 1].strip() or _footer_key(lines[end - 1]) in footer_lines):
+        end -= 1
+    return lines[:end]
+
+
+def _footer_key(line: str) -> str:
+    return " ".join(line.split()).lower()
+
+
+def reduce_text(text: str, footer_lines=frozenset()) -> str:
+    """Aplica as reduções (citação, assinatura, rodapé) e devolve o texto reduzido."""
+    if not text:
+        return ""
+    lines = [line for line in text.splitlines() if not line.lstrip().startswith(">")]
+    lines = _cut_quoted_history(lines)
+    lines = _cut_signature(lines)
+    lines = _cut_footer(lines, footer_lines)
+    reduced = "\n".join(lines).strip()
+    return re.sub(r"\n{3,}", "\n\n", reduced)
+
+
+# ----------------- Rodapés aprendidos por domínio -----------------
+def sender_domain(sender: str) -> str:
+    return parseaddr(sender or "")[1].rpartition("@")[2].lower()
+
+
+def learn_footer_lines(bodies) -> frozenset:
+    """
+    Linhas (normalizadas) que aparecem no fim da maioria dos corpos de
+    exemplo. Só olha as últimas linhas de cada corpo: conteúdo repetido no
+    meio do texto (ex: rótulos de formulário) não vira rodapé.
+    """
+    bodies = [b for b in bodies if b]
+    if len(bodies) < FOOTER_MIN_EMAILS:
+        return frozenset()
+    counts = {}
+    for body in bodies:
+        tail = [line for line in body.splitlines() if line.strip()][-40:]
+        for key in {_footer_key(line) for line in tail}:
+            counts[key] = counts.get(key, 0) + 1
+    needed = max(FOOTER_MIN_EMAILS, int(len(bodies) * FOOTER_MIN_RATIO + 0.999))
+    return frozenset(key for key, count in counts.items() if count >= needed)
+
+
+_footer_cache = {}
+_footer_lock = threading.Lock()
+
+
+def footer_lines_for(email) -> frozenset:
+    """Rodapé conhecido do domínio do remetente (cacheado por FOOTER_CACHE_SECONDS)."""
+    from emails.models import EmailMessage  # evita import circular
+
+    domain = sender_domain(email.sender)
+    if not domain:
+        return frozenset()
+    now = time.monotonic()
+    with _footer_lock:
+        cached = _footer_cache.get(domain)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    bodies = list(
+        EmailMessage.objects.filter(sender__icontains=f"@{domain}")
+        .exclude(pk=email.pk)
+        .order_by("-id")
+        .values_list("body_text", flat=True)[:FOOTER_SAMPLE_SIZE]
+    )
+    footer = learn_footer_lines(bodies)
+    with _footer_lock:
+        _footer_cache[domain] = (now + FOOTER_CACHE_SECONDS, footer)
+    return footer
+
+
+def reduce_email_body(email) -> str:
+    """
+    Etapa de redução antes do LLM: grava em `email.body_reduced` o texto
+    reduzido e em `email.body_bytes_saved` a economia (não salva no banco).
+    Retorna o texto a enviar ao modelo.
+    """
+    body = email.body_text or ""
+    if not REDUCTION_ENABLED or not body:
+        return body
+    try:
+        reduced = reduce_text(body, footer_lines_for(email))
+    except Exception as e:
+        logger.warning("Falha ao reduzir corpo do email %s: %s", email.id, e)
+        return body
+    if not reduced:
+        reduced = body  # só havia citação/rodapé: melhor mandar tudo do que nada
+    email.body_reduced = reduced
+    email.body_bytes_saved = len(body.encode("utf-8")) - len(reduced.encode("utf-8"))
+    return reduced
@@ -0,0 +1,330 @@
+"""
+Matcher compilado das Regras de Automação, por MailBox.
+
+Em vez de uma query + um loop com `.lower()` por regra a cada email, as
+regras ativas da caixa são compiladas uma vez num plano de avaliação:
+autômatos Aho-Corasick com os padrões de texto de todas as regras (um por
+campo: assunto, remetente, corpo), regex compiladas e, por regra, as
+verificações baratas antes das caras (condições em emails/rule_conditions.py).
+Casar um email custa O(tamanho do texto) e nenhuma query; a prioridade
+continua a mesma (`priority`, depois `name`).
+
+Cache em memória por processo, invalidado:
+- pelos signals post_save/post_delete de AutomationRule e ExtractionProfile
+  (no commit da transação), no processo que fez a alteração;
+- por tempo (RULE_MATCHER_CACHE_SECONDS) nos demais processos (workers do
+  Django-Q), que não recebem os signals.
+"""
+import time
+import threading
+from collections import deque
+from email.utils import parseaddr
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from emails.rule_conditions import compile_regex
+
+CACHE_SECONDS = int(getattr(settings, "RULE_MATCHER_CACHE_SECONDS", 60))
+
+
+class AhoCorasick:
+    """Autômato de múltiplos padrões: `find(texto)` devolve os índices dos padrões presentes."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [set()]
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                nxt = self.goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][char] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(set())
+                state = nxt
+            self.out[state].add(index)
+
+        # links de falha em largura (BFS); a saída de cada estado herda a do seu link
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(char, 0)
+                self.out[nxt] |= self.out[self.fail[nxt]]
+
+    def find(self, text: str) -> set:
+        found = set()
+        state = 0
+        goto, fail, out = self.goto, self.fail, self.out
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+# Custo relativo de cada verificação: o plano avalia as baratas primeiro
+_COST_HITS, _COST_LOOKUP, _COST_REGEX, _COST_BODY_HITS, _COST_BODY_REGEX = 0, 1, 2, 3, 4
+
+
+class _Context:
+    """Campos de um email para uma passada de avaliação (hits calculados uma vez, sob demanda)."""
+
+    def __init__(self, matcher, subject, sender, headers, body):
+        self.matcher = matcher
+        self.subject = (subject or "").lower()
+        self.sender = (sender or "").lower()
+        self.headers = {k.lower(): v for k, v in (headers or {}).items()}
+        self.body = body.lower() if body is not None else None  # None = corpo ainda não baixado
+        self._hits = {}
+        self._domain = None
+
+    def hits(self, field):
+        if field not in self._hits:
+            text = self.body if field == "body" else getattr(self, field)
+            self._hits[field] = self.matcher.automata[field].find(text)
+        return self._hits[field]
+
+    def text(self, field):
+        return self.body if field == "body" else getattr(self, field)
+
+    @property
+    def domain(self):
+        if self._domain is None:
+            self._domain = parseaddr(self.sender)[1].rpartition("@")[2]
+        return self._domain
+
+
+def _evaluate_check(check, ctx):
+    """True/False, ou None quando depende do corpo e ele ainda não foi baixado."""
+    kind, field = check[1], check[2]
+    if field == "body" and ctx.body is None:
+        return None
+    if kind == "hits_all":
+        return all(i in ctx.hits(field) for i in check[3])
+    if kind == "hits_any":
+        return any(i in ctx.hits(field) for i in check[3])
+    if kind == "regex":
+        return check[3].search(ctx.text(field)) is not None
+    if kind == "domain":
+        return any(ctx.domain == d or ctx.domain.endswith("." + d) for d in check[3])
+    # cabeçalhos
+    value = ctx.headers.get(check[3])
+    if kind == "header_present":
+        return value is not None
+    if value is None:
+        return False
+    if kind == "header_contains":
+        return check[4] in value.lower()
+    return check[4].search(value) is not None
+
+
+class _RulePlan:
+    """Plano de uma regra: condições legadas + condições avançadas ordenadas por custo."""
+
+    def __init__(self, rule, required, checks, match_any):
+        self.rule = rule
+        self.required = required          # verificações legadas (sempre em E)
+        self.checks = sorted(checks, key=lambda c: c[0])
+        self.match_any = match_any
+
+    def evaluate(self, ctx):
+        unknown = False
+        for check in self.required:
+            if not _evaluate_check(check, ctx):
+                return False
+        if not self.checks:
+            return True
+        for check in self.checks:
+            result = _evaluate_check(check, ctx)
+            if result is None:
+                unknown = True
+            elif result is self.match_any:
+                return result
+        if unknown:
+            return None
+        return not self.match_any
+
+
+class CompiledRuleMatcher:
+    """
+    Regras ativas de uma MailBox compiladas num único plano de avaliação:
+    os padrões de texto de todas as regras ficam em um autômato por campo
+    (assunto, remetente, corpo), as regex são compiladas uma vez e cada
+    regra verifica primeiro o que é barato.
+    """
+
+    def __init__(self, rules):
+        self.rules = sorted(rules, key=lambda r: (r.priority, r.name))
+        self.by_id = {rule.id: rule for rule in self.rules}
+        self._patterns = {"subject": {}, "sender": {}, "body": {}}
+        self.plans = []
+        self.always = []             # posições sem âncora: sempre avaliadas
+        self.by_anchor = {}          # (campo, padrão) -> posições das regras ancoradas nele
+        self.header_names = []
+        self.uses_body = False
+
+        for position, rule in enumerate(self.rules):
+            plan = self._compile(rule)
+            self.plans.append(plan)
+            anchor = self._anchor(plan)
+            if anchor is None:
+                self.always.append(position)
+            else:
+                self.by_anchor.setdefault(anchor, []).append(position)
+
+        self.automata = {field: AhoCorasick(list(patterns)) for field, patterns in self._patterns.items()}
+
+    def _pattern(self, field, value):
+        return self._patterns[field].setdefault(value.lower(), len(self._patterns[field]))
+
+    def _compile(self, rule):
+        required = []
+        for field, value in (("subject", rule.subject_contains), ("sender", rule.sender_contains)):
+            if value and value.strip():
+                required.append((_COST_HITS, "hits_all", field, (self._pattern(field, value),)))
+
+        checks = []
+        for condition in getattr(rule, "conditions", None) or []:
+            field, op, value = condition["field"], condition["op"], condition.get("value")
+            body = field == "body"
+            if field in ("subject", "sender", "body"):
+                if op == "regex":
+                    checks.append((_COST_BODY_REGEX if body else _COST_REGEX, "regex", field, compile_regex(value)))
+                else:
+                    values = value if isinstance(value, list) else [value]
+                    ids = tuple(self._pattern(field, v) for v in values)
+                    kind = "hits_any" if op == "any_of" else "hits_all"
+                    checks.append((_COST_BODY_HITS if body else _COST_HITS, kind, field, ids))
+                self.uses_body = self.uses_body or body
+            elif field == "sender_domain":
+                domains = tuple(value if isinstance(value, list) else [value])
+                checks.append((_COST_LOOKUP, "domain", field, domains))
+            elif field == "header":
+                name = condition["header"].lower()
+                if name not in (h.lower() for h in self.header_names):
+                    self.header_names.append(condition["header"])
+                if op == "present":
+                    checks.append((_COST_LOOKUP, "header_present", field, name))
+                elif op == "contains":
+                    checks.append((_COST_LOOKUP, "header_contains", field, name, value.lower()))
+                else:
+                    checks.append((_COST_REGEX, "header_regex", field, name, compile_regex(value)))
+        return _RulePlan(rule, required, checks, match_any=getattr(rule, "conditions_match", "ALL") == "ANY")
+
+    @staticmethod
+    def _anchor(plan):
+        """Padrão de assunto/remetente obrigatório para a regra casar (poda as candidatas)."""
+        anchors = list(plan.required)
+        if not plan.match_any:
+            anchors += [c for c in plan.checks if c[1] == "hits_all" and c[2] in ("subject", "sender")]
+        for check in anchors:
+            return check[2], check[3][0]
+        return None
+
+    def evaluate(self, subject, sender, headers=None, body=None):
+        """
+        Uma passada sobre as regras candidatas, em ordem de prioridade.
+        Retorna (regra, precisa_do_corpo): com `body=None` (corpo ainda não
+        baixado), uma regra de maior prioridade que depende do corpo faz
+        devolver (None, True).
+        """
+        ctx = _Context(self, subject, sender, headers, body)
+        candidates = list(self.always)
+        if self.by_anchor:
+            for field in ("subject", "sender"):
+                for index in ctx.hits(field):
+                    candidates.extend(self.by_anchor.get((field, index), ()))
+
+        for position in sorted(set(candidates)):
+            result = self.plans[position].evaluate(ctx)
+            if result is None:
+                return None, True
+            if result:
+                return self.rules[position], False
+        return None, False
+
+    def match(self, subject, sender, headers=None, body=""):
+        """Primeira regra (por prioridade) que casa, ou None (corpo ausente conta como vazio)."""
+        return self.evaluate(subject, sender, headers, body if body is not None else "")[0]
+
+
+# ----------------- Cache por MailBox -----------------
+_matchers = {}
+_lock = threading.Lock()
+
+
+def get_rule_matcher(mailbox_id) -> CompiledRuleMatcher:
+    """Matcher da MailBox (1 query na primeira chamada ou após invalidação/expiração)."""
+    from emails.models import AutomationRule  # evita import circular
+
+    now = time.monotonic()
+    with _lock:
+        cached = _matchers.get(mailbox_id)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    rules = list(
+        AutomationRule.objects.filter(mailbox_id=mailbox_id, is_active=True).select_related("extraction_profile")
+    )
+    matcher = CompiledRuleMatcher(rules)
+    with _lock:
+        _matchers[mailbox_id] = (now + CACHE_SECONDS, matcher)
+    return matcher
+
+
+def get_rule_matchers(mailbox_ids) -> dict:
+    """{mailbox_id: matcher}; as caixas fora do cache são carregadas numa única query."""
+    from emails.models import AutomationRule  # evita import circular
+
+    now = time.monotonic()
+    matchers, missing = {}, set()
+    with _lock:
+        for mailbox_id in set(mailbox_ids):
+            cached = _matchers.get(mailbox_id)
+            if cached and cached[0] > now:
+                matchers[mailbox_id] = cached[1]
+            else:
+                missing.add(mailbox_id)
+    if missing:
+        rules_by_mailbox = {mailbox_id: [] for mailbox_id in missing}
+        rules = AutomationRule.objects.filter(mailbox_id__in=missing, is_active=True).select_related("extraction_profile")
+        for rule in rules:
+            rules_by_mailbox[rule.mailbox_id].append(rule)
+        with _lock:
+            for mailbox_id, rules in rules_by_mailbox.items():
+                matchers[mailbox_id] = CompiledRuleMatcher(rules)
+                _matchers[mailbox_id] = (now + CACHE_SECONDS, matchers[mailbox_id])
+    return matchers
+
+
+def invalidate_rule_matcher(mailbox_id=None):
+    """Descarta o matcher da caixa (ou todos, com mailbox_id=None)."""
+    with _lock:
+        if mailbox_id is None:
+            _matchers.clear()
+        else:
+            _matchers.pop(mailbox_id, None)
+
+
+@receiver([post_save, post_delete], sender="emails.AutomationRule")
+def _rule_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_rule_matcher(instance.mailbox_id))
+
+
+@receiver([post_save, post_delete], sender="extraction.ExtractionProfile")
+def _profile_changed(sender, instance, **kwargs):
+    # o matcher guarda as regras com o perfil já carregado (prompt/schema)
+    transaction.on_commit(invalidate_rule_matcher)
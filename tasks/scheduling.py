@@ -0,0 +1,109 @@
+"""
+Polling adaptativo por MailBox.
+
+- Intervalo: caixas movimentadas são consultadas com mais frequência; caixas
+  quietas recuam aos poucos (x1.5 por fetch vazio) até `IMAP_POLL_MAX_SECONDS`.
+  A taxa de chegada vem do histórico já gravado (`EmailMessage.received_at`).
+- Falhas: backoff exponencial (`intervalo * 2^falhas`, até
+  `IMAP_ERROR_BACKOFF_MAX_SECONDS`) e alerta no Telegram apenas na 1ª, 2ª,
+  4ª, 8ª... falha consecutiva, em vez de um alerta a cada ciclo.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from emails.models import MailBox, EmailMessage
+
+logger = logging.getLogger(__name__)
+
+
+POLL_MIN_SECONDS = int(getattr(settings, "IMAP_POLL_MIN_SECONDS", 60))
+POLL_MAX_SECONDS = int(getattr(settings, "IMAP_POLL_MAX_SECONDS", 3600))
+POLL_DEFAULT_SECONDS = int(getattr(settings, "IMAP_POLL_DEFAULT_SECONDS", 300))
+ERROR_BACKOFF_MAX_SECONDS = int(getattr(settings, "IMAP_ERROR_BACKOFF_MAX_SECONDS", 6 * 3600))
+
+RATE_WINDOW = timedelta(hours=24)  # janela do histórico usada para estimar a taxa de chegada
+QUIET_BACKOFF_FACTOR = 1.5         # crescimento do intervalo a cada fetch sem emails novos
+
+
+def _clamp(seconds) -> int:
+    return int(max(POLL_MIN_SECONDS, min(POLL_MAX_SECONDS, seconds)))
+
+
+def rate_based_interval(received_in_window: int) -> int:
+    """Intervalo que daria ~1 email novo por fetch, dada a chegada na janela."""
+    if received_in_window <= 0:
+        return POLL_MAX_SECONDS
+    return _clamp(RATE_WINDOW.total_seconds() / received_in_window)
+
+
+def next_poll_interval(current, created: int, received_in_window: int) -> int:
+    """
+    Próximo intervalo de polling (s) após um fetch bem-sucedido.
+    - Chegaram emails: cai para a taxa histórica ou pela metade, o que for menor.
+    - Fetch vazio: cresce x1.5, mas não passa da taxa histórica se ela já foi
+      alcançada (caixa movimentada não recua por um ciclo vazio).
+    """
+    current = current or POLL_DEFAULT_SECONDS
+    target = rate_based_interval(received_in_window)
+    if created > 0:
+        return _clamp(min(target, current / 2))
+    return _clamp(min(current * QUIET_BACKOFF_FACTOR, max(target, current)))
+
+
+def error_backoff_seconds(interval, failures: int) -> int:
+    """Espera após `failures` falhas consecutivas (exponencial, com teto)."""
+    interval = interval or POLL_DEFAULT_SECONDS
+    return int(min(ERROR_BACKOFF_MAX_SECONDS, interval * (2 ** max(0, failures))))
+
+
+def should_alert(failures: int) -> bool:
+    """Alerta na 1ª, 2ª, 4ª, 8ª... falha consecutiva (potências de 2)."""
+    return failures > 0 and (failures & (failures - 1)) == 0
+
+
+def is_due(mailbox: MailBox, now=None) -> bool:
+    next_fetch_at = getattr(mailbox, "next_fetch_at", None)
+    return next_fetch_at is None or next_fetch_at <= (now or timezone.now())
+
+
+def record_fetch_result(mailbox_id, report: dict, now=None) -> bool:
+    """
+    Atualiza intervalo/próxima busca/falhas da MailBox a partir do relatório
+    do fetch (tasks.tasks.fetch_mailbox_report).
+    Retorna True se a falha deste fetch deve gerar alerta.
+    """
+    now = now or timezone.now()
+    try:
+        mailbox = MailBox.objects.only("id", "poll_interval_seconds", "consecutive_failures").get(pk=mailbox_id)
+    except MailBox.DoesNotExist:
+        return bool(report.get("error"))
+
+    interval = mailbox.poll_interval_seconds or POLL_DEFAULT_SECONDS
+    if report.get("error"):
+        failures = mailbox.consecutive_failures + 1
+        delay = error_backoff_seconds(interval, failures)
+        MailBox.objects.filter(pk=mailbox_id).update(
+            consecutive_failures=failures,
+            next_fetch_at=now + timedelta(seconds=delay),
+        )
+        logger.warning(
+            "[fetch_emails] MailBox %s: %s falha(s) consecutiva(s); próxima tentativa em %ss.",
+            mailbox_id, failures, delay,
+        )
+        return should_alert(failures)
+
+    received = EmailMessage.objects.filter(mailbox_id=mailbox_id, received_at__gte=now - RATE_WINDOW).count()
+    interval = next_poll_interval(interval, report.get("created", 0), received)
+    if mailbox.consecutive_failures:
+        logger.info(
+            "[fetch_emails] MailBox %s recuperada após %s falha(s).", mailbox_id, mailbox.consecutive_failures,
+        )
+    MailBox.objects.filter(pk=mailbox_id).update(
+        poll_interval_seconds=interval,
+        consecutive_failures=0,
+        next_fetch_at=now + timedelta(seconds=interval),
+    )
+    return False
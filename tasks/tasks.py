@@ -1,28 +1,53 @@
 import os
+import time
+import random
 import logging
 from datetime import timedelta
+from functools import lru_cache
+from django.conf import settings
 from django.utils import timezone
 from django.db import IntegrityError
+from django.db.models import F
+from django_q.models import Schedule
 from django_q.tasks import async_task
 import imapclient 
 from extraction.schemas import ProcessoJuridicoSchema, ServiceOrderSchema, SupportRequestSchema 
 
-from email import policy
-from email.parser import BytesParser
 from email.header import decode_header, make_header
-from email.utils import parsedate_to_datetime
 
 # --- IMPORTS ATUALIZADOS ---
 # Importa os modelos, incluindo o novo AutomationRule
-from emails.models import MailBox, EmailMessage, EmailStatus, AutomationRule 
+from emails.models import MailBox, MailBoxSyncState, EmailMessage, EmailStatus, EmailPriority, AutomationRule, UnmatchedPolicy
+from emails.raw_store import get_raw_store
 # Importa a lógica de processamento e os wrappers
 from integrations.telegram import notify_telegram 
 from extraction.ai_wrapper import extract_fields_from_text 
-# Importa o modelo de perfil de Juliano
-from extraction.models import ExtractionProfile 
+from extraction.cache import describe_cache_stats
+from extraction.rate_limit import RateLimited
+from tasks.imap_fetch import FETCH_BATCH_SIZE, iter_message_batches
+from tasks.imap_search import compile_rule_search, prefilter_uids
+from tasks.normalize import normalize_body
+from tasks.priority import email_priority
+from tasks.queues import DELIVERY, EXTRACTION, cluster_for
+from tasks.reduce import reduce_email_body
+from tasks.rule_matcher import get_rule_matcher, get_rule_matchers
+from tasks.scheduling import is_due, record_fetch_result
+# Modo de execução do perfil de Juliano (imediato ou lote)
+from extraction.models import ExecutionMode
 
 logger = logging.getLogger(__name__)
 
+# Quantas mensagens (as mais recentes) entram na primeira sincronização de uma pasta
+INITIAL_SYNC_LIMIT = int(getattr(settings, "IMAP_INITIAL_SYNC_LIMIT", 50))
+# Quantos emails vão em cada task `process_email_batch`
+PROCESS_EMAIL_BATCH_SIZE = int(getattr(settings, "PROCESS_EMAIL_BATCH_SIZE", 10))
+# Reserva de um email em PROCESSING: vencida, o claim worker (tasks.claim_worker) o retoma
+EMAIL_LEASE = timedelta(seconds=int(getattr(settings, "EMAIL_CLAIM_LEASE_SECONDS", 900)))
+# Email devolvido à fila por limite de taxa da OpenAI volta a ser processado depois disso
+RATE_LIMIT_DEFER_SECONDS = int(getattr(settings, "RATE_LIMIT_DEFER_SECONDS", 60))
+# Guarda o email bruto no RawStore (baixa a mensagem inteira em vez de só a parte de texto)
+STORE_RAW = bool(getattr(settings, "IMAP_STORE_RAW", False))
+
 
 # NOVO: Mapeamento para buscar a classe do schema pelo nome
 SCHEMA_MAP = {
@@ -133,15 +158,18 @@ def _safe_int(value, default=None):
     except Exception:
         return default
 
-def _model_has_field(model_cls, field_name: str) -> bool:
+@lru_cache(maxsize=None)
+def _model_field_map(model_cls) -> dict:
+    """Campos concretos do modelo -> max_length (calculado uma única vez por processo)."""
     try:
-        return any(getattr(f, "name", None) == field_name for f in model_cls._meta.get_fields())
+        return {f.name: getattr(f, "max_length", None) for f in model_cls._meta.concrete_fields}
     except Exception:
-        return False
+        return {}
 
 
 # ----------------- Atualiza checkpoint -----------------
-def _touch_mailbox_checkpoint(mailbox: MailBox, processed_uids):
+def _touch_mailbox_checkpoint(mailbox: MailBox, processed_uids=None):
+    """Marca o momento do último fetch (o checkpoint de UID fica no MailBoxSyncState)."""
     update_fields = []
 
     # marca o momento do último fetch
@@ -152,17 +180,6 @@ def _touch_mailbox_checkpoint(mailbox: MailBox, processed_uids):
         mailbox.last_fetch_at = timezone.now()
         update_fields.append("last_fetch_at")
 
-    # avança last_uid, se existir e houver UIDs processados
-    if processed_uids and hasattr(mailbox, "last_uid"):
-        try:
-            mailbox.last_uid = max([x for x in processed_uids if x is not None])
-            if "last_checked" not in update_fields and hasattr(mailbox, "last_checked"):
-                update_fields.append("last_checked")
-            if "last_fetch_at" not in update_fields and hasattr(mailbox, "last_fetch_at"):
-                update_fields.append("last_fetch_at")
-        except Exception:
-            pass
-
     if update_fields:
         try:
             mailbox.save(update_fields=update_fields)
@@ -170,385 +187,831 @@ def _touch_mailbox_checkpoint(mailbox: MailBox, processed_uids):
             logger.warning("Falha ao atualizar checkpoint da MailBox %s: %s", mailbox.id, e)
 
 
-# ----------------- FUNÇÃO PRINCIPAL -----------------
-def fetch_emails(mailbox_id) -> int: 
+def _load_sync_state(mailbox: MailBox, folder: str) -> MailBoxSyncState:
+    state, _created = MailBoxSyncState.objects.get_or_create(mailbox=mailbox, folder=folder)
+    return state
+
+
+def _sync_new_uids(server, state: MailBoxSyncState, select_info=None):
     """
-    Lê emails via IMAP e cria EmailMessage para cada mensagem nova.
-    - Argumento (mailbox_id) vem como string do Django-Q Schedule.
+    Decide quais UIDs buscar a partir do checkpoint persistido.
+    - UIDVALIDITY diferente do salvo: descarta o checkpoint e ressincroniza.
+    - HIGHESTMODSEQ/UIDNEXT inalterados: nada novo, nem faz SEARCH.
+    - Caso normal: `UID last_uid+1:*` (apenas o delta).
+    `select_info` é a resposta do SELECT; None quando já estamos selecionados
+    (ex: acordando de um IDLE), caso em que só o SEARCH incremental é feito.
     """
-    # NOVO: Garante que o ID seja um inteiro, se o Django-Q passar como string
+    select_info = select_info or {}
+    uid_validity = select_info.get(b"UIDVALIDITY")
+    uidnext = select_info.get(b"UIDNEXT")
+    modseq = select_info.get(b"HIGHESTMODSEQ")
+
+    if uid_validity is not None and state.uid_validity != uid_validity:
+        if state.uid_validity is not None:
+            logger.warning(
+                "[fetch_emails] UIDVALIDITY mudou na MailBox %s/%s (%s -> %s). Ressincronizando.",
+                state.mailbox_id, state.folder, state.uid_validity, uid_validity,
+            )
+        state.reset(uid_validity)
+
+    # Primeira sincronização (ou pós-reset): apenas as N mensagens mais recentes
+    if not state.last_uid:
+        uids = sorted(server.search(['ALL']))
+        return uids[-INITIAL_SYNC_LIMIT:]
+
+    if modseq is not None and state.highest_modseq is not None and modseq == state.highest_modseq:
+        return []
+    if uidnext is not None and uidnext <= state.last_uid + 1:
+        return []
+
+    uids = server.search(['UID', f'{int(state.last_uid) + 1}:*'])
+    # `n:*` sempre devolve o maior UID existente, mesmo que ele seja < n
+    return sorted(u for u in uids if u > state.last_uid)
+
+
+def _save_sync_state(state: MailBoxSyncState, processed_uids, select_info=None):
+    select_info = select_info or {}
+    processed = [u for u in (processed_uids or []) if u is not None]
+    if processed:
+        state.last_uid = max(state.last_uid, max(processed))
+    modseq = select_info.get(b"HIGHESTMODSEQ")
+    if modseq is not None:
+        state.highest_modseq = modseq
+    state.last_synced_at = timezone.now()
     try:
-        mailbox_id = int(mailbox_id)
-    except (ValueError, TypeError):
-        msg = f"[fetch_emails] ID inválido recebido: {mailbox_id}"
-        logger.error(msg)
-        notify_telegram(msg)
-        return 0
-        
-    server = None
+        state.save()
+    except Exception as e:
+        logger.warning("Falha ao salvar estado de sincronização da MailBox %s: %s", state.mailbox_id, e)
+
+
+# ----------------- Conexão IMAP -----------------
+def _imap_settings(mailbox: MailBox) -> dict:
+    """Resolve host/porta/credenciais/pasta da MailBox (com override via env)."""
+    username = getattr(mailbox, "username", None) or getattr(mailbox, "imap_username", None)
+    password = (
+        getattr(mailbox, "password", None)
+        or getattr(mailbox, "imap_password", None)
+        or getattr(mailbox, "app_password", None)
+    )
+    host = getattr(mailbox, "imap_host", None) or getattr(mailbox, "host", None)
+    port = getattr(mailbox, "imap_port", None) or getattr(mailbox, "port", None) or 993
+    use_ssl = True if not hasattr(mailbox, "use_ssl") else bool(getattr(mailbox, "use_ssl", True))
+    folder = getattr(mailbox, "folder", None) or "INBOX"
+
+    # ---- OVERRIDE via variáveis de ambiente ----
+    env_host = os.getenv("IMAP_HOST")
+    env_port = os.getenv("IMAP_PORT")
+    env_user = os.getenv("IMAP_USERNAME")
+    env_pass = os.getenv("IMAP_PASSWORD")
+    env_ssl = os.getenv("IMAP_USE_SSL")
+
+    if env_host:
+        host = env_host
+    if env_port:
+        try:
+            port = int(env_port)
+        except Exception:
+            pass
+    if env_user:
+        username = env_user
+    if env_pass:
+        password = env_pass.replace(" ", "")  # remove espaços da app password do Gmail
+    if env_ssl:
+        use_ssl = env_ssl.strip().lower() not in ("0", "false", "no")  # ex: servidor IMAP local do benchmark
+
+    return {
+        "host": host,
+        "port": port,
+        "username": username,
+        "password": password,
+        "use_ssl": use_ssl,
+        "folder": folder,
+    }
+
+
+def _connect_mailbox(conn: dict):
+    """
+    Abre a conexão IMAP, faz LOGIN e seleciona a pasta (somente leitura).
+    Retorna (server, select_info).
+    """
+    server = imapclient.IMAPClient(conn["host"], ssl=conn["use_ssl"], port=conn["port"], timeout=30)
+    try:
+        server.login(conn["username"], conn["password"])
+        # CONDSTORE: faz o SELECT devolver HIGHESTMODSEQ (checkpoint barato)
+        if server.has_capability("CONDSTORE") and server.has_capability("ENABLE"):
+            try:
+                server.enable("CONDSTORE")
+            except Exception as e:
+                logger.debug("ENABLE CONDSTORE falhou em %s: %s", conn["host"], e)
+        select_info = server.select_folder(conn["folder"], readonly=True)
+        # datas do ENVELOPE com fuso (não converter para hora local da máquina)
+        server.normalise_times = False
+    except Exception:
+        try:
+            server.logout()
+        except Exception:
+            pass
+        raise
+    return server, select_info
+
+
+# ----------------- Ingestão -----------------
+def _build_email_payload(mailbox: MailBox, summary: dict, body_text: str, host: str) -> dict:
+    """Monta os campos do EmailMessage a partir do resumo IMAP (sem tocar no banco)."""
+    fields = _model_field_map(EmailMessage)
+    uid = summary["uid"]
+
+    # --- garante message_id não-nulo (alguns emails vêm sem) ---
+    message_id = summary["message_id"] or f"<uid-{int(uid)}@{host}>"
+
+    payload = {}
+
+    # FK para a mailbox
+    if "mailbox" in fields:
+        payload["mailbox"] = mailbox
+
+    # IDs / cabeçalhos
+    if "message_id" in fields:
+        payload["message_id"] = message_id
+
+    if "subject" in fields:
+        payload["subject"] = summary["subject"] or "(sem assunto)"
+
+    # REMAPEIA 'From' para o campo obrigatório 'sender'
+    if "sender" in fields:
+        payload["sender"] = summary["sender"]
+    elif "from_addr" in fields:
+        payload["from_addr"] = summary["sender"]
+
+    # REMAPEIA a data para o campo obrigatório 'received_at'
+    date_aware = _to_aware(summary["date"])
+    if "received_at" in fields:
+        payload["received_at"] = date_aware
+    elif "date" in fields:
+        payload["date"] = date_aware
+
+    # Corpo
+    if "body_text" in fields:
+        payload["body_text"] = body_text or ""
+
+    # UID (se existir no modelo)
+    if "uid" in fields:
+        payload["uid"] = _safe_int(uid)
+
+    # Status (se existir e houver enum)
+    status_value = getattr(EmailStatus, "RECEIVED", None) or getattr(EmailStatus, "received", None)
+    if "status" in fields and status_value is not None:
+        payload["status"] = status_value
+
+    # timestamps obrigatórios (se o modelo não usar auto_now/auto_now_add)
+    now = timezone.now()
+    if "created_at" in fields:
+        payload["created_at"] = now
+    if "updated_at" in fields:
+        payload["updated_at"] = now
+
+    # Corta strings no max_length (um valor longo não pode derrubar o lote inteiro)
+    for name, value in payload.items():
+        max_length = fields.get(name)
+        if max_length and isinstance(value, str) and len(value) > max_length:
+            payload[name] = value[:max_length]
+    return payload
+
+
+def _store_raw(mailbox: MailBox, payload: dict, raw: bytes) -> None:
+    """Grava o email bruto no RawStore e referencia o blob no payload (falha não derruba a ingestão)."""
+    if not raw:
+        return
+    try:
+        payload["raw_sha256"] = get_raw_store().put(raw)
+        payload["raw_size"] = len(raw)
+    except Exception as e:
+        logger.exception("Falha ao gravar email bruto (%s MailBox %s): %s", payload.get("message_id"), mailbox.id, e)
+
+
+def _persist_email_batch(mailbox: MailBox, rows, raws=None):
+    """
+    Persiste um lote de mensagens com poucas idas ao banco:
+    1 SELECT ... IN para deduplicar, 1 bulk_create e 1 SELECT dos ids criados.
+    `rows` é uma lista de (uid, payload); `raws` ({uid: bytes}) são os emails
+    brutos, gravados no RawStore só para as mensagens novas. Retorna
+    (ids_criados, uids_processados, fila_para_extração) — o último só com os
+    emails PENDING (com regra), os únicos que vão para a fila, como pares
+    (id, prioridade) ordenados pela fila de prioridade.
+    """
+    if not rows:
+        return [], [], []
+
+    message_ids = [payload["message_id"] for _uid, payload in rows]
+    existing = set(
+        EmailMessage.objects.filter(message_id__in=message_ids).values_list("message_id", flat=True)
+    )
+
+    processed_uids = []
+    new_objs = []
+    seen = set(existing)
+    for uid, payload in rows:
+        processed_uids.append(_safe_int(uid))
+        if payload["message_id"] in seen:
+            continue
+        seen.add(payload["message_id"])
+        _store_raw(mailbox, payload, (raws or {}).get(uid))
+        new_objs.append(EmailMessage(**payload))
+
+    if not new_objs:
+        return [], processed_uids, []
+
+    new_message_ids = [obj.message_id for obj in new_objs]
+    try:
+        EmailMessage.objects.bulk_create(new_objs, ignore_conflicts=True)
+    except Exception as e:
+        # Fallback: grava um a um para isolar a mensagem problemática
+        logger.warning("bulk_create falhou na MailBox %s (%s); gravando individualmente.", mailbox.id, e)
+        for obj in new_objs:
+            try:
+                obj.save(force_insert=True)
+            except IntegrityError:
+                logger.info("Email duplicado (message_id=%s, mailbox=%s) - ignorando.", obj.message_id, mailbox.id)
+            except Exception as exc:
+                logger.exception("Falha ao criar EmailMessage (%s MailBox %s): %s", obj.message_id, mailbox.id, exc)
+                notify_telegram(f"[fetch_emails] Falha ao salvar email {obj.message_id} MailBox {mailbox.id}: {exc}")
+
+    created = list(
+        EmailMessage.objects.filter(mailbox=mailbox, message_id__in=new_message_ids)
+        .order_by("id")
+        .values_list("id", "status", "priority")
+    )
+    created_ids = [pk for pk, _status, _priority in created]
+    queued = sorted(
+        ((pk, priority) for pk, status, priority in created if status == EmailStatus.PENDING),
+        key=lambda item: (item[1], item[0]),
+    )
+    return created_ids, processed_uids, queued
+
+
+def _ingest_uids(server, mailbox: MailBox, uids, host: str):
+    """
+    Baixa as mensagens `uids` da pasta selecionada (cabeçalhos + parte de
+    texto, nunca anexos; com STORE_RAW, a mensagem bruta inteira), grava as
+    novas em lote e enfileira o `process_email_batch`.
+    As Regras de Automação são avaliadas aqui, só com os cabeçalhos: emails
+    sem regra seguem a `unmatched_policy` da MailBox (IGNORED sem corpo,
+    IGNORED com corpo ou não registrados) e nunca vão para a fila.
+    Retorna (total_criado, uids_processados).
+    """
+    mailbox_id = mailbox.id
     processed_uids = []
     total_created = 0
+    unmatched_policy = getattr(mailbox, "unmatched_policy", UnmatchedPolicy.IGNORE)
+    matcher = get_rule_matcher(mailbox_id)
+    matched = {}
+    needs_body = set()
+
+    def wants_body(summary):
+        rule, body_needed = matcher.evaluate(summary["subject"], summary["sender"], summary["headers"])
+        matched[summary["uid"]] = rule
+        if body_needed:
+            needs_body.add(summary["uid"])  # regra depende do corpo: decide depois de baixá-lo
+        return rule is not None or body_needed or unmatched_policy == UnmatchedPolicy.KEEP_BODY
+
+    def expunged(missing):
+        # apagados entre o SEARCH e o FETCH: não há o que rebuscar, contam como processados
+        logger.info("UIDs %s sumiram da MailBox %s antes do FETCH.", missing, mailbox_id)
+        processed_uids.extend(_safe_int(uid) for uid in missing)
+
+    # ---- Busca em lotes (duas fases: cabeçalhos, depois só o texto) ----
+    # Os corpos chegam em sub-lotes limitados por bytes (IMAP_FETCH_BYTE_BUDGET);
+    # cada sub-lote é gravado e liberado antes do próximo FETCH.
+    for i in range(0, len(uids), FETCH_BATCH_SIZE):
+        batch = uids[i:i+FETCH_BATCH_SIZE]
+        try:
+            chunks = iter_message_batches(
+                server, batch, raw=STORE_RAW, wants_body=wants_body, extra_headers=matcher.header_names,
+                on_missing=expunged,
+            )
+            for chunk in chunks:
+                rows, raws = [], {}
+                for summary, body_text, raw in chunk:
+                    uid = summary["uid"]
+                    # Normalização: HTML vira texto antes de gravar (e de ir ao LLM)
+                    body_text = normalize_body(body_text, (summary["text_part"] or {}).get("subtype"))
+                    rule = matched.pop(uid, None)
+                    if uid in needs_body:
+                        needs_body.discard(uid)
+                        rule = matcher.match(summary["subject"], summary["sender"], summary["headers"], body_text)
+                    if rule is None and unmatched_policy == UnmatchedPolicy.SKIP:
+                        processed_uids.append(_safe_int(uid))
+                        continue
+                    if rule is None and unmatched_policy == UnmatchedPolicy.IGNORE:
+                        body_text, raw = "", None  # baixado só para avaliar regras de corpo
+                    if summary["text_part"] is None:
+                        logger.warning("UID %s sem parte de texto na MailBox %s", uid, mailbox_id)
+                    payload = _build_email_payload(mailbox, summary, body_text, host)
+                    if rule is not None:
+                        payload["matched_rule"] = rule
+                        payload["status"] = EmailStatus.PENDING
+                        payload["priority"] = email_priority(summary["subject"], summary["sender"], rule)
+                    else:
+                        payload["status"] = EmailStatus.IGNORED
+                    if raw:
+                        raws[uid] = raw
+                    rows.append((uid, payload))
+                del chunk
+
+                created_ids, batch_uids, queued = _persist_email_batch(mailbox, rows, raws)
+                total_created += len(created_ids)
+                processed_uids.extend(batch_uids)
+                # Só emails com regra vão para a extração (Juliano/Thales), filas mais altas primeiro
+                enqueue_email_batches([pk for pk, _priority in queued], lanes=dict(queued))
+        except Exception as e:
+            logger.exception("Erro ao processar lote de UIDs %s..%s na MailBox %s: %s", batch[0], batch[-1], mailbox_id, e)
+            notify_telegram(f"[fetch_emails] Erro no lote UID {batch[0]}..{batch[-1]} MailBox {mailbox_id}: {e}")
+            continue
 
-    try:
-        mailbox = MailBox.objects.get(id=mailbox_id)
+    return total_created, processed_uids
 
-        # ---- Campos reais do seu modelo ----
-        
-        username = getattr(mailbox, "username", None) or getattr(mailbox, "imap_username", None)
-        password = (
-            getattr(mailbox, "password", None)
-            or getattr(mailbox, "imap_password", None)
-            or getattr(mailbox, "app_password", None)
+
+def enqueue_email_batches(email_ids, batch_size=None, lanes=None) -> int:
+    """
+    Enfileira `process_email_batch` em blocos de `batch_size` ids (uma linha
+    no broker por bloco, não por email). Com `lanes` ({id: prioridade}), os
+    blocos não misturam filas e as mais altas entram primeiro no broker.
+    Retorna o número de tasks criadas.
+    """
+    batch_size = max(1, int(batch_size or PROCESS_EMAIL_BATCH_SIZE))
+    email_ids = list(email_ids)
+    if lanes:
+        email_ids.sort(key=lambda pk: lanes.get(pk, EmailPriority.NORMAL))
+    groups = []
+    for pk in email_ids:
+        lane = lanes.get(pk, EmailPriority.NORMAL) if lanes else None
+        if not groups or groups[-1][0] != lane or len(groups[-1][1]) >= batch_size:
+            groups.append((lane, []))
+        groups[-1][1].append(pk)
+
+    for _lane, chunk in groups:
+        async_task(
+            'tasks.tasks.process_email_batch', chunk,
+            cluster=cluster_for(EXTRACTION), task_name=f"process_email_batch:{chunk[0]}-{chunk[-1]}",
         )
-        host = getattr(mailbox, "imap_host", None) or getattr(mailbox, "host", None)
-        port = getattr(mailbox, "imap_port", None) or getattr(mailbox, "port", None) or 993
-        use_ssl = True if not hasattr(mailbox, "use_ssl") else bool(getattr(mailbox, "use_ssl", True))
-        folder = getattr(mailbox, "folder", None) or "INBOX"
-        last_uid = getattr(mailbox, "last_uid", None)
-
-        # ---- OVERRIDE via variáveis de ambiente ----
-        env_host = os.getenv("IMAP_HOST")
-        env_port = os.getenv("IMAP_PORT")
-        env_user = os.getenv("IMAP_USERNAME")
-        env_pass = os.getenv("IMAP_PASSWORD")
-
-        if env_host:
-            host = env_host
-        if env_port:
-            try:
-                port = int(env_port)
-            except Exception:
-                pass
-        if env_user:
-            username = env_user
-        if env_pass:
-            password = env_pass.replace(" ", "")  # remove espaços da app password do Gmail
+    return len(groups)
 
-        # validação
-        if not host or not username or not password:
-            msg = f"[fetch_emails] MailBox {mailbox_id} incompleta: host/username/password ausentes."
-            logger.error(msg)
-            notify_telegram(msg)
+
+def _prefilter_candidates(server, mailbox: MailBox, uids):
+    """
+    Com `imap_prefilter` ligado na MailBox, reduz `uids` aos que podem casar
+    com alguma regra ativa (SEARCH SUBJECT/FROM no servidor). Sem regras
+    filtráveis, devolve todos.
+    """
+    if not uids or not getattr(mailbox, "imap_prefilter", False):
+        return list(uids)
+    criteria = compile_rule_search(get_rule_matcher(mailbox.id).rules)
+    if criteria is None:
+        return list(uids)
+    candidates = prefilter_uids(server, uids, criteria)
+    logger.info(
+        "[fetch_emails] Pré-filtro MailBox %s: %s de %s mensagem(ns) candidata(s).",
+        mailbox.id, len(candidates), len(uids),
+    )
+    return candidates
+
+
+def _sync_mailbox(server, mailbox: MailBox, conn: dict, state: MailBoxSyncState, select_info=None) -> int:
+    """Busca o delta a partir do checkpoint, ingere e avança o checkpoint."""
+    uids = _sync_new_uids(server, state, select_info)
+    processed_uids = []
+    total_created = 0
+    candidates = _prefilter_candidates(server, mailbox, uids)
+    if candidates:
+        total_created, processed_uids = _ingest_uids(server, mailbox, candidates, conn["host"])
+
+    # UIDs descartados pelo pré-filtro também avançam o checkpoint. Se um lote
+    # falhou, o checkpoint para abaixo do primeiro candidato pendente (mesmo com
+    # lotes seguintes ok) e o HIGHESTMODSEQ não é salvo: o próximo sync rebusca
+    pending = sorted(set(candidates) - set(processed_uids))
+    candidate_set = set(candidates)
+    done = processed_uids + [u for u in uids if u not in candidate_set]
+    if pending:
+        done = [u for u in done if u is not None and u < pending[0]]
+    _save_sync_state(state, done, None if pending else select_info)
+    _touch_mailbox_checkpoint(mailbox)
+    return total_created
+
+
+# ----------------- FUNÇÃO PRINCIPAL -----------------
+def fetch_emails(mailbox_id, force=False) -> int: 
+    """
+    Lê emails via IMAP e cria EmailMessage para cada mensagem nova.
+    - Argumento (mailbox_id) vem como string do Django-Q Schedule.
+    - Continua sendo o modo de polling (fallback do listener IDLE em
+      `manage.py listen_emails`, para servidores sem IDLE).
+    - O Schedule fixo roda a cada 5 min, mas a caixa só é consultada quando
+      `next_fetch_at` venceu (polling adaptativo/backoff, tasks.scheduling);
+      `force=True` ignora o agendamento.
+    Retorna o número de emails criados.
+    """
+    if not force:
+        mailbox = MailBox.objects.filter(pk=_safe_int(mailbox_id)).only("id", "next_fetch_at").first()
+        if mailbox is not None and not is_due(mailbox):
+            logger.debug("[fetch_emails] MailBox %s ainda não venceu (próxima busca %s).", mailbox.id, mailbox.next_fetch_at)
             return 0
+    return fetch_mailbox_report(mailbox_id)["created"]
 
-        # ---- Conexão IMAP ----
-        server = imapclient.IMAPClient(host, ssl=use_ssl, port=port, timeout=30)
-        server.login(username, password)
-        server.select_folder(folder, readonly=True)
 
-        # ---- Estratégia de busca ----
-        uids = []
-        if last_uid is not None:
-            try:
-                uids = server.search(['UID', f'{int(last_uid) + 1}:*'])
-            except Exception as e:
-                logger.warning("[fetch_emails] Falha search por UID em MailBox %s: %s", mailbox_id, e)
+def fetch_mailbox_report(mailbox_id) -> dict:
+    """
+    Executa o fetch de uma MailBox e devolve um relatório
+    {mailbox_id, host, created, seconds, error}; `error` fica None quando o
+    fetch deu certo. Atualiza o agendamento adaptativo da caixa
+    (tasks.scheduling) e só alerta no Telegram quando o backoff manda.
+    Usado pelo `fetch_emails` e pelo orquestrador (tasks.orchestrator).
+    """
+    started = time.monotonic()
+    report = {"mailbox_id": mailbox_id, "host": None, "created": 0, "seconds": 0.0, "error": None}
+    tracked = _run_fetch(report)
+    report["seconds"] = round(time.monotonic() - started, 3)
 
-        if not uids:
-            try:
-                uids = server.search(['UNSEEN'])
-            except Exception as e:
-                logger.warning("[fetch_emails] Falha search UNSEEN em MailBox %s: %s", mailbox_id, e)
+    alert = bool(report["error"])
+    if tracked:
+        try:
+            alert = record_fetch_result(report["mailbox_id"], report)
+        except Exception as e:
+            logger.warning("Falha ao atualizar agendamento da MailBox %s: %s", report["mailbox_id"], e)
+    if alert:
+        notify_telegram(report["error"])
+    return report
 
-        if not uids:
-            try:
-                all_uids = server.search(['ALL'])
-                all_uids.sort()
-                uids = all_uids[-50:]  # fallback seguro
-            except Exception as e:
-                logger.error("[fetch_emails] Falha search ALL em MailBox %s: %s", mailbox_id, e)
-                uids = []
 
-        if not uids:
-            _touch_mailbox_checkpoint(mailbox, processed_uids=False)
-            return 0
+def _run_fetch(report: dict) -> bool:
+    """
+    Corpo do fetch de uma MailBox; preenche `report`.
+    Retorna False quando nem há MailBox para acompanhar (id inválido/inexistente).
+    """
+    mailbox_id = report["mailbox_id"]
 
-        # ---- Busca em lotes ----
-        BATCH_SIZE = 200
-        for i in range(0, len(uids), BATCH_SIZE):
-            batch = uids[i:i+BATCH_SIZE]
-            fetched = server.fetch(batch, ['RFC822', 'UID', 'FLAGS', 'ENVELOPE'])
+    def _fail(msg, exc_info=False):
+        if exc_info:
+            logger.exception(msg)
+        else:
+            logger.error(msg)
+        report["error"] = msg
 
-            for uid in batch:
-                try:
-                    data = fetched.get(uid)
-                    if not data:
-                        continue
+    # NOVO: Garante que o ID seja um inteiro, se o Django-Q passar como string
+    try:
+        mailbox_id = int(mailbox_id)
+        report["mailbox_id"] = mailbox_id
+    except (ValueError, TypeError):
+        _fail(f"[fetch_emails] ID inválido recebido: {mailbox_id}")
+        return False
+        
+    server = None
 
-                    raw_bytes = data.get(b'RFC822') or data.get('RFC822') \
-                                or data.get(b'BODY[]') or data.get('BODY[]')
-                    if not raw_bytes:
-                        logger.warning("UID %s sem corpo (RFC822/BODY[] ausentes) na MailBox %s", uid, mailbox_id)
-                        continue
+    try:
+        mailbox = MailBox.objects.get(id=mailbox_id)
+        conn = _imap_settings(mailbox)
+        report["host"] = conn["host"]
 
-                    msg = BytesParser(policy=policy.default).parsebytes(raw_bytes)
-
-                    message_id = (msg.get('Message-Id') or msg.get('Message-ID') or "").strip() or None
-                    subject = _decode_str(msg.get('Subject'))
-                    from_addr = _decode_str(msg.get('From'))
-                    to_addr = _decode_str(msg.get('To'))
-                    date_hdr = msg.get('Date')
-
-                    try:
-                        dt = parsedate_to_datetime(date_hdr) if date_hdr else None
-                    except Exception:
-                        dt = None
-                    date_aware = _to_aware(dt)
-
-                    body_text = _extract_body(msg)
-
-                    # Deduplicação por Message-ID (se o modelo tiver)
-                    if message_id and _model_has_field(EmailMessage, "message_id"):
-                        try:
-                            qs = EmailMessage.objects.filter(message_id=message_id)
-                            if _model_has_field(EmailMessage, "mailbox"):
-                                qs = qs.filter(mailbox=mailbox)
-                            if qs.exists():
-                                processed_uids.append(_safe_int(uid))
-                                continue
-                        except Exception:
-                            pass
-
-                    # Monta payload respeitando campos existentes
-                    # --- garante message_id não-nulo (alguns emails vêm sem) ---
-                    if not message_id:
-                        message_id = f"<uid-{int(uid)}@{host}>"
-
-                    # --- Monta payload respeitando os campos do seu modelo ---
-                    payload = {}
-
-                    # FK para a mailbox
-                    if _model_has_field(EmailMessage, "mailbox"):
-                        payload["mailbox"] = mailbox
-
-                    # IDs / cabeçalhos
-                    if _model_has_field(EmailMessage, "message_id"):
-                        payload["message_id"] = message_id
-
-                    if _model_has_field(EmailMessage, "subject"):
-                        payload["subject"] = subject or "(sem assunto)"
-
-                    # REMAPEIA 'From' para o campo obrigatório 'sender'
-                    if _model_has_field(EmailMessage, "sender"):
-                        payload["sender"] = from_addr
-                    elif _model_has_field(EmailMessage, "from_addr"):
-                        payload["from_addr"] = from_addr  # caso exista também
-
-                    # REMAPEIA a data para o campo obrigatório 'received_at'
-                    if _model_has_field(EmailMessage, "received_at"):
-                        payload["received_at"] = date_aware
-                    elif _model_has_field(EmailMessage, "date"):
-                        payload["date"] = date_aware
-
-                    # Corpo
-                    if _model_has_field(EmailMessage, "body_text"):
-                        payload["body_text"] = body_text or ""
-
-                    # UID (se existir no modelo)
-                    if _model_has_field(EmailMessage, "uid"):
-                        payload["uid"] = _safe_int(uid)
-
-                    # Status (se existir e houver enum)
-                    if _model_has_field(EmailMessage, "status"):
-                        try:
-                            status_value = getattr(EmailStatus, "RECEIVED", None) or getattr(EmailStatus, "received", None)
-                            if status_value is not None:
-                                payload["status"] = status_value
-                        except Exception:
-                            pass
-
-                    # timestamps obrigatórios (se o modelo não usar auto_now/auto_now_add)
-                    now = timezone.now()
-                    if _model_has_field(EmailMessage, "created_at"):
-                        payload["created_at"] = now
-                    if _model_has_field(EmailMessage, "updated_at"):
-                        payload["updated_at"] = now
-
-                    try:
-                        email_msg = EmailMessage.objects.create(**payload)
-                        total_created += 1
-                        processed_uids.append(_safe_int(uid))
-                        # Enfileira o processamento para a próxima etapa (Juliano/Thales)
-                        async_task('tasks.tasks.process_email', email_msg.id)
-                    except IntegrityError:
-                        logger.info("Email duplicado (uid=%s, mailbox=%s) - ignorando.", uid, mailbox_id)
-                        processed_uids.append(_safe_int(uid))
-                        continue
-                    except Exception as e:
-                        logger.exception("Falha ao criar EmailMessage (UID %s MailBox %s): %s", uid, mailbox_id, e)
-                        notify_telegram(f"[fetch_emails] Falha ao salvar email UID {uid} MailBox {mailbox_id}: {e}")
-                        continue
+        # validação
+        if not conn["host"] or not conn["username"] or not conn["password"]:
+            _fail(f"[fetch_emails] MailBox {mailbox_id} incompleta: host/username/password ausentes.")
+            return True
+
+        state = _load_sync_state(mailbox, conn["folder"])
 
-                except Exception as e:
-                    logger.exception("Erro ao processar UID %s na MailBox %s: %s", uid, mailbox_id, e)
-                    notify_telegram(f"[fetch_emails] Erro UID {uid} MailBox {mailbox_id}: {e}")
+        # ---- Conexão IMAP ----
+        server, select_info = _connect_mailbox(conn)
 
-        _touch_mailbox_checkpoint(mailbox, processed_uids=processed_uids)
-        return total_created
+        # ---- Busca incremental a partir do checkpoint ----
+        report["created"] = _sync_mailbox(server, mailbox, conn, state, select_info)
 
     except MailBox.DoesNotExist:
-        msg = f"[fetch_emails] MailBox {mailbox_id} não encontrada."
-        logger.error(msg)
-        notify_telegram(msg)
-        return 0
+        _fail(f"[fetch_emails] MailBox {mailbox_id} não encontrada.")
+        return False
     except imapclient.exceptions.IMAPClientError as e:
-        msg = f"[fetch_emails] IMAPClientError MailBox {mailbox_id}: {e}"
-        logger.error(msg)
-        notify_telegram(msg)
-        return 0
+        _fail(f"[fetch_emails] IMAPClientError MailBox {mailbox_id}: {e}")
     except Exception as e:
-        msg = f"[fetch_emails] Erro inesperado MailBox {mailbox_id}: {e}"
-        logger.exception(msg)
-        notify_telegram(msg)
-        return 0
+        _fail(f"[fetch_emails] Erro inesperado MailBox {mailbox_id}: {e}", exc_info=True)
     finally:
         try:
             if server is not None:
                 server.logout()
         except Exception:
             pass
+    return True
 
 
 # --- FUNÇÃO PRINCIPAL DO PIPELINE (THALES) ---
 
-def process_email(email_id):
+def _match_rule(email, matcher):
     """
-    Worker principal: coordena a extração de IA e as integrações externas.
-    Agora usa o modelo AutomationRule para definir o fluxo dinamicamente.
+    Regra do email: a marcada na ingestão (se continua ativa) ou a primeira
+    (por prioridade) cujo assunto/remetente casam (matcher compilado da MailBox).
+    """
+    if email.matched_rule_id and email.matched_rule_id in matcher.by_id:
+        return matcher.by_id[email.matched_rule_id]
+    # cabeçalhos só existem no email bruto (RawStore); sem ele, condições de cabeçalho não casam
+    headers = dict(email.raw_headers) if matcher.header_names and email.raw_sha256 else None
+    rule = matcher.match(email.subject, email.sender, headers, email.body_text)
+    if rule is not None:
+        logger.info(f"Regra de Automação correspondente encontrada: {rule.name}")
+    return rule
+
+
+def _move(email, to_status, from_status=EmailStatus.PROCESSING, **fields) -> bool:
+    """
+    Transição atômica (EmailMessage.transition) que grava só as colunas
+    alteradas e espelha o resultado no objeto em memória.
+    """
+    if not EmailMessage.transition(email.id, from_status, to_status, **fields):
+        logger.warning(f"Email {email.id}: transição para {to_status} perdida (status mudou fora deste worker).")
+        return False
+    email.status = to_status
+    for name, value in fields.items():
+        if not hasattr(value, 'resolve_expression'):
+            setattr(email, name, value)
+    return True
+
+
+def _process_loaded_email(email, matcher, claimed=False):
+    """
+    Processa um EmailMessage já carregado, com o matcher de regras da sua MailBox.
+    Com `claimed=True` o email já foi reservado (PROCESSING) pelo claim worker.
+    Retorna o status final do email (None se outro worker já o pegou).
     """
+    job, status = _start_extraction(email, matcher, claimed)
+    if job is None:
+        return status
     try:
-        email = EmailMessage.objects.get(pk=email_id)
-        
-        # 1. ATUALIZA STATUS INICIAL
+        extracted_data = extract_fields_from_text(**job['extraction'])
+        return _finish_extraction(job, extracted_data)
+    except RateLimited as e:
+        _defer(email, e)
+    except Exception as e:
+        _fail(email, e)
+    return email.status
+
+
+def _start_extraction(email, matcher, claimed=False):
+    """
+    Etapas até a chamada à IA: claim, regra, perfil/schema e redução do corpo.
+    Retorna (job, None), com job['extraction'] = argumentos de
+    extract_fields_from_text, ou (None, status_final) quando o email não
+    chega à IA. Separado da chamada para o motor concorrente
+    (tasks.async_extraction) fazer as chamadas de vários emails ao mesmo tempo.
+    """
+    # 1. REIVINDICA O EMAIL: só um worker vence o PENDING -> PROCESSING
+    if not claimed:
+        if not EmailMessage.transition(
+            email.id, EmailStatus.PENDING, EmailStatus.PROCESSING,
+            processing_attempts=F('processing_attempts') + 1,
+            lease_expires_at=timezone.now() + EMAIL_LEASE,
+        ):
+            logger.info(f"Email {email.id} não está pendente (já pego por outro worker?); ignorando.")
+            return None, None
         email.status = EmailStatus.PROCESSING
         email.processing_attempts += 1
-        email.save()
-        
-        # 2. BUSCA E AVALIA AS REGRAS DE AUTOMAÇÃO
-        
-        # Busca todas as regras ativas para a MailBox, ordenadas por prioridade
-        rules = AutomationRule.objects.filter(
-            mailbox=email.mailbox, 
-            is_active=True
-        ).order_by('priority')
-
-        matched_rule = None
-        for rule in rules:
-            # Lógica de correspondência de assunto
-            subject_match = True
-            if rule.subject_contains and rule.subject_contains.strip():
-                if rule.subject_contains.lower() not in email.subject.lower():
-                    subject_match = False
-            
-            # Lógica de correspondência de remetente
-            sender_match = True
-            if rule.sender_contains and rule.sender_contains.strip():
-                if rule.sender_contains.lower() not in email.sender.lower():
-                    sender_match = False
-                    
-            if subject_match and sender_match:
-                matched_rule = rule
-                logger.info(f"Regra de Automação correspondente encontrada: {rule.name}")
-                break
-        
+
+    try:
+        # 2. AVALIA AS REGRAS DE AUTOMAÇÃO (já carregadas, ordenadas por prioridade)
+        matched_rule = _match_rule(email, matcher)
+
         if not matched_rule:
-            # Não encontrou regra, ignora e marca como pendente (ou adiciona status 'IGNORED')
-            email.status = EmailStatus.PENDING 
-            email.save()
+            # Não encontrou regra: marca como ignorado (não volta para a fila)
+            _move(email, EmailStatus.IGNORED, matched_rule=None)
             logger.info(f"Nenhuma regra de automação correspondente encontrada para o email ID: {email.id}")
-            return
-            
+            return None, email.status
+        email.matched_rule = matched_rule
+
         # 3. EXTRAÇÃO DE DADOS (Juliano) usando o perfil da regra
         profile = matched_rule.extraction_profile
         if not profile:
             msg = f"Regra '{matched_rule.name}' não possui Perfil de Extração. Requer Revisão."
             logger.error(msg)
-            email.status = EmailStatus.REQUIRES_REVIEW
-            email.save()
+            _move(email, EmailStatus.REQUIRES_REVIEW, matched_rule=matched_rule)
             notify_telegram(email_msg=email, message=msg)
-            return
-
+            return None, email.status
         schema_cls = SCHEMA_MAP.get(profile.pydantic_schema_name)
         if not schema_cls:
             msg = f"Schema '{profile.pydantic_schema_name}' não encontrado no mapeamento. Falha Crítica."
             logger.error(msg)
-            email.status = EmailStatus.FAILED
-            email.save()
+            _move(email, EmailStatus.FAILED, matched_rule=matched_rule)
             notify_telegram(email_msg=email, message=msg)
-            return
-            
-        # Usa o prompt template do DB
-        dynamic_prompt = profile.system_prompt_template.format(
-            data_atual=timezone.now().strftime('%d/%m/%Y')
-        )
-
+            return None, email.status
         logger.info(f"Iniciando extração IA para email ID: {email.id} usando perfil: {profile.name}")
         
-        extracted_data = extract_fields_from_text(
-            text=email.body_text,
+        # Redução do corpo (citações, assinatura, rodapé do domínio) antes do LLM
+        text = reduce_email_body(email)
+        reduction = {'body_reduced': email.body_reduced, 'body_bytes_saved': email.body_bytes_saved}
+
+        # Perfil em modo lote: espera o próximo lote da Batch API (tasks/batch_worker.py);
+        # urgentes não esperam
+        if profile.execution_mode == ExecutionMode.BATCH and email.priority != EmailPriority.URGENT:
+            _move(email, EmailStatus.BATCHED, matched_rule=matched_rule, **reduction)
+            logger.info(f"Email {email.id} aguardando lote da IA (perfil '{profile.name}' em modo lote).")
+            return None, email.status
+    except Exception as e:
+        _fail(email, e)
+        return None, email.status
+
+    return {
+        'email': email,
+        'rule': matched_rule,
+        'profile': profile,
+        'reduction': reduction,
+        'extraction': dict(
+            text=text,
             schema=schema_cls, 
-            prompt_template=dynamic_prompt, 
-            examples=[]
+            prompt_template=profile.system_prompt_template, 
+            examples=[],
+            # a data vai no fim da mensagem: o prefixo (instruções + schema + perfil) não muda
+            today=timezone.now().strftime('%d/%m/%Y'),
+        ),
+    }, None
+
+
+def _finish_extraction(job, extracted_data, from_status=EmailStatus.PROCESSING):
+    """
+    Grava o resultado da IA (EXTRACTED ou REQUIRES_REVIEW) e faz a entrega.
+    `from_status` é BATCHED para resultados da Batch API (tasks/batch_worker.py).
+    Retorna o status final (None se a transição foi perdida). Exceções sobem.
+    """
+    email, matched_rule, profile = job['email'], job['rule'], job['profile']
+    if extracted_data is None:
+        _move(email, EmailStatus.REQUIRES_REVIEW, from_status=from_status, matched_rule=matched_rule, **job['reduction'])
+        notify_telegram(email_msg=email, message=f"Revisão necessária para email ID: {email.id}. Extração IA falhou para perfil '{profile.name}'.")
+        return email.status
+    if not _move(email, EmailStatus.EXTRACTED, from_status=from_status, matched_rule=matched_rule, extracted_data=extracted_data, **job['reduction']):
+        return None
+    
+    # 4. ENTREGA: com filas isoladas, vai para o cluster de entrega (deliver_email)
+    if cluster_for(DELIVERY):
+        async_task('tasks.tasks.deliver_email', email.id, cluster=cluster_for(DELIVERY), task_name=f"deliver_email:{email.id}")
+        return email.status
+    _deliver(email, matched_rule)
+    return email.status
+
+
+def _defer(email, error):
+    """
+    OpenAI sem capacidade (extraction/rate_limit.py): o email volta para
+    PENDING sem contar a tentativa e é reenfileirado depois do atraso
+    (o claim worker, se ativo, também o retoma).
+    """
+    if _move(email, EmailStatus.PENDING, processing_attempts=F('processing_attempts') - 1, lease_expires_at=None):
+        email.processing_attempts -= 1
+        _schedule_retry(email)
+    logger.warning(f"Email {email.id} devolvido para a fila: {error}")
+
+
+def _schedule_retry(email):
+    """Schedule ONCE do Django-Q que roda `process_email_batch([id])` após RATE_LIMIT_DEFER_SECONDS (+ jitter)."""
+    delay = RATE_LIMIT_DEFER_SECONDS + random.uniform(0, RATE_LIMIT_DEFER_SECONDS * 0.5)
+    try:
+        Schedule.objects.update_or_create(
+            name=f"Retentativa - email {email.id}",
+            defaults={
+                "func": "tasks.tasks.process_email_batch",
+                "args": repr([email.id]),
+                "schedule_type": Schedule.ONCE,
+                "repeats": -1,  # ONCE com repeats negativo: apagado depois de rodar
+                "next_run": timezone.now() + timedelta(seconds=delay),
+                "cluster": cluster_for(EXTRACTION),
+            },
         )
+    except Exception as e:
+        logger.warning(f"Falha ao agendar nova tentativa do email {email.id}: {e}")
+
+
+def _fail(email, error):
+    """Lógica de erro: marcar como FAILED e logar."""
+    try:
+        _move(email, EmailStatus.FAILED, from_status=[EmailStatus.PROCESSING, EmailStatus.BATCHED, EmailStatus.EXTRACTED])
+        logger.exception(f"Erro crítico no processamento do email {email.id}: {error}")
+        notify_telegram(email_msg=email, message=f"⚠️ Erro Crítico no pipeline para email ID: {email.id}. Detalhes: {error}")
+    except Exception:
+        logger.exception(f"Erro duplo no processamento e no logging do email {email.id}")
+
+
+def _deliver(email, matched_rule):
+    """
+    Etapa de entrega (Thales): notificação do email EXTRACTED e transição
+    para INTEGRATED. Exceções sobem para quem chamou.
+    """
+    extracted_data = email.extracted_data or {}
+    profile = matched_rule.extraction_profile if matched_rule else None
+    rule_name = matched_rule.name if matched_rule else "N/A"
+
+    logger.info(f"Iniciando notificação Telegram para email ID: {email.id}")
+    
+    # Formatação de Mensagem (Adaptação para o Processo Jurídico ou Genérico)
+    
+    if profile is not None and profile.pydantic_schema_name == 'ProcessoJuridicoSchema':
+        proc_numero = extracted_data.get('numero_processo', 'N/A')
+        movimento = extracted_data.get('resumo_movimentacao', 'Sem resumo.')
+        sugestao = extracted_data.get('sugestao_proximo_passo', 'Revisão manual necessária.')
+        prazo = extracted_data.get('prazo_fatal', None)
+
+        prazo_formatado = f"*{prazo}*" if prazo else "_Não identificado_"
+
+        message = (
+            f"⚖️ **Nova Movimentação Processual (Regra: {rule_name})**\n\n"
+            f"**Processo:** `{proc_numero}`\n"
+            f"**Assunto do E-mail:** {email.subject}\n\n"
+            f"**Resumo da IA:**\n_{movimento}_\n\n"
+            f"**Prazo Fatal:** {prazo_formatado}\n\n"
+            f"**➡️ Próximo Passo Sugerido:**\n`{sugestao}`"
+        )
+    else:
+        document_type = extracted_data.get('document_type', 'Dados Extraídos')
+        confidence = extracted_data.get('confidence_score', 'N/A')
         
-        if extracted_data is None:
-            email.status = EmailStatus.REQUIRES_REVIEW
-            email.save()
-            notify_telegram(email_msg=email, message=f"Revisão necessária para email ID: {email.id}. Extração IA falhou para perfil '{profile.name}'.")
-            return
-
-        email.extracted_data = extracted_data
-        email.status = EmailStatus.EXTRACTED
-        email.save()
-        
-        # 4. INTEGRAÇÕES (Thales) - Chamada de Integrações
-        
-        logger.info(f"Iniciando notificação Telegram para email ID: {email.id}")
-        
-        # Formatação de Mensagem (Adaptação para o Processo Jurídico ou Genérico)
-        
-        if profile.pydantic_schema_name == 'ProcessoJuridicoSchema':
-            proc_numero = extracted_data.get('numero_processo', 'N/A')
-            movimento = extracted_data.get('resumo_movimentacao', 'Sem resumo.')
-            sugestao = extracted_data.get('sugestao_proximo_passo', 'Revisão manual necessária.')
-            prazo = extracted_data.get('prazo_fatal', None)
-
-            prazo_formatado = f"*{prazo}*" if prazo else "_Não identificado_"
-
-            message = (
-                f"⚖️ **Nova Movimentação Processual (Regra: {matched_rule.name})**\n\n"
-                f"**Processo:** `{proc_numero}`\n"
-                f"**Assunto do E-mail:** {email.subject}\n\n"
-                f"**Resumo da IA:**\n_{movimento}_\n\n"
-                f"**Prazo Fatal:** {prazo_formatado}\n\n"
-                f"**➡️ Próximo Passo Sugerido:**\n`{sugestao}`"
-            )
-        else:
-            document_type = extracted_data.get('document_type', 'Dados Extraídos')
-            confidence = extracted_data.get('confidence_score', 'N/A')
-            
-            message = (
-                f"✅ **Extração Concluída ({document_type}) - Regra: {matched_rule.name}**\n\n"
-                f"**Assunto:** {email.subject}\n"
-                f"**Confiança da IA:** {confidence}%\n\n"
-                f"Dados extraídos salvos para processamento adicional."
-            )
-            
-        notify_telegram(email_msg=email, message=message)   
-             
-        # 5. FINALIZAÇÃO
-        email.status = EmailStatus.INTEGRATED 
-        email.last_processed_at = timezone.now()
-        email.save()
+        message = (
+            f"✅ **Extração Concluída ({document_type}) - Regra: {rule_name}**\n\n"
+            f"**Assunto:** {email.subject}\n"
+            f"**Confiança da IA:** {confidence}%\n\n"
+            f"Dados extraídos salvos para processamento adicional."
+        )
         
+    notify_telegram(email_msg=email, message=message)   
+         
+    # FINALIZAÇÃO
+    _move(email, EmailStatus.INTEGRATED, from_status=EmailStatus.EXTRACTED, last_processed_at=timezone.now())
+
+
+def process_email(email_id):
+    """
+    Worker principal: coordena a extração de IA e as integrações externas.
+    Agora usa o modelo AutomationRule para definir o fluxo dinamicamente.
+    """
+    try:
+        email = EmailMessage.objects.select_related('mailbox').get(pk=email_id)
+    except EmailMessage.DoesNotExist:
+        logger.error(f"EmailMessage {email_id} não encontrado.")
+        return None
+    return _process_loaded_email(email, get_rule_matcher(email.mailbox_id))
+
+
+def deliver_email(email_id):
+    """
+    Task da etapa de entrega (cluster "delivery" com Q_ISOLATED_QUEUES):
+    notifica um email já EXTRACTED. Emails em outro status são ignorados
+    (entrega repetida por retry do Django-Q não notifica duas vezes).
+    """
+    try:
+        email = EmailMessage.objects.select_related(
+            'mailbox', 'matched_rule__extraction_profile',
+        ).get(pk=email_id)
     except EmailMessage.DoesNotExist:
         logger.error(f"EmailMessage {email_id} não encontrado.")
+        return None
+    if email.status != EmailStatus.EXTRACTED:
+        logger.info(f"Email {email_id} em {email.status}: nada a entregar.")
+        return email.status
+    try:
+        _deliver(email, email.matched_rule)
     except Exception as e:
-        # Lógica de erro: marcar como FAILED e logar
-        try:
-            email.status = EmailStatus.FAILED
-            email.save()
-            logger.exception(f"Erro crítico no processamento do email {email_id}: {e}")
-            notify_telegram(email_msg=email, message=f"⚠️ Erro Crítico no pipeline para email ID: {email.id}. Detalhes: {e}")
-        except Exception:
-            logger.exception(f"Erro duplo no processamento e no logging do email {email_id}")
\ No newline at end of file
+        _fail(email, e)
+    return email.status
+
+
+def process_email_batch(email_ids):
+    """
+    Processa um bloco de emails numa única task do Django-Q.
+    Emails são carregados uma vez para o bloco todo, as regras (com perfis)
+    vêm do matcher compilado e cacheado por MailBox (tasks.rule_matcher) e
+    a conexão com o banco do worker é reaproveitada. A falha de um email
+    não interrompe os demais.
+    Retorna {email_id: status_final} (None para ids inexistentes ou já pegos
+    por outro worker).
+    """
+    from tasks import async_extraction  # evita import circular
+
+    ids = [i for i in (_safe_int(x) for x in (email_ids or [])) if i is not None]
+    if not ids:
+        return {}
+
+    emails = EmailMessage.objects.select_related('mailbox').in_bulk(ids)
+    matchers = get_rule_matchers(e.mailbox_id for e in emails.values())
+
+    results, loaded = {}, []
+    # filas mais altas primeiro dentro do bloco
+    for email_id in sorted(ids, key=lambda i: emails[i].priority if i in emails else len(EmailPriority)):
+        if email_id not in emails:
+            logger.error(f"EmailMessage {email_id} não encontrado.")
+            results[email_id] = None
+            continue
+        loaded.append(emails[email_id])
+
+    if async_extraction.ENABLED:
+        # chamadas à IA do bloco em paralelo (tasks/async_extraction.py)
+        results.update(async_extraction.process_emails_concurrently(loaded, matchers))
+    else:
+        for email in loaded:
+            results[email.id] = _process_loaded_email(email, matchers[email.mailbox_id])
+
+    failed = [i for i, status in results.items() if status in (None, EmailStatus.FAILED)]
+    logger.info(
+        "[process_email_batch] %s email(s) processado(s), %s com falha%s; %s.",
+        len(results), len(failed), f" (ids: {failed})" if failed else "", describe_cache_stats(),
+    )
+    return results
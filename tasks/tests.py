@@ -1,3 +1,1251 @@
+import ast
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+import imapclient
+from django_q.models import Schedule
+from imapclient.response_types import BodyData
+
+from emails.models import MailBox, MailBoxSyncState, EmailMessage, EmailStatus, EmailPriority, AutomationRule, UnmatchedPolicy
+from extraction.fake_batch import FakeBatchClient
+from extraction.models import ExecutionMode, ExtractionBatch, ExtractionBatchItem, ExtractionProfile
+from extraction.rate_limit import RateLimited
+from tasks.bench.corpus import generate_corpus
+from tasks.batch_worker import poll_batches, run_batch_cycle, submit_waiting_emails
+from tasks.claim_worker import claim_emails, drain_pending_emails, fail_exhausted_emails
+from tasks.bench.fake_imap import FakeIMAPServer
+from tasks.bench.runner import run_benchmark, _imap_env
+from tasks.idle import MailBoxIdleWorker
+from tasks.imap_search import compile_rule_search, search_token
+from tasks.normalize import html_to_text, normalize_body
+from tasks.priority import email_priority
+from tasks.reduce import reduce_text
+from tasks.rule_matcher import AhoCorasick, CompiledRuleMatcher, get_rule_matcher, invalidate_rule_matcher
+from tasks.scheduling import next_poll_interval, record_fetch_result, should_alert
+from tasks.orchestrator import HostLimiter, _claim_due_mailboxes, fetch_mailboxes_concurrently
+from tasks.imap_fetch import pick_text_part, decode_part, split_by_budget, iter_message_batches
+from tasks.tasks import (
+    _sync_mailbox,
+    _sync_new_uids,
+    _save_sync_state,
+    _build_email_payload,
+    _persist_email_batch,
+    deliver_email,
+    enqueue_email_batches,
+    fetch_emails,
+    process_email_batch,
+)
+
+User = get_user_model()
+
+
+class MailBoxTestMixin:
+    """Cria usuário e MailBox padrão para os testes do worker."""
+
+    def setUp(self):
+        invalidate_rule_matcher()
+        self.user = User.objects.create_user(username='worker', password='x')
+        self.mailbox = MailBox.objects.create(
+            user=self.user, name='Tribunal', imap_host='imap.test',
+            username='caixa@test', password='secret',
+        )
+
+
+class SyncStateTests(MailBoxTestMixin, TestCase):
+    """
+    Testes do checkpoint incremental (MailBoxSyncState) usado pelo fetch_emails.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.state = MailBoxSyncState.objects.create(
+            mailbox=self.mailbox, folder='INBOX', uid_validity=100, last_uid=10, highest_modseq=50,
+        )
+        self.server = mock.Mock()
+
+    def test_incremental_search_only_returns_delta(self):
+        """Busca `UID 11:*` e descarta o maior UID devolvido mesmo quando < 11."""
+        self.server.search.return_value = [10, 12, 11]
+        uids = _sync_new_uids(self.server, self.state, {b'UIDVALIDITY': 100, b'UIDNEXT': 13, b'HIGHESTMODSEQ': 52})
+
+        self.assertEqual(uids, [11, 12])
+        self.server.search.assert_called_once_with(['UID', '11:*'])
+
+    def test_unchanged_modseq_skips_search(self):
+        """Com HIGHESTMODSEQ igual ao salvo, nada mudou: nenhum SEARCH é emitido."""
+        uids = _sync_new_uids(self.server, self.state, {b'UIDVALIDITY': 100, b'UIDNEXT': 13, b'HIGHESTMODSEQ': 50})
+
+        self.assertEqual(uids, [])
+        self.server.search.assert_not_called()
+
+    def test_uidvalidity_change_resets_checkpoint(self):
+        """UIDVALIDITY diferente descarta o checkpoint e ressincroniza as mais recentes."""
+        self.server.search.return_value = list(range(1, 200))
+        with mock.patch('tasks.tasks.INITIAL_SYNC_LIMIT', 5):
+            uids = _sync_new_uids(self.server, self.state, {b'UIDVALIDITY': 101, b'UIDNEXT': 200})
+
+        self.assertEqual(uids, [195, 196, 197, 198, 199])
+        self.assertEqual(self.state.uid_validity, 101)
+        self.assertIsNone(self.state.highest_modseq)
+        self.server.search.assert_called_once_with(['ALL'])
+
+    def test_failed_fetch_batch_is_fetched_again(self):
+        """Lote do meio que falha segura o checkpoint abaixo dele; o próximo sync o rebusca."""
+        MailBox.objects.filter(pk=self.mailbox.pk).update(unmatched_policy=UnmatchedPolicy.SKIP)
+        self.mailbox.refresh_from_db()
+        fetched = []
+
+        def fake_batches(server, batch, **kwargs):
+            if batch == [12] and 'falha' not in fetched:
+                fetched.append('falha')
+                raise imapclient.exceptions.IMAPClientError('conexão caiu')
+            fetched.extend(batch)
+            yield [({'uid': u, 'subject': 'x', 'sender': 'a@b', 'headers': {}, 'text_part': None}, '', None) for u in batch]
+
+        select_info = {b'UIDVALIDITY': 100, b'UIDNEXT': 14, b'HIGHESTMODSEQ': 52}
+        with mock.patch('tasks.tasks.FETCH_BATCH_SIZE', 1), \
+                mock.patch('tasks.tasks.iter_message_batches', side_effect=fake_batches), \
+                mock.patch('tasks.tasks._prefilter_candidates', side_effect=lambda server, mailbox, uids: uids), \
+                mock.patch('tasks.tasks.notify_telegram'):
+            self.server.search.return_value = [11, 12, 13]
+            _sync_mailbox(self.server, self.mailbox, {'host': 'imap.test'}, self.state, select_info)
+            self.state.refresh_from_db()
+            self.assertEqual((self.state.last_uid, self.state.highest_modseq), (11, 50))
+
+            self.server.search.return_value = [12, 13]
+            _sync_mailbox(self.server, self.mailbox, {'host': 'imap.test'}, self.state, select_info)
+
+        self.assertEqual(fetched, [11, 'falha', 13, 12, 13])
+        self.state.refresh_from_db()
+        self.assertEqual((self.state.last_uid, self.state.highest_modseq), (13, 52))
+
+    def test_expunged_uid_does_not_hold_checkpoint(self):
+        """UID apagado entre o SEARCH e o FETCH conta como processado; o checkpoint avança."""
+        MailBox.objects.filter(pk=self.mailbox.pk).update(unmatched_policy=UnmatchedPolicy.SKIP)
+        self.mailbox.refresh_from_db()
+        part = BodyData.create((b'TEXT', b'PLAIN', (b'CHARSET', b'utf-8'), None, None, b'7BIT', 10, 1))
+        self.server.search.return_value = [11, 12, 13]
+        self.server.fetch.return_value = {uid: {b'BODYSTRUCTURE': part, b'RFC822.SIZE': 100} for uid in (11, 13)}
+
+        select_info = {b'UIDVALIDITY': 100, b'UIDNEXT': 14, b'HIGHESTMODSEQ': 52}
+        _sync_mailbox(self.server, self.mailbox, {'host': 'imap.test'}, self.state, select_info)
+
+        self.state.refresh_from_db()
+        self.assertEqual((self.state.last_uid, self.state.highest_modseq), (13, 52))
+
+    def test_save_sync_state_advances_checkpoint(self):
+        """O checkpoint avança para o maior UID processado e guarda o HIGHESTMODSEQ."""
+        _save_sync_state(self.state, [12, None, 11], {b'HIGHESTMODSEQ': 52})
+
+        self.state.refresh_from_db()
+        self.assertEqual(self.state.last_uid, 12)
+        self.assertEqual(self.state.highest_modseq, 52)
+        self.assertIsNotNone(self.state.last_synced_at)
+
+
+class BulkIngestionTests(MailBoxTestMixin, TestCase):
+    """
+    Testes da gravação em lote (dedup por IN + bulk_create) do fetch_emails.
+    """
+
+    def _row(self, uid, message_id, subject='Intimação'):
+        summary = {
+            'uid': uid, 'message_id': message_id, 'subject': subject,
+            'sender': 'Tribunal <push@tjsp.jus.br>', 'date': timezone.now(),
+        }
+        return uid, _build_email_payload(self.mailbox, summary, 'corpo', 'imap.test')
+
+    def test_batch_costs_constant_queries(self):
+        """Um lote inteiro custa 3 queries: dedup, INSERT em lote e leitura dos ids."""
+        EmailMessage.objects.create(
+            mailbox=self.mailbox, message_id='<old@x>', subject='antigo',
+            sender='a@b.c', received_at=timezone.now(), body_text='',
+        )
+        rows = [self._row(1, '<old@x>')] + [self._row(uid, f'<m{uid}@x>') for uid in range(2, 52)]
+        rows.append(self._row(60, '<m2@x>'))  # duplicado dentro do próprio lote
+
+        with self.assertNumQueries(3):
+            created_ids, processed, queued = _persist_email_batch(self.mailbox, rows)
+
+        self.assertEqual(len(created_ids), 50)
+        self.assertEqual([pk for pk, _priority in queued], created_ids)
+        self.assertEqual(len(processed), 52)
+        self.assertEqual(EmailMessage.objects.count(), 51)
+
+    def test_raw_stored_only_for_new_messages(self):
+        """Duplicados (no banco ou no próprio lote) não gravam blob no RawStore."""
+        EmailMessage.objects.create(
+            mailbox=self.mailbox, message_id='<old@x>', subject='antigo',
+            sender='a@b.c', received_at=timezone.now(), body_text='',
+        )
+        rows = [self._row(1, '<old@x>'), self._row(2, '<new@x>'), self._row(3, '<new@x>')]
+        raws = {1: b'antigo', 2: b'novo', 3: b'novo de novo'}
+
+        with mock.patch('tasks.tasks.get_raw_store') as get_store:
+            get_store.return_value.put.return_value = 'a' * 64
+            _persist_email_batch(self.mailbox, rows, raws)
+
+        get_store.return_value.put.assert_called_once_with(b'novo')
+        self.assertEqual(EmailMessage.objects.get(message_id='<new@x>').raw_sha256, 'a' * 64)
+
+    def test_payload_respects_max_length(self):
+        """Assunto maior que o campo é cortado em vez de derrubar o lote."""
+        _uid, payload = self._row(1, None, subject='x' * 900)
+
+        self.assertEqual(len(payload['subject']), 500)
+        self.assertEqual(payload['message_id'], '<uid-1@imap.test>')
+
+
+class RuleMatcherTests(MailBoxTestMixin, TestCase):
+    """
+    Testes do matcher compilado e cacheado das Regras de Automação (tasks.rule_matcher).
+    """
+
+    def _rule(self, name, priority=10, subject=None, sender=None, pk=None):
+        return AutomationRule(pk=pk, user=self.user, mailbox=self.mailbox, name=name, priority=priority,
+                              subject_contains=subject, sender_contains=sender)
+
+    def test_aho_corasick_finds_overlapping_patterns(self):
+        automaton = AhoCorasick(['he', 'she', 'his', 'hers', 'intimação'])
+
+        self.assertEqual(automaton.find('ushers'), {0, 1, 3})
+        self.assertEqual(automaton.find('nova intimação'), {4})
+        self.assertEqual(automaton.find('xyz'), set())
+
+    def test_keeps_priority_semantics(self):
+        """Primeira regra por prioridade cujas condições (E) casam; regra vazia casa com tudo."""
+        matcher = CompiledRuleMatcher([
+            self._rule('Tudo', priority=99, pk=1),
+            self._rule('TJSP', priority=5, subject='intimação', sender='tjsp', pk=2),
+            self._rule('Intimações', priority=7, subject='INTIMAÇÃO', pk=3),
+        ])
+
+        self.assertEqual(matcher.match('Nova Intimação', 'push@tjsp.jus.br').name, 'TJSP')
+        self.assertEqual(matcher.match('Nova Intimação', 'trt2').name, 'Intimações')
+        self.assertEqual(matcher.match('Newsletter', 'push@tjsp.jus.br').name, 'Tudo')
+        self.assertIsNone(CompiledRuleMatcher([self._rule('A', subject='x', pk=4)]).match('y', 'z'))
+
+    def test_cached_until_a_rule_changes(self):
+        rule = AutomationRule.objects.create(user=self.user, mailbox=self.mailbox, name='A', subject_contains='intimação')
+        get_rule_matcher(self.mailbox.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_rule_matcher(self.mailbox.id).match('Intimação', '').id, rule.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.subject_contains = 'citação'
+            rule.save()
+
+        self.assertIsNone(get_rule_matcher(self.mailbox.id).match('Intimação', ''))
+
+    def test_advanced_conditions_plan(self):
+        """Regex, listas, domínio e cabeçalho; ANY casa com qualquer uma, ALL exige todas."""
+        tribunal = self._rule('Tribunal', priority=1, pk=1)
+        tribunal.conditions = [
+            {'field': 'sender_domain', 'op': 'any_of', 'value': ['jus.br']},
+            {'field': 'header', 'op': 'present', 'header': 'X-Tribunal'},
+        ]
+        processo = self._rule('Processo', priority=2, pk=2)
+        processo.conditions_match = 'ANY'
+        processo.conditions = [
+            {'field': 'subject', 'op': 'regex', 'value': r'\d{7}-\d{2}'},
+            {'field': 'subject', 'op': 'all_of', 'value': ['processo', 'urgente']},
+        ]
+        matcher = CompiledRuleMatcher([tribunal, processo])
+
+        self.assertEqual(matcher.header_names, ['X-Tribunal'])
+        self.assertEqual(matcher.match('Aviso', 'push@tjsp.jus.br', {'X-Tribunal': 'TJSP'}).name, 'Tribunal')
+        self.assertIsNone(matcher.match('Aviso', 'push@tjsp.jus.br', {}))
+        self.assertEqual(matcher.match('Autos 1234567-89', 'a@b.com').name, 'Processo')
+        self.assertEqual(matcher.match('URGENTE: processo parado', 'a@b.com').name, 'Processo')
+        self.assertIsNone(matcher.match('Processo parado', 'a@b.com'))
+
+    def test_body_conditions_are_decided_after_download(self):
+        """Sem o corpo, regra que depende dele pede o download; depois casa normalmente."""
+        rule = self._rule('Prazo', pk=1)
+        rule.conditions = [{'field': 'body', 'op': 'any_of', 'value': ['prazo fatal', 'intimação']}]
+        matcher = CompiledRuleMatcher([rule])
+
+        self.assertEqual(matcher.evaluate('Aviso', 'a@b.com'), (None, True))
+        self.assertEqual(matcher.match('Aviso', 'a@b.com', body='Fica INTIMAÇÃO do despacho').name, 'Prazo')
+        self.assertIsNone(matcher.match('Aviso', 'a@b.com', body='Newsletter'))
+
+
+class IngestRuleMatchingTests(MailBoxTestMixin, TestCase):
+    """
+    Testes da avaliação das regras na ingestão (fast path de emails sem regra).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.rule = AutomationRule.objects.create(
+            user=self.user, mailbox=self.mailbox, name='Intimações', subject_contains='intimacao',
+        )
+
+    def _fetch(self, subjects):
+        with FakeIMAPServer() as server, _imap_env(server):
+            server.append('INBOX', b'Subject: seed\r\n\r\nseed')
+            MailBoxSyncState.objects.create(
+                mailbox=self.mailbox, folder='INBOX', uid_validity=server.folder('INBOX').uidvalidity, last_uid=1,
+            )
+            for i, subject in enumerate(subjects):
+                msg = f'Subject: {subject}\r\nFrom: push@tjsp.jus.br\r\nMessage-ID: <r{i}@x>\r\n\r\ncorpo {i}'
+                server.append('INBOX', msg.encode())
+            with mock.patch('tasks.tasks.async_task') as async_task:
+                fetch_emails(self.mailbox.id, force=True)
+        return [call.args[1] for call in async_task.call_args_list]
+
+    def test_only_matched_emails_are_enqueued_tagged_with_rule(self):
+        queued = self._fetch(['Intimacao 1', 'Newsletter', 'INTIMACAO 2'])
+
+        matched = EmailMessage.objects.filter(status=EmailStatus.PENDING).order_by('id')
+        ignored = EmailMessage.objects.get(status=EmailStatus.IGNORED)
+        self.assertEqual(queued, [[e.id for e in matched]])
+        self.assertEqual({e.matched_rule_id for e in matched}, {self.rule.id})
+        self.assertEqual(matched[0].body_text, 'corpo 0')
+        # sem regra: registro leve, corpo nem é baixado
+        self.assertEqual((ignored.subject, ignored.body_text), ('Newsletter', ''))
+
+    def test_emails_are_enqueued_by_priority_lane(self):
+        """Urgente entra no broker antes, em bloco próprio; regra de prioridade baixa vai para LOW."""
+        AutomationRule.objects.create(
+            user=self.user, mailbox=self.mailbox, name='Boletins', subject_contains='boletim', priority=60,
+        )
+        queued = self._fetch(['Boletim semanal', 'Intimacao 1', 'Boletim mensal'])
+
+        lanes = dict(EmailMessage.objects.values_list('subject', 'priority'))
+        self.assertEqual(lanes, {
+            'Boletim semanal': EmailPriority.LOW, 'Intimacao 1': EmailPriority.URGENT, 'Boletim mensal': EmailPriority.LOW,
+        })
+        ids = dict(EmailMessage.objects.values_list('subject', 'id'))
+        self.assertEqual(queued, [[ids['Intimacao 1']], [ids['Boletim semanal'], ids['Boletim mensal']]])
+
+    def test_body_and_header_conditions_at_ingest(self):
+        """Cabeçalhos das regras vêm na fase 1; corpo só é baixado quando alguma regra depende dele."""
+        self.rule.subject_contains = ''
+        self.rule.conditions = [{'field': 'body', 'op': 'contains', 'value': 'prazo'}]
+        self.rule.save()
+        AutomationRule.objects.create(
+            user=self.user, mailbox=self.mailbox, name='Cabeçalho', priority=1,
+            conditions=[{'field': 'header', 'op': 'present', 'header': 'X-Tribunal'}],
+        )
+        invalidate_rule_matcher()
+
+        with FakeIMAPServer() as server, _imap_env(server):
+            server.append('INBOX', b'Subject: seed\r\n\r\nseed')
+            MailBoxSyncState.objects.create(
+                mailbox=self.mailbox, folder='INBOX', uid_validity=server.folder('INBOX').uidvalidity, last_uid=1,
+            )
+            server.append('INBOX', b'Subject: A\r\nFrom: a@x.com\r\nMessage-ID: <a@x>\r\n\r\nabre prazo de 5 dias')
+            server.append('INBOX', b'Subject: B\r\nFrom: b@x.com\r\nMessage-ID: <b@x>\r\n\r\nnewsletter')
+            server.append('INBOX', b'Subject: C\r\nX-Tribunal: TJSP\r\nMessage-ID: <c@x>\r\n\r\ncorpo')
+            with mock.patch('tasks.tasks.async_task'):
+                fetch_emails(self.mailbox.id, force=True)
+
+        emails = {e.subject: e for e in EmailMessage.objects.all()}
+        self.assertEqual(emails['A'].matched_rule_id, self.rule.id)
+        self.assertEqual(emails['C'].matched_rule.name, 'Cabeçalho')
+        self.assertEqual((emails['B'].status, emails['B'].body_text), (EmailStatus.IGNORED, ''))
+
+    def test_skip_policy_does_not_store_unmatched(self):
+        self.mailbox.unmatched_policy = UnmatchedPolicy.SKIP
+        self.mailbox.save()
+
+        self._fetch(['Newsletter', 'Intimacao 1'])
+
+        self.assertEqual(list(EmailMessage.objects.values_list('subject', flat=True)), ['Intimacao 1'])
+        self.assertEqual(MailBoxSyncState.objects.get(mailbox=self.mailbox).last_uid, 3)
+
+
+class ProcessEmailBatchTests(MailBoxTestMixin, TestCase):
+    """
+    Testes da task em lote process_email_batch e do enfileiramento em blocos.
+    """
+
+    def setUp(self):
+        super().setUp()
+        profile = ExtractionProfile.objects.create(
+            user=self.user, name='Jurídico', system_prompt_template='Hoje é {data_atual}.',
+            pydantic_schema_name='ProcessoJuridicoSchema',
+        )
+        AutomationRule.objects.create(
+            user=self.user, mailbox=self.mailbox, name='Intimações',
+            subject_contains='intimação', extraction_profile=profile,
+        )
+        self.emails = [
+            EmailMessage.objects.create(
+                mailbox=self.mailbox, message_id=f'<b{i}@x>', subject=subject,
+                sender='push@tjsp.jus.br', received_at=timezone.now(), body_text='corpo',
+            )
+            for i, subject in enumerate(['Intimação 1', 'Newsletter', 'Intimação 2'])
+        ]
+        footer_cache = mock.patch.dict('tasks.reduce._footer_cache', clear=True)
+        footer_cache.start()
+        self.addCleanup(footer_cache.stop)
+
+    @mock.patch('tasks.tasks.notify_telegram')
+    @mock.patch('tasks.tasks.extract_fields_from_text')
+    def test_batch_reports_status_per_email(self, extract, _notify):
+        """Cada email tem seu status; a falha de um não interrompe o bloco."""
+        extract.side_effect = [{'numero_processo': '1'}, RuntimeError('timeout da IA')]
+        ids = [e.id for e in self.emails] + [999999]
+
+        results = process_email_batch(ids)
+
+        self.assertEqual(results, {
+            self.emails[0].id: EmailStatus.INTEGRATED,
+            self.emails[1].id: EmailStatus.IGNORED,
+            self.emails[2].id: EmailStatus.FAILED,
+            999999: None,
+        })
+
+    @mock.patch('tasks.tasks.notify_telegram')
+    @mock.patch('tasks.tasks.extract_fields_from_text', return_value=None)
+    def test_rules_loaded_once_per_batch(self, _extract, _notify):
+        """Emails, regras (com perfil) e rodapé do domínio são lidos uma vez só, não por email."""
+        with CaptureQueriesContext(connection) as ctx:
+            process_email_batch([e.id for e in self.emails])
+
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 3)
+
+    @mock.patch('tasks.tasks.notify_telegram')
+    @mock.patch('tasks.tasks.extract_fields_from_text', return_value={'numero_processo': '1'})
+    def test_claimed_email_is_not_processed_twice(self, extract, _notify):
+        """Email já pego por outro worker é pulado; as gravações não reescrevem o corpo."""
+        EmailMessage.transition(self.emails[2].id, EmailStatus.PENDING, EmailStatus.PROCESSING)
+
+        with CaptureQueriesContext(connection) as ctx:
+            results = process_email_batch([self.emails[0].id, self.emails[2].id])
+
+        self.assertEqual(results, {self.emails[0].id: EmailStatus.INTEGRATED, self.emails[2].id: None})
+        self.assertEqual(extract.call_count, 1)
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 4)  # 2 reivindicações + EXTRACTED + INTEGRATED
+        self.assertFalse(any('"body_text"' in sql for sql in updates))
+
+        self.emails[0].refresh_from_db()
+        self.assertEqual(self.emails[0].processing_attempts, 1)
+        self.assertEqual(self.emails[0].extracted_data, {'numero_processo': '1'})
+        self.assertEqual(self.emails[0].matched_rule.name, 'Intimações')
+
+    @mock.patch('tasks.queues.ISOLATED', True)
+    @mock.patch('tasks.tasks.async_task')
+    @mock.patch('tasks.tasks.notify_telegram')
+    @mock.patch('tasks.tasks.extract_fields_from_text', return_value={'numero_processo': '1'})
+    def test_isolated_queues_hand_off_to_delivery(self, _extract, notify, async_task):
+        """Com filas isoladas a extração para em EXTRACTED e a entrega roda no cluster 'delivery'."""
+        email = self.emails[0]
+        enqueue_email_batches([email.id])
+        self.assertEqual(async_task.call_args.kwargs['cluster'], 'extraction')
+
+        self.assertEqual(process_email_batch([email.id]), {email.id: EmailStatus.EXTRACTED})
+        self.assertEqual(async_task.call_args.args, ('tasks.tasks.deliver_email', email.id))
+        self.assertEqual(async_task.call_args.kwargs['cluster'], 'delivery')
+        notify.assert_not_called()
+
+        self.assertEqual(deliver_email(email.id), EmailStatus.INTEGRATED)
+        self.assertIn('`1`', notify.call_args.kwargs['message'])
+        # retry da entrega não notifica de novo
+        self.assertEqual(deliver_email(email.id), EmailStatus.INTEGRATED)
+        self.assertEqual(notify.call_count, 1)
+
+    @mock.patch('tasks.tasks.notify_telegram')
+    @mock.patch('tasks.tasks.extract_fields_from_text', side_effect=RateLimited('429 persistente'))
+    def test_rate_limited_email_returns_to_queue(self, _extract, notify):
+        """Sem capacidade na OpenAI o email volta para PENDING (claim worker), não para revisão."""
+        email = self.emails[0]
+        self.assertEqual(process_email_batch([email.id]), {email.id: EmailStatus.PENDING})
+
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.processing_attempts, email.lease_expires_at), (EmailStatus.PENDING, 0, None))
+        notify.assert_not_called()
+
+    @mock.patch('tasks.tasks.notify_telegram')
+    def test_rate_limited_email_is_scheduled_again(self, _notify):
+        """Sem claim worker, o email devolvido à fila volta a ser processado pelo Schedule de retentativa."""
+        email = self.emails[0]
+        with mock.patch('tasks.tasks.extract_fields_from_text', side_effect=RateLimited('429 persistente')):
+            process_email_batch([email.id])
+
+        schedule = Schedule.objects.get(name=f'Retentativa - email {email.id}')
+        self.assertEqual((schedule.func, schedule.schedule_type), ('tasks.tasks.process_email_batch', Schedule.ONCE))
+        self.assertGreaterEqual(schedule.next_run, timezone.now() + timedelta(seconds=50))
+
+        with mock.patch('tasks.tasks.extract_fields_from_text', return_value={'numero_processo': '1'}):
+            results = process_email_batch(ast.literal_eval(schedule.args))
+        self.assertIn(results[email.id], (EmailStatus.EXTRACTED, EmailStatus.INTEGRATED))
+
+    @mock.patch('tasks.tasks.async_task')
+    def test_enqueue_in_chunks(self, async_task):
+        """25 ids com blocos de 10 geram 3 tasks no broker."""
+        self.assertEqual(enqueue_email_batches(list(range(1, 26)), batch_size=10), 3)
+        chunks = [c.args[1] for c in async_task.call_args_list]
+        self.assertEqual([len(c) for c in chunks], [10, 10, 5])
+        self.assertEqual(async_task.call_args_list[0].args[0], 'tasks.tasks.process_email_batch')
+
+
+class ClaimWorkerTests(MailBoxTestMixin, TestCase):
+    """
+    Testes do claim worker (tasks.claim_worker): reserva, reserva vencida e esgotamento.
+    """
+
+    def setUp(self):
+        super().setUp()
+        profile = ExtractionProfile.objects.create(
+            user=self.user, name='Jurídico', system_prompt_template='Hoje é {data_atual}.',
+            pydantic_schema_name='ProcessoJuridicoSchema',
+        )
+        AutomationRule.objects.create(
+            user=self.user, mailbox=self.mailbox, name='Intimações',
+            subject_contains='intimação', extraction_profile=profile,
+        )
+        now = timezone.now()
+        self.emails = [
+            EmailMessage.objects.create(
+                mailbox=self.mailbox, message_id=f'<c{i}@x>', subject=f'Intimação {i}',
+                sender='push@tjsp.jus.br', received_at=now - timedelta(minutes=10 - i), body_text='corpo',
+            )
+            for i in range(5)
+        ]
+        footer_cache = mock.patch.dict('tasks.reduce._footer_cache', clear=True)
+        footer_cache.start()
+        self.addCleanup(footer_cache.stop)
+
+    def _lease(self, email, status, expires_in, attempts=1):
+        EmailMessage.objects.filter(pk=email.pk).update(
+            status=status, processing_attempts=attempts,
+            lease_expires_at=timezone.now() + timedelta(seconds=expires_in),
+        )
+
+    def test_claims_are_disjoint_and_oldest_first(self):
+        first = claim_emails(limit=3)
+        second = claim_emails(limit=3)
+
+        self.assertEqual(first, [e.id for e in self.emails[:3]])
+        self.assertEqual(second, [e.id for e in self.emails[3:]])
+        self.assertEqual(claim_emails(limit=3), [])
+        email = EmailMessage.objects.get(pk=first[0])
+        self.assertEqual(email.status, EmailStatus.PROCESSING)
+        self.assertEqual(email.processing_attempts, 1)
+        self.assertGreater(email.lease_expires_at, timezone.now())
+
+    def test_skip_locked_path(self):
+        """Mesmo resultado pelo caminho SELECT ... FOR UPDATE SKIP LOCKED."""
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', True):
+            self.assertEqual(claim_emails(limit=2), [e.id for e in self.emails[:2]])
+        self.assertEqual(EmailMessage.objects.filter(status=EmailStatus.PROCESSING).count(), 2)
+
+    def test_expired_lease_is_reclaimed(self):
+        """Reserva vencida volta para a fila; reserva válida e emails concluídos não."""
+        self._lease(self.emails[0], EmailStatus.PROCESSING, expires_in=-60)
+        self._lease(self.emails[1], EmailStatus.PROCESSING, expires_in=600)
+        EmailMessage.objects.filter(pk__in=[e.pk for e in self.emails[2:]]).update(status=EmailStatus.INTEGRATED)
+
+        self.assertEqual(claim_emails(limit=10), [self.emails[0].id])
+        self.assertEqual(EmailMessage.objects.get(pk=self.emails[0].pk).processing_attempts, 2)
+
+    @mock.patch('tasks.claim_worker.notify_telegram')
+    def test_exhausted_emails_fail(self, notify):
+        self._lease(self.emails[0], EmailStatus.PROCESSING, expires_in=-60, attempts=5)
+        EmailMessage.objects.filter(pk__in=[e.pk for e in self.emails[1:]]).update(status=EmailStatus.INTEGRATED)
+
+        self.assertEqual(claim_emails(limit=10), [])
+        self.assertEqual(fail_exhausted_emails(), [self.emails[0].id])
+        self.assertEqual(EmailMessage.objects.get(pk=self.emails[0].pk).status, EmailStatus.FAILED)
+        notify.assert_called_once()
+
+    @mock.patch('tasks.tasks.notify_telegram')
+    @mock.patch('tasks.tasks.extract_fields_from_text', return_value={'numero_processo': '1'})
+    def test_drain_processes_whole_backlog(self, extract, _notify):
+        summary = drain_pending_emails(batch_size=2)
+
+        self.assertEqual((summary['claimed'], summary['batches'], summary['failed']), (5, 3, 0))
+        self.assertEqual(set(summary['cache']), {'hits', 'misses', 'stores', 'hit_ratio'})
+        self.assertEqual(extract.call_count, 5)
+        self.assertEqual(
+            set(EmailMessage.objects.values_list('status', flat=True)), {EmailStatus.INTEGRATED},
+        )
+
+
+class _SlowAsyncClient:
+    """AsyncOpenAI falso: responde após uma pausa e mede as chamadas simultâneas."""
+
+    def __init__(self, result):
+        self.result, self.calls, self.in_flight, self.peak = result, 0, 0, 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(0.02)
+            if 'falha' in kwargs['messages'][-1]['content']:
+                raise RuntimeError('500 da OpenAI')
+        finally:
+            self.in_flight -= 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(self.result)))])
+
+
+@mock.patch('tasks.async_extraction.ENABLED', True)
+@mock.patch('tasks.async_extraction.CONCURRENCY', 2)
+class AsyncExtractionTests(MailBoxTestMixin, TestCase):
+    """
+    Testes do motor concorrente (tasks.async_extraction) com AsyncOpenAI falso.
+    """
+
+    RESULT = {
+        'document_type': 'MOVIMENTACAO_PROCESSUAL', 'confidence_score': 90,
+        'numero_processo': '0000001-00.2025.8.26.0100', 'tipo_movimentacao': 'Intimação',
+        'resumo_movimentacao': 'Intimação para manifestação.', 'prazo_fatal': '2025-11-10',
+        'sugestao_proximo_passo': 'Dar ciência',
+    }
+
+    def setUp(self):
+        super().setUp()
+        profile = ExtractionProfile.objects.create(
+            user=self.user, name='Jurídico', system_prompt_template='Hoje é {data_atual}.',
+            pydantic_schema_name='ProcessoJuridicoSchema',
+        )
+        AutomationRule.objects.create(
+            user=self.user, mailbox=self.mailbox, name='Intimações',
+            subject_contains='intimação', extraction_profile=profile,
+        )
+        bodies = ['corpo 0', 'corpo 1', 'falha', 'corpo 3', 'corpo 4']
+        self.emails = [
+            EmailMessage.objects.create(
+                mailbox=self.mailbox, message_id=f'<a{i}@x>', subject=f'Intimação {i}',
+                sender='push@tjsp.jus.br', received_at=timezone.now(), body_text=body,
+            )
+            for i, body in enumerate(bodies)
+        ]
+        self.client = _SlowAsyncClient(self.RESULT)
+        for target in (
+            mock.patch('extraction.ai_wrapper.get_async_client', return_value=self.client),
+            mock.patch('tasks.async_extraction.close_async_client', new=mock.AsyncMock()),
+            mock.patch('tasks.tasks.notify_telegram'),
+            mock.patch.dict('tasks.reduce._footer_cache', clear=True),
+        ):
+            target.start()
+            self.addCleanup(target.stop)
+
+    def test_batch_runs_calls_concurrently_up_to_the_limit(self):
+        results = process_email_batch([e.id for e in self.emails])
+
+        self.assertEqual(self.client.calls, 5)
+        self.assertEqual(self.client.peak, 2)
+        failed = self.emails[2].id
+        self.assertEqual(results[failed], EmailStatus.REQUIRES_REVIEW)
+        self.assertEqual({s for i, s in results.items() if i != failed}, {EmailStatus.INTEGRATED})
+        email = EmailMessage.objects.get(pk=self.emails[0].pk)
+        self.assertEqual(email.extracted_data['numero_processo'], '0000001-00.2025.8.26.0100')
+
+    def test_claim_worker_uses_engine_and_cache(self):
+        """Resultado em cache não chama a IA; claim worker passa pelo mesmo motor."""
+        process_email_batch([self.emails[0].id])
+        EmailMessage.objects.filter(pk=self.emails[1].pk).update(body_text='corpo 0')
+
+        summary = drain_pending_emails(batch_size=10)
+
+        self.assertEqual(summary['claimed'], 4)
+        self.assertEqual(self.client.calls, 4)  # 'corpo 0' veio do cache
+        self.assertEqual(EmailMessage.objects.get(pk=self.emails[1].pk).status, EmailStatus.INTEGRATED)
+
+
+class BatchModeTests(MailBoxTestMixin, TestCase):
+    """
+    Testes do modo lote (tasks.batch_worker) com a Batch API local (extraction.fake_batch).
+    """
+
+    def setUp(self):
+        super().setUp()
+        profile = ExtractionProfile.objects.create(
+            user=self.user, name='Backfill', system_prompt_template='Hoje é {data_atual}.',
+            pydantic_schema_name='ProcessoJuridicoSchema', execution_mode=ExecutionMode.BATCH,
+        )
+        AutomationRule.objects.create(
+            user=self.user, mailbox=self.mailbox, name='Intimações',
+            subject_contains='intimação', extraction_profile=profile,
+        )
+        self.emails = [
+            EmailMessage.objects.create(
+                mailbox=self.mailbox, message_id=f'<l{i}@x>', subject=f'Intimação {i}',
+                sender='push@tjsp.jus.br', received_at=timezone.now(), body_text=body,
+            )
+            for i, body in enumerate(['corpo 0', 'resposta inválida', 'corpo 2'])
+        ]
+        for target in (
+            mock.patch('tasks.tasks.notify_telegram'),
+            mock.patch.dict('tasks.reduce._footer_cache', clear=True),
+        ):
+            target.start()
+            self.addCleanup(target.stop)
+
+    @staticmethod
+    def _responder(body):
+        if 'inválida' in body['messages'][-1]['content']:
+            return '{"document_type": "OUTRO"}'
+        return json.dumps(AsyncExtractionTests.RESULT)
+
+    def _status(self, email):
+        return EmailMessage.objects.get(pk=email.pk).status
+
+    @mock.patch('tasks.tasks.extract_fields_from_text', return_value={'numero_processo': '1'})
+    def test_batch_profile_waits_for_batch_and_completes(self, extract):
+        urgent = EmailMessage.objects.create(
+            mailbox=self.mailbox, message_id='<urgente@x>', subject='Intimação urgente',
+            sender='push@tjsp.jus.br', received_at=timezone.now(), body_text='corpo', priority=EmailPriority.URGENT,
+        )
+        results = process_email_batch([e.id for e in self.emails] + [urgent.id])
+
+        # urgente não espera o lote; os demais não chamam a IA agora
+        self.assertEqual(results[urgent.id], EmailStatus.INTEGRATED)
+        self.assertEqual(extract.call_count, 1)
+        self.assertEqual({results[e.id] for e in self.emails}, {EmailStatus.BATCHED})
+
+        client = FakeBatchClient(self._responder)
+        with mock.patch('extraction.batch.get_batch_client', return_value=client):
+            self.assertIsNone(submit_waiting_emails())  # ainda acumulando
+            batch = submit_waiting_emails(force=True)
+            self.assertEqual(batch.request_count, 3)
+            lines = client.requests(batch.batch_id)
+            self.assertEqual([line['custom_id'] for line in lines], [f'email-{e.id}' for e in self.emails])
+            self.assertTrue(lines[0]['body']['messages'][-1]['content'].endswith('corpo 0'))
+
+            self.assertEqual(poll_batches()['active'], 1)
+            summary = run_batch_cycle()
+
+        self.assertEqual((summary['finished'], summary['extracted'], summary['review'], summary['submitted']), (1, 2, 1, 0))
+        self.assertEqual(
+            [self._status(e) for e in self.emails],
+            [EmailStatus.INTEGRATED, EmailStatus.REQUIRES_REVIEW, EmailStatus.INTEGRATED],
+        )
+        self.assertEqual(EmailMessage.objects.get(pk=self.emails[0].pk).extracted_data['prazo_fatal'], '2025-11-10')
+        batch.refresh_from_db()
+        self.assertEqual((batch.status, batch.succeeded, batch.failed), ('completed', 2, 1))
+        self.assertFalse(ExtractionBatchItem.objects.exists())
+
+    def test_expired_batch_requeues_emails(self):
+        process_email_batch([e.id for e in self.emails])
+
+        with mock.patch('extraction.batch.get_batch_client', return_value=FakeBatchClient(self._responder, polls_until_complete=0, final_status='expired')):
+            submit_waiting_emails(force=True)
+            summary = poll_batches()
+            self.assertEqual(summary['requeued'], 3)
+            self.assertEqual({self._status(e) for e in self.emails}, {EmailStatus.BATCHED})
+
+            # voltam no próximo lote
+            self.assertEqual(submit_waiting_emails(force=True).request_count, 3)
+        self.assertEqual(ExtractionBatch.objects.filter(status='expired').count(), 1)
+
+
+class PriorityLaneTests(MailBoxTestMixin, TestCase):
+    """
+    Testes das filas de prioridade (tasks.priority) e da reserva por fila com proteção contra inanição.
+    """
+
+    def _rule(self, priority=10, schema=None):
+        profile = schema and ExtractionProfile(user=self.user, name=schema, pydantic_schema_name=schema)
+        return AutomationRule(user=self.user, mailbox=self.mailbox, name='R', priority=priority, extraction_profile=profile)
+
+    def test_lane_from_markers_profile_and_rule_priority(self):
+        self.assertEqual(email_priority('URGENTE: ofício', 'a@b.c', self._rule()), EmailPriority.URGENT)
+        self.assertEqual(email_priority('Intimação eletrônica', 'a@b.c', self._rule(priority=90)), EmailPriority.URGENT)
+        self.assertEqual(email_priority('Movimentação', 'a@b.c', self._rule(schema='ProcessoJuridicoSchema')), EmailPriority.HIGH)
+        self.assertEqual(email_priority('OS 123', 'a@b.c', self._rule(priority=1)), EmailPriority.HIGH)
+        self.assertEqual(email_priority('OS 123', 'a@b.c', self._rule()), EmailPriority.NORMAL)
+        self.assertEqual(email_priority('Boletim', 'a@b.c', self._rule(priority=50)), EmailPriority.LOW)
+
+    def test_claim_drains_higher_lanes_without_starving_lower(self):
+        """Bloco de 5: 4 urgentes (os mais antigos primeiro) + o email mais antigo da fila baixa."""
+        now = timezone.now()
+
+        def create(name, priority, minutes_ago):
+            return EmailMessage.objects.create(
+                mailbox=self.mailbox, message_id=f'<{name}@x>', subject=name, sender='a@b.c',
+                received_at=now - timedelta(minutes=minutes_ago), body_text='', priority=priority,
+            ).id
+
+        low = [create(f'low{i}', EmailPriority.LOW, 100 - i) for i in range(10)]
+        urgent = [create(f'urg{i}', EmailPriority.URGENT, 10 - i) for i in range(10)]
+
+        self.assertEqual(claim_emails(limit=5), urgent[:4] + low[:1])
+        self.assertEqual(claim_emails(limit=5), urgent[4:8] + low[1:2])
+
+    @mock.patch('tasks.tasks.async_task')
+    def test_enqueue_does_not_mix_lanes(self, async_task):
+        lanes = {1: EmailPriority.LOW, 2: EmailPriority.URGENT, 3: EmailPriority.LOW, 4: EmailPriority.NORMAL}
+
+        self.assertEqual(enqueue_email_batches([1, 2, 3, 4], batch_size=10, lanes=lanes), 3)
+        self.assertEqual([c.args[1] for c in async_task.call_args_list], [[2], [4], [1, 3]])
+
+
+class ImapPrefilterTests(MailBoxTestMixin, TestCase):
+    """
+    Testes do pré-filtro SEARCH compilado a partir das regras (tasks.imap_search).
+    """
+
+    def _rule(self, name, subject=None, sender=None):
+        return AutomationRule(user=self.user, mailbox=self.mailbox, name=name,
+                              subject_contains=subject, sender_contains=sender)
+
+    def test_tokens_are_ascii_supersets(self):
+        """Acentos viram o maior trecho ASCII; trechos curtos não filtram."""
+        self.assertEqual(search_token('Intimação'), 'Intima')
+        self.assertEqual(search_token('  tjsp.jus.br '), 'tjsp.jus.br')
+        self.assertIsNone(search_token('ção'))
+
+    def test_compiles_or_of_and_without_parentheses(self):
+        criteria = compile_rule_search([
+            self._rule('A', subject='Intimação', sender='tjsp'),
+            self._rule('B', subject='Citação'),
+        ])
+        self.assertEqual(criteria, [
+            'OR', 'NOT', 'OR', 'NOT', 'SUBJECT', 'Intima', 'NOT', 'FROM', 'tjsp', 'SUBJECT', 'Cita',
+        ])
+
+    def test_unfilterable_rule_disables_prefilter(self):
+        """Regra sem condição (casa com tudo) desliga o filtro: nada pode ser perdido."""
+        self.assertIsNone(compile_rule_search([self._rule('A', subject='Intimação'), self._rule('Tudo')]))
+        self.assertIsNone(compile_rule_search([]))
+
+    def test_advanced_conditions_keep_the_filter_a_superset(self):
+        """Em ALL, regex/corpo são omitidos do E; em ANY, uma condição não filtrável desliga o filtro."""
+        all_rule = self._rule('A', sender='tjsp')
+        all_rule.conditions = [
+            {'field': 'subject', 'op': 'contains', 'value': 'Intimação'},
+            {'field': 'body', 'op': 'regex', 'value': 'prazo'},
+        ]
+        any_rule = self._rule('B')
+        any_rule.conditions_match = 'ANY'
+        any_rule.conditions = [
+            {'field': 'subject', 'op': 'contains', 'value': 'Citação'},
+            {'field': 'subject', 'op': 'regex', 'value': r'\d{7}'},
+        ]
+
+        self.assertEqual(compile_rule_search([all_rule]), ['NOT', 'OR', 'NOT', 'FROM', 'tjsp', 'NOT', 'SUBJECT', 'Intima'])
+        self.assertIsNone(compile_rule_search([all_rule, any_rule]))
+
+        any_rule.conditions = [{'field': 'sender_domain', 'op': 'any_of', 'value': ['tjsp.jus.br', 'trt2.jus.br']}]
+        self.assertEqual(compile_rule_search([any_rule]), ['OR', 'FROM', 'tjsp.jus.br', 'FROM', 'trt2.jus.br'])
+
+    @mock.patch('tasks.tasks._ingest_uids')
+    def test_sync_fetches_only_candidates_and_advances_checkpoint(self, ingest):
+        """Só candidatos são baixados; os descartados também avançam o checkpoint."""
+        self.mailbox.imap_prefilter = True
+        self.mailbox.save()
+        AutomationRule.objects.create(user=self.user, mailbox=self.mailbox, name='A', subject_contains='Intimação')
+        state = MailBoxSyncState.objects.create(mailbox=self.mailbox, folder='INBOX', uid_validity=1, last_uid=10)
+        server = mock.Mock()
+        server.search.side_effect = [[11, 12, 13, 14], [12, 14]]
+        ingest.return_value = (2, [12, 14])
+
+        _sync_mailbox(server, self.mailbox, {'host': 'imap.test'}, state, {b'UIDVALIDITY': 1})
+
+        ingest.assert_called_once_with(server, self.mailbox, [12, 14], 'imap.test')
+        self.assertEqual(server.search.call_args_list[1].args[0], ['UID', '11:14', 'SUBJECT', 'Intima'])
+        state.refresh_from_db()
+        self.assertEqual(state.last_uid, 14)
+
+
+class FetchOrchestratorTests(MailBoxTestMixin, TestCase):
+    """
+    Testes do orquestrador de fetch concorrente (tasks.orchestrator).
+    """
+
+    def test_claims_only_due_mailboxes_once(self):
+        """Só caixas ativas e vencidas entram; uma segunda execução não pega as mesmas."""
+        MailBox.objects.filter(pk=self.mailbox.pk).update(next_fetch_at=timezone.now() - timedelta(minutes=1))
+        MailBox.objects.create(user=self.user, name='Recente', imap_host='imap.test', username='u', password='p',
+                               next_fetch_at=timezone.now() + timedelta(minutes=5))
+        MailBox.objects.create(user=self.user, name='Inativa', imap_host='imap.test', username='u', password='p',
+                               is_active=False)
+
+        self.assertEqual(_claim_due_mailboxes(), [(self.mailbox.id, 'imap.test')])
+        self.assertEqual(_claim_due_mailboxes(), [])
+
+    def test_respects_per_host_and_global_limits(self):
+        """Nunca mais conexões simultâneas por host do que o limite configurado."""
+        lock = threading.Lock()
+        active, peak = {}, {}
+
+        def fake_fetch(mailbox_id):
+            host = 'gmail' if mailbox_id % 2 else 'outlook'
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+            time.sleep(0.02)
+            with lock:
+                active[host] -= 1
+            return {'mailbox_id': mailbox_id, 'host': host, 'created': 1, 'seconds': 0.02, 'error': None}
+
+        targets = [(i, 'gmail' if i % 2 else 'outlook') for i in range(1, 21)]
+        limiter = HostLimiter(default_limit=3, limits={'gmail': 1})
+        with mock.patch('tasks.orchestrator.connection'):
+            reports = fetch_mailboxes_concurrently(targets, max_workers=8, limiter=limiter, fetch_func=fake_fetch)
+
+        self.assertEqual([r['mailbox_id'] for r in reports], list(range(1, 21)))
+        self.assertEqual(peak['gmail'], 1)
+        self.assertLessEqual(peak['outlook'], 3)
+        self.assertGreater(peak['outlook'], 1)
+
+    def test_unexpected_error_is_reported_per_mailbox(self):
+        """Uma exceção numa caixa vira `error` no relatório, sem derrubar as outras."""
+        def fake_fetch(mailbox_id):
+            if mailbox_id == 2:
+                raise RuntimeError('boom')
+            return {'mailbox_id': mailbox_id, 'host': 'h', 'created': 0, 'seconds': 0.0, 'error': None}
+
+        with mock.patch('tasks.orchestrator.connection'):
+            reports = fetch_mailboxes_concurrently([(1, 'h'), (2, 'h')], fetch_func=fake_fetch)
+
+        self.assertIsNone(reports[0]['error'])
+        self.assertEqual(reports[1]['error'], 'boom')
+
+
+class AdaptivePollingTests(MailBoxTestMixin, TestCase):
+    """
+    Testes do polling adaptativo e do backoff por falhas (tasks.scheduling).
+    """
+
+    def test_interval_follows_arrival_rate(self):
+        """Caixa movimentada acelera; caixa quieta recua aos poucos até o teto."""
+        self.assertEqual(next_poll_interval(300, created=5, received_in_window=500), 150)
+        self.assertEqual(next_poll_interval(172, created=0, received_in_window=500), 172)
+        self.assertEqual(next_poll_interval(300, created=0, received_in_window=0), 450)
+        self.assertEqual(next_poll_interval(3000, created=0, received_in_window=0), 3600)
+
+    def test_alerts_only_on_powers_of_two(self):
+        self.assertEqual([n for n in range(1, 20) if should_alert(n)], [1, 2, 4, 8, 16])
+
+    def test_failures_back_off_exponentially_and_reset(self):
+        """Falhas seguidas dobram a espera; um sucesso zera o contador."""
+        error = {'created': 0, 'error': 'IMAPClientError: LOGIN failed'}
+        now = timezone.now()
+        alerts = [record_fetch_result(self.mailbox.id, error, now=now) for _ in range(3)]
+
+        self.mailbox.refresh_from_db()
+        self.assertEqual(alerts, [True, True, False])
+        self.assertEqual(self.mailbox.consecutive_failures, 3)
+        self.assertEqual(self.mailbox.next_fetch_at, now + timedelta(seconds=300 * 8))
+
+        self.assertFalse(record_fetch_result(self.mailbox.id, {'created': 0, 'error': None}, now=now))
+        self.mailbox.refresh_from_db()
+        self.assertEqual(self.mailbox.consecutive_failures, 0)
+        self.assertEqual(self.mailbox.poll_interval_seconds, 450)
+
+    @mock.patch('tasks.tasks.notify_telegram')
+    @mock.patch('tasks.tasks._connect_mailbox')
+    def test_fetch_emails_skips_until_due_and_silences_repeated_errors(self, connect, notify):
+        """O Schedule fixo não conecta antes da hora e não repete o alerta a cada ciclo."""
+        connect.side_effect = imapclient.exceptions.LoginError('senha inválida')
+
+        fetch_emails(self.mailbox.id)
+        self.assertEqual(fetch_emails(self.mailbox.id), 0)  # em backoff: nem conecta
+        self.assertEqual(connect.call_count, 1)
+
+        fetch_emails(self.mailbox.id, force=True)
+        fetch_emails(self.mailbox.id, force=True)
+        self.assertEqual(connect.call_count, 3)
+        self.assertEqual(notify.call_count, 2)  # 1ª e 2ª falhas; a 3ª fica só no log
+
+
+class TwoPhaseFetchTests(TestCase):
+    """
+    Testes da escolha/decodificação da parte de texto (tasks.imap_fetch).
+    """
+
+    def test_prefers_plain_and_skips_attachments(self):
+        """Em multipart/mixed, escolhe o text/plain e nunca o anexo."""
+        structure = BodyData.create((
+            (
+                (b'TEXT', b'PLAIN', (b'CHARSET', b'iso-8859-1'), None, None, b'QUOTED-PRINTABLE', 120, 3),
+                (b'TEXT', b'HTML', (b'CHARSET', b'utf-8'), None, None, b'BASE64', 900, 12),
+                b'ALTERNATIVE',
+            ),
+            (b'APPLICATION', b'PDF', None, None, None, b'BASE64', 5_000_000, None, (b'ATTACHMENT', (b'FILENAME', b'a.pdf'))),
+            b'MIXED',
+        ))
+        part = pick_text_part(structure)
+
+        self.assertEqual(part['section'], '1.1')
+        self.assertEqual(part['charset'], 'iso-8859-1')
+        self.assertEqual(part['encoding'], 'quoted-printable')
+
+    def test_falls_back_to_html_for_html_only(self):
+        """Mensagem só com HTML devolve a parte text/html (seção 1)."""
+        structure = BodyData.create((b'TEXT', b'HTML', (b'CHARSET', b'utf-8'), None, None, b'7BIT', 40, 1))
+
+        self.assertEqual(pick_text_part(structure)['section'], '1')
+        self.assertEqual(pick_text_part(structure)['subtype'], 'html')
+
+    def test_split_by_budget_limits_count_and_bytes(self):
+        """Lotes respeitam quantidade e bytes; item maior que o orçamento vai sozinho."""
+        sizes = [400, 400, 300, 5000, 10, 10, 10]
+        batches = list(split_by_budget(sizes, lambda n: n, max_count=2, max_bytes=1000))
+
+        self.assertEqual(batches, [[400, 400], [300], [5000], [10, 10], [10]])
+
+    def test_iter_message_batches_fetches_bodies_per_budget(self):
+        """Cabeçalhos num FETCH só; corpos em um FETCH por lote do orçamento."""
+        part = BodyData.create((b'TEXT', b'PLAIN', (b'CHARSET', b'utf-8'), None, None, b'7BIT', 600, 1))
+        server = mock.Mock()
+        header_data = {uid: {b'BODYSTRUCTURE': part, b'RFC822.SIZE': 700} for uid in (1, 2, 3)}
+        server.fetch.side_effect = lambda uids, items: (
+            header_data if 'ENVELOPE' in items else {uid: {b'BODY[1]<0>': b'texto %d' % uid} for uid in uids}
+        )
+
+        batches = list(iter_message_batches(server, [1, 2, 3], batch_size=10, byte_budget=1000))
+
+        self.assertEqual([[s['uid'] for s, _t, _r in b] for b in batches], [[1], [2], [3]])
+        self.assertEqual(batches[2][0][1], 'texto 3')
+        self.assertEqual(server.fetch.call_count, 4)
+
+    def test_iter_message_batches_raw_mode_downloads_whole_message(self):
+        """No modo bruto o orçamento usa o RFC822.SIZE e o texto sai da mensagem inteira."""
+        part = BodyData.create((b'TEXT', b'PLAIN', (b'CHARSET', b'utf-8'), None, None, b'7BIT', 10, 1))
+        raw = b'Subject: x\r\nContent-Type: text/plain; charset=utf-8\r\n\r\nol\xc3\xa1 bruto'
+        server = mock.Mock()
+        header_data = {uid: {b'BODYSTRUCTURE': part, b'RFC822.SIZE': 600} for uid in (1, 2)}
+        server.fetch.side_effect = lambda uids, items: (
+            header_data if 'ENVELOPE' in items else {uid: {b'BODY[]': raw} for uid in uids}
+        )
+
+        batches = list(iter_message_batches(server, [1, 2], byte_budget=1000, raw=True))
+
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(batches[0][0][1:], ('olá bruto', raw))
+        self.assertEqual(server.fetch.call_args[0][1], ['BODY.PEEK[]'])
+
+    def test_decode_truncated_base64_and_bad_charset(self):
+        """Base64 cortado pelo limite de bytes e charset desconhecido não quebram a ingestão."""
+        raw = b'T2zDoSBtdW5kbw=='[:10]  # truncado no meio de um quantum
+        self.assertEqual(decode_part(raw, 'base64', 'x-charset-invalido'), 'Olá m')
+
+
+class BodyNormalizationTests(TestCase):
+    """
+    Testes da normalização HTML -> texto (tasks.normalize).
+    """
+
+    HTML = (
+        '<html><head><style>td{color:red}</style></head><body>'
+        '<div style="display:none;max-height:0">preheader oculto</div>'
+        '<p>Fica Vossa&nbsp;Senhoria <b>intimado</b>.</p><script>track()</script>'
+        '<table><tr><th>Item</th><th>Valor</th></tr>'
+        '<tr><td>Custas</td><td>R$ 10,00</td></tr><tr><td>Honorários</td><td>R$ 999,00</td></tr></table>'
+        '<img src="https://t.example/pixel.gif" width="1"></body></html>'
+    )
+
+    def test_drops_markup_scripts_and_hidden_elements(self):
+        text = html_to_text(self.HTML)
+
+        self.assertTrue(text.startswith('Fica Vossa Senhoria intimado.'))
+        for noise in ('<', 'color:red', 'track()', 'preheader', 'pixel.gif'):
+            self.assertNotIn(noise, text)
+
+    def test_tables_become_aligned_columns(self):
+        lines = html_to_text(self.HTML).splitlines()[-3:]
+
+        self.assertEqual(lines, [
+            'Item        Valor',
+            'Custas      R$ 10,00',
+            'Honorários  R$ 999,00',
+        ])
+
+    def test_layout_tables_become_paragraphs(self):
+        html = '<table width="600"><tr><td><p>Intimação</p><p>Prazo: 15 dias</p></td></tr></table>'
+
+        self.assertEqual(html_to_text(html), 'Intimação\n\nPrazo: 15 dias')
+
+    def test_unclosed_hidden_paragraph_ends_at_next_block(self):
+        """Preheader oculto sem </p> não engole o resto do documento."""
+        html = '<body><p style="display:none">preheader<p>Intimação</p><p>Prazo: 15 dias</body>'
+
+        self.assertEqual(html_to_text(html), 'Intimação\n\nPrazo: 15 dias')
+
+    def test_empty_conversion_falls_back_to_stripped_tags(self):
+        html = '<span hidden>Intimação &amp; prazo: 15 dias'
+
+        self.assertEqual(html_to_text(html), 'Intimação & prazo: 15 dias')
+
+    def test_normalize_body_detects_html_and_keeps_plain_text(self):
+        self.assertEqual(normalize_body('Texto <simples> & puro', 'plain'), 'Texto <simples> & puro')
+        self.assertEqual(normalize_body('<div>ERP mandou <br>HTML</div>', 'plain'), 'ERP mandou\nHTML')
+
+    def test_plain_text_mentioning_tags_keeps_line_breaks(self):
+        text = 'Prezados,\n\nO campo <p> do formulário e o <div id="x"> não salvam.\n\nAtt,\nSuporte'
+        self.assertEqual(normalize_body(text, 'plain'), text)
+
+    def test_results_are_cached_by_content(self):
+        with mock.patch('tasks.normalize.html_to_text', return_value='texto') as convert:
+            normalize_body('<p>cache único</p>', 'html')
+            normalize_body('<p>cache único</p>', 'html')
+
+        convert.assert_called_once()
+
+
+class BodyReductionTests(MailBoxTestMixin, TestCase):
+    """
+    Testes da redução do corpo antes da IA (tasks.reduce).
+    """
+
+    FOOTER = (
+        'Este e-mail é gerado automaticamente, não responda.\n'
+        'Tribunal de Justiça do Estado de São Paulo - Praça da Sé, s/n'
+    )
+
+    def setUp(self):
+        super().setUp()
+        footer_cache = mock.patch.dict('tasks.reduce._footer_cache', clear=True)
+        footer_cache.start()
+        self.addCleanup(footer_cache.stop)
+
+    def test_strips_quoted_reply_history(self):
+        text = (
+            'Segue o comprovante.\n\n'
+            'Em seg., 6 de out. de 2025 às 10:00, Cliente <c@x.com> escreveu:\n'
+            '> Pode enviar o comprovante?\n> Obrigado'
+        )
+        self.assertEqual(reduce_text(text), 'Segue o comprovante.')
+
+    def test_strips_outlook_block_and_signature(self):
+        text = (
+            'Confirmo a audiência.\n-- \nDr. Fulano\nOAB 123\n'
+            '________________________________\n'
+            'De: Vara Cível <vara@tjsp.jus.br>\nEnviado: segunda-feira\nAssunto: Audiência\n\nTexto antigo'
+        )
+        self.assertEqual(reduce_text(text), 'Confirmo a audiência.')
+
+    def test_keeps_outlook_forwarded_message(self):
+        """Encaminhamento do Outlook (Assunto: ENC:) não é confundido com histórico de resposta."""
+        text = (
+            'Segue intimação abaixo.\n\n'
+            '________________________________\n'
+            'De: Vara Cível <vara@tjsp.jus.br>\nEnviado: segunda-feira\n'
+            'Para: Escritório <contato@escritorio.com>\nAssunto: ENC: Intimação processo 9\n\n'
+            'Fica intimado para manifestação no prazo de 15 dias.'
+        )
+        self.assertEqual(reduce_text(text), text)
+
+    def test_keeps_forwarded_message_marker(self):
+        text = (
+            'Para cadastro.\n\n---------- Mensagem encaminhada ---------\n'
+            'De: Vara <vara@tjsp.jus.br>\nEnviado: segunda-feira\nAssunto: Intimação\n\nPrazo de 15 dias.'
+        )
+        self.assertEqual(reduce_text(text), text)
+
+    def test_signature_above_forward_keeps_forwarded_notice(self):
+        """Assinatura de quem encaminhou sai; a intimação encaminhada abaixo dela fica."""
+        text = (
+            'Segue a intimação abaixo.\n\nAtt,\nJoão\nEnviado do meu iPhone\n\n'
+            '---------- Forwarded message ---------\nDe: TJSP <intimacoes@tjsp.jus.br>\n'
+            'Subject: Intimação\n\nFica V.Sa. intimada, prazo fatal 15 dias.'
+        )
+        self.assertEqual(reduce_text(text), (
+            'Segue a intimação abaixo.\n\nAtt,\nJoão\n\n'
+            '---------- Forwarded message ---------\nDe: TJSP <intimacoes@tjsp.jus.br>\n'
+            'Subject: Intimação\n\nFica V.Sa. intimada, prazo fatal 15 dias.'
+        ))
+
+    def test_signature_above_outlook_forward_keeps_forwarded_notice(self):
+        forwarded = (
+            '________________________________\n'
+            'De: Vara Cível <vara@tjsp.jus.br>\nEnviado: segunda-feira\nAssunto: ENC: Intimação\n\nPrazo 15 dias.'
+        )
+        self.assertEqual(reduce_text('Segue.\n--\nJoão\n' + forwarded), 'Segue.\n' + forwarded)
+
+    def test_keeps_content_that_only_looks_like_headers(self):
+        text = 'De: 10/10/2025\nData: 20/10/2025\nPrazo de 15 dias.'
+        self.assertEqual(reduce_text(text), text)
+
+    @mock.patch('tasks.tasks.notify_telegram')
+    @mock.patch('tasks.tasks.extract_fields_from_text', return_value=None)
+    def test_learns_domain_footer_and_records_savings(self, extract, _notify):
+        """Rodapé repetido nos emails anteriores do domínio não vai para a IA; economia fica gravada."""
+        profile = ExtractionProfile.objects.create(
+            user=self.user, name='Jurídico', system_prompt_template='Hoje é {data_atual}.',
+            pydantic_schema_name='ProcessoJuridicoSchema',
+        )
+        AutomationRule.objects.create(
+            user=self.user, mailbox=self.mailbox, name='Intimações', extraction_profile=profile,
+        )
+        for i in range(3):
+            EmailMessage.objects.create(
+                mailbox=self.mailbox, message_id=f'<old{i}@x>', subject='Intimação', sender='push@tjsp.jus.br',
+                received_at=timezone.now(), body_text=f'Processo {i}: despacho publicado.\n\n{self.FOOTER}',
+            )
+        email = EmailMessage.objects.create(
+            mailbox=self.mailbox, message_id='<new@x>', subject='Intimação', sender='TJSP <push@tjsp.jus.br>',
+            received_at=timezone.now(), body_text=f'Processo 9: prazo de 15 dias.\n\n{self.FOOTER}',
+        )
+
+        process_email_batch([email.id])
+
+        self.assertEqual(extract.call_args.kwargs['text'], 'Processo 9: prazo de 15 dias.')
+        email.refresh_from_db()
+        self.assertEqual(email.body_reduced, 'Processo 9: prazo de 15 dias.')
+        self.assertEqual(email.body_bytes_saved, len((email.body_text[len(email.body_reduced):]).encode()))
+
+
+class IdleListenerTests(MailBoxTestMixin, TestCase):
+    """
+    Testes do listener IMAP IDLE (tasks.idle).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.worker = MailBoxIdleWorker(self.mailbox.id, threading.Event())
+        self.worker.server = mock.Mock()
+
+    def test_wait_for_exists_detects_notification(self):
+        """Um EXISTS recebido durante o IDLE acorda o listener."""
+        self.worker.server.idle_check.return_value = [(3, b'EXISTS')]
+        self.worker.server.idle_done.return_value = (b'Idle terminated', [])
+
+        self.assertTrue(self.worker._wait_for_exists())
+        self.worker.server.idle.assert_called_once()
+        self.worker.server.idle_done.assert_called_once()
+
+    def test_wait_for_exists_ignores_other_responses(self):
+        """Respostas sem EXISTS (ex: FETCH de flags) não disparam ingestão."""
+        self.worker.stop_event.set()
+        self.worker.server.idle_done.return_value = (b'Idle terminated', [(1, b'FETCH', (b'FLAGS', ()))])
+
+        self.assertFalse(self.worker._wait_for_exists())
+
+
+class IngestionBenchmarkTests(TestCase):
+    """
+    Testes do benchmark de ingestão (servidor IMAP falso + corpus sintético).
+    """
+
+    def test_corpus_is_deterministic_and_covers_all_kinds(self):
+        corpus = generate_corpus(40, seed=7, attachment_bytes=2048, large_bytes=4096)
+
+        self.assertEqual(corpus, generate_corpus(40, seed=7, attachment_bytes=2048, large_bytes=4096))
+        self.assertEqual({kind for kind, _raw in corpus}, {'plain', 'html', 'attachment', 'badcharset', 'large'})
+
+    @mock.patch('tasks.tasks.notify_telegram')
+    def test_end_to_end_against_fake_server(self, notify):
+        """fetch_emails ingere o corpus inteiro, sem anexos, e o fetch sem novidades não baixa nada."""
+        report = run_benchmark(messages=30, delta=5, seed=3, attachment_bytes=256 * 1024, large_bytes=16 * 1024)
+        cold, noop, delta = report['results']
 
-# Create your tests here.
+        self.assertEqual((cold['messages'], noop['messages'], delta['messages']), (30, 0, 5))
+        self.assertLess(cold['imap_bytes'], report['corpus']['bytes'] / 4)
+        self.assertEqual(noop['imap_bytes'], 0)
+        self.assertLess(cold['queries_per_msg'], 1)
+        notify.assert_not_called()